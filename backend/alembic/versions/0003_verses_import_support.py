@@ -0,0 +1,64 @@
+"""unique verse refs, generated text_tsv, etl checkpoints"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003_verses_import_support"
+down_revision = "0002_add_quotas_table"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Earlier imports could insert the same reference twice; keep the oldest row.
+    op.execute(
+        """
+        WITH dups AS (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY translation, book, chapter, verse ORDER BY id
+                ) AS rn
+                FROM verses
+            ) ranked
+            WHERE rn > 1
+        ), dropped_embeddings AS (
+            DELETE FROM verse_embeddings WHERE verse_id IN (SELECT id FROM dups)
+        )
+        DELETE FROM verses WHERE id IN (SELECT id FROM dups);
+        """
+    )
+    op.drop_index("idx_verses_ref", table_name="verses")
+    op.create_index("uq_verses_ref", "verses", ["translation", "book", "chapter", "verse"], unique=True)
+
+    op.execute(
+        """
+        DROP INDEX IF EXISTS verses_tsv_idx;
+        ALTER TABLE verses DROP COLUMN text_tsv;
+        ALTER TABLE verses ADD COLUMN text_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', text)) STORED;
+        CREATE INDEX verses_tsv_idx ON verses USING GIN (text_tsv);
+        """
+    )
+
+    op.create_table(
+        "etl_checkpoints",
+        sa.Column("job", sa.String(), primary_key=True),
+        sa.Column("position", sa.BigInteger(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+
+
+def downgrade():
+    op.drop_table("etl_checkpoints")
+    op.execute(
+        """
+        DROP INDEX IF EXISTS verses_tsv_idx;
+        ALTER TABLE verses DROP COLUMN text_tsv;
+        ALTER TABLE verses ADD COLUMN text_tsv tsvector;
+        UPDATE verses SET text_tsv = to_tsvector('english', text);
+        CREATE INDEX verses_tsv_idx ON verses USING GIN (text_tsv);
+        """
+    )
+    op.drop_index("uq_verses_ref", table_name="verses")
+    op.create_index("idx_verses_ref", "verses", ["translation", "book", "chapter", "verse"])
@@ -0,0 +1,27 @@
+"""daily verse pool"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_daily_verse_pool"
+down_revision = "0003_verses_import_support"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "daily_verse_pool",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("translation", sa.String(), nullable=False),
+        sa.Column("book", sa.Integer(), nullable=False),
+        sa.Column("chapter", sa.Integer(), nullable=False),
+        sa.Column("verse", sa.Integer(), nullable=False),
+        sa.Column("weight", sa.Float(), nullable=False, server_default=sa.text("1.0")),
+        sa.UniqueConstraint("translation", "book", "chapter", "verse", name="uq_daily_verse_pool_ref"),
+    )
+
+
+def downgrade():
+    op.drop_table("daily_verse_pool")
@@ -0,0 +1,46 @@
+"""reading plans and plan progress"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0005_reading_plans"
+down_revision = "0004_daily_verse_pool"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "reading_plans",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("key", sa.String(), nullable=False, unique=True),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("days", sa.Integer(), nullable=False),
+        sa.Column("lang", sa.String(), nullable=False, server_default="en"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+    op.create_table(
+        "plan_days",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("plan_id", sa.String(), sa.ForeignKey("reading_plans.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("day_number", sa.Integer(), nullable=False),
+        sa.Column("refs", postgresql.JSONB(), nullable=False),
+        sa.UniqueConstraint("plan_id", "day_number", name="uq_plan_days_day"),
+    )
+    # Written in batches by the progress flusher; the primary key makes replays idempotent.
+    op.create_table(
+        "plan_progress",
+        sa.Column("user_id", sa.String(), primary_key=True),
+        sa.Column("plan_id", sa.String(), sa.ForeignKey("reading_plans.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("day_number", sa.Integer(), primary_key=True),
+        sa.Column("completed_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+
+
+def downgrade():
+    op.drop_table("plan_progress")
+    op.drop_table("plan_days")
+    op.drop_table("reading_plans")
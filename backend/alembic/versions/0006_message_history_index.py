@@ -0,0 +1,20 @@
+"""indexes for conversation history reads"""
+
+from alembic import op
+
+
+revision = "0006_message_history_index"
+down_revision = "0005_reading_plans"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # History reads take the newest messages of one conversation.
+    op.create_index("idx_messages_conversation_created", "messages", ["conversation_id", "created_at"])
+    op.create_index("idx_conversations_user", "conversations", ["user_id"])
+
+
+def downgrade():
+    op.drop_index("idx_conversations_user", table_name="conversations")
+    op.drop_index("idx_messages_conversation_created", table_name="messages")
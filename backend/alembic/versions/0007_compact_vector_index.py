@@ -0,0 +1,45 @@
+"""compact verse_embeddings: halfvec storage, cosine HNSW with explicit build params
+
+Reads the same settings as app/services/vector_index.py:
+EMBED_DIM, VECTOR_INDEX_TYPE (halfvec | vector), VECTOR_HNSW_M, VECTOR_HNSW_EF_CONSTRUCTION.
+halfvec needs pgvector >= 0.7 (the pgvector/pgvector:pg16 image has it).
+When EMBED_DIM differs from the stored dimension the existing embeddings cannot
+be converted and are deleted; re-run scripts/etl/embed_verses.py afterwards.
+"""
+
+import os
+
+from alembic import op
+
+
+revision = "0007_compact_vector_index"
+down_revision = "0006_message_history_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dim = int(os.getenv("EMBED_DIM", "1536"))
+    kind = os.getenv("VECTOR_INDEX_TYPE", "halfvec")
+    m = int(os.getenv("VECTOR_HNSW_M", "16"))
+    ef_construction = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+    if kind not in ("halfvec", "vector"):
+        raise ValueError(f"VECTOR_INDEX_TYPE must be halfvec or vector, not {kind!r}")
+
+    op.execute("DROP INDEX IF EXISTS verse_embed_hnsw")
+    if dim != 1536:
+        op.execute("DELETE FROM verse_embeddings")
+    op.execute(f"ALTER TABLE verse_embeddings ALTER COLUMN embedding TYPE {kind}({dim}) USING embedding::{kind}({dim})")
+    op.execute("SET LOCAL maintenance_work_mem = '512MB'")
+    op.execute(
+        f"CREATE INDEX verse_embed_hnsw ON verse_embeddings USING hnsw (embedding {kind}_cosine_ops) "
+        f"WITH (m = {m}, ef_construction = {ef_construction})"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS verse_embed_hnsw")
+    if int(os.getenv("EMBED_DIM", "1536")) != 1536:
+        op.execute("DELETE FROM verse_embeddings")
+    op.execute("ALTER TABLE verse_embeddings ALTER COLUMN embedding TYPE vector(1536) USING embedding::vector(1536)")
+    op.execute("CREATE INDEX verse_embed_hnsw ON verse_embeddings USING hnsw (embedding vector_l2_ops)")
@@ -0,0 +1,40 @@
+"""one account per App Store transaction
+
+/iap/verify refuses an original transaction that another user already holds;
+the unique index closes the race between two concurrent claims. Accounts that
+replayed someone else's transaction before this check existed keep nothing:
+the earliest claimant keeps it, later ones are set to revoked.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0008_subscription_tx_owner"
+down_revision = "0007_compact_vector_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        UPDATE subscriptions s SET status = 'revoked', original_tx_id = NULL, updated_at = now()
+        FROM (
+            SELECT user_id, row_number() OVER (PARTITION BY original_tx_id ORDER BY updated_at, user_id) AS n
+            FROM subscriptions WHERE original_tx_id IS NOT NULL
+        ) d
+        WHERE s.user_id = d.user_id AND d.n > 1
+        """
+    )
+    op.create_index(
+        "uq_subscriptions_original_tx",
+        "subscriptions",
+        ["original_tx_id"],
+        unique=True,
+        postgresql_where=sa.text("original_tx_id IS NOT NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("uq_subscriptions_original_tx", table_name="subscriptions")
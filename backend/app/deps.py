@@ -1,20 +1,105 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
-import redis
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import redis.asyncio
+
+from . import metrics
+from .metrics import DB_POOL_WAIT, DB_QUERY, REDIS_COMMAND
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg://postgres:postgres@db:5432/holly")
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "5"))
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Every worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so
+# workers * (size + overflow) must stay below Postgres max_connections.
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT_S,
+    pool_recycle=DB_POOL_RECYCLE_S,
+    pool_pre_ping=True,
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
 
-@contextmanager
-def db_session():
-    session = SessionLocal()
-    try:
+
+def _observe_redis(command: str, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    REDIS_COMMAND.observe(elapsed, command)
+    metrics.record("redis", elapsed)
+
+
+class _TimedPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            _observe_redis("PIPELINE", started)
+
+
+class _TimedRedis(redis.asyncio.Redis):
+    # Times every round trip; a pipeline counts as one PIPELINE call.
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _observe_redis(str(args[0]).upper(), started)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> _TimedPipeline:
+        return _TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+redis_async = _TimedRedis.from_url(REDIS_URL, decode_responses=True)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        DB_QUERY.observe(time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def db_session() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as session:
+        # Check the connection out up front so pool wait is measured on its own.
+        started = time.perf_counter()
+        await session.connection()
+        waited = time.perf_counter() - started
+        DB_POOL_WAIT.observe(waited)
+        metrics.record("db_wait", waited)
         yield session
-    finally:
-        session.close()
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    async with db_session() as session:
+        yield session
+
+
+def pool_status() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "wait": DB_POOL_WAIT.snapshot(),
+        "query": DB_QUERY.snapshot(),
+    }
@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+
+_COMPRESSIBLE = ("application/json", "text/plain", "text/html")
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    # Default response class: orjson when installed. FastAPI has already run
+    # jsonable_encoder, so both encoders see plain JSON types.
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def etag_for(*parts: Any) -> str:
+    digest = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def body_etag(body: bytes) -> str:
+    # Strong ETag over exactly these bytes.
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def render(payload: Any) -> Tuple[bytes, str]:
+    body = dumps(payload)
+    return body, body_etag(body)
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag in tags or "*" in tags
+
+
+def cached_response(
+    request: Request,
+    rendered: Tuple[bytes, str],
+    max_age: int,
+    private: bool = False,
+) -> Response:
+    body, etag = rendered
+    headers = {"ETag": etag, "Cache-Control": f"{'private' if private else 'public'}, max-age={max_age}"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def not_modified_response(request: Request, etag: str, max_age: int, private: bool = False) -> Optional[Response]:
+    # For payloads whose ETag is known from the request alone: answers a
+    # matching If-None-Match before any data is read.
+    if not not_modified(request, etag):
+        return None
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": f"{'private' if private else 'public'}, max-age={max_age}"},
+    )
+
+
+def _pick_encoding(accept: str) -> Optional[str]:
+    offered = {}
+    for item in accept.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _strip_etag_suffix(value: bytes) -> bytes:
+    return value.replace(b'-br"', b'"').replace(b'-gzip"', b'"')
+
+
+def _held_encoding(held: bytes, etag: Optional[str], preferred: str) -> Optional[str]:
+    # Encoding suffix of the tag the client revalidated with, if it holds a
+    # compressed copy; None when it cached the uncompressed body.
+    if not etag or not etag.endswith('"'):
+        return None
+    for encoding in (preferred, "br", "gzip"):
+        if f'{etag[:-1]}-{encoding}"'.encode("latin-1") in held:
+            return encoding
+    return None
+
+
+def _suffix_etag(headers: MutableHeaders, encoding: str) -> None:
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag and etag.endswith('"'):
+        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+
+
+class CompressionMiddleware:
+    # Pure ASGI, like metrics.TimingMiddleware. Compresses complete JSON/text
+    # bodies of at least HTTP_COMPRESS_MIN_BYTES with brotli (when installed
+    # and accepted) or gzip. Streaming responses (SSE) pass through untouched.
+    # A compressed representation gets its own strong ETag ("<tag>-br"), and
+    # the suffix is stripped from If-None-Match so handlers only see their own tags.
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = scope["headers"]
+        held = b",".join(v for k, v in headers if k == b"if-none-match")
+        if held:
+            # In place: routing sets scope["route"] on this same dict, and
+            # TimingMiddleware outside us labels the request with it.
+            headers = [(k, _strip_etag_suffix(v) if k == b"if-none-match" else v) for k, v in headers]
+            scope["headers"] = headers
+        accept = b",".join(v for k, v in headers if k == b"accept-encoding").decode("latin-1")
+        encoding = _pick_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            response_headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            content_type = response_headers.get("content-type", "")
+            if start["status"] == 304:
+                # Revalidated: answer with the tag the client holds, suffixed
+                # only if what it cached was compressed.
+                response_headers.add_vary_header("Accept-Encoding")
+                held_encoding = _held_encoding(held, response_headers.get("etag"), encoding)
+                if held_encoding is not None:
+                    _suffix_etag(response_headers, held_encoding)
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            if (
+                message.get("more_body")
+                or len(body) < HTTP_COMPRESS_MIN_BYTES
+                or "content-encoding" in response_headers
+                or not content_type.startswith(_COMPRESSIBLE)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            if encoding == "br":
+                body = brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+            response_headers["Content-Encoding"] = encoding
+            response_headers["Content-Length"] = str(len(body))
+            _suffix_etag(response_headers, encoding)
+            await send(start)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
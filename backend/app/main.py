@@ -1,11 +1,48 @@
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from redis.exceptions import RedisError
 from .routers import chat, verses, plans, iap
+from . import http_cache, metrics
+from .deps import engine, pool_status, redis_async
+from .services import answer_cache, background, breaker, conversations, daily_verse, entitlements, governor, llm, plans as plan_service, quota, singleflight, storekit
 
-app = FastAPI(title="HollyProject API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    storekit.load_trust_roots()
+    llm.init_client()
+    background.run_periodic("quota_flush", quota.QUOTA_FLUSH_INTERVAL_S, quota.flush)
+    background.run_periodic("conversation_flush", conversations.CONVERSATION_FLUSH_INTERVAL_S, conversations.flush)
+    background.run_periodic("plan_progress_flush", plan_service.PLAN_PROGRESS_FLUSH_INTERVAL_S, plan_service.flush)
+    background.run_forever("entitlement_listener", entitlements.listen)
+    background.run_periodic(
+        "daily_verse_precompute",
+        daily_verse.DAILY_VERSE_PRECOMPUTE_INTERVAL_S,
+        daily_verse.precompute_upcoming,
+        immediate=True,
+        run_on_shutdown=False,
+    )
+    try:
+        yield
+    finally:
+        await background.shutdown()
+        await llm.close_client()
+        await redis_async.aclose()
+        await engine.dispose()
+
+app = FastAPI(
+    title="HollyProject API",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=http_cache.FastJSONResponse,
+)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(http_cache.CompressionMiddleware)
+app.add_middleware(metrics.TimingMiddleware)
 
 @app.get("/healthz")
 async def healthz():
@@ -14,7 +51,29 @@ async def healthz():
 
 @app.get("/v1/healthz")
 async def healthz_v1():
-    return {"ok": True, "llm": bool(os.getenv("OPENAI_API_KEY"))}
+    try:
+        budget = await governor.stats()
+        circuit = await breaker.state()
+    except RedisError:
+        budget = circuit = None
+    return {
+        "ok": True,
+        "llm": bool(os.getenv("OPENAI_API_KEY")),
+        "answer_cache": answer_cache.stats(),
+        "llm_budget": budget,
+        "llm_circuit": circuit,
+        "singleflight": singleflight.stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/v1/healthz/db")
+async def healthz_db():
+    return {"ok": True, "pool": pool_status()}
 
 app.include_router(chat.router, prefix="/v1", tags=["chat"])
 app.include_router(verses.router, prefix="/v1", tags=["verses"])
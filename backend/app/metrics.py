@@ -0,0 +1,270 @@
+import bisect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_TRACE_SAMPLE_RATE = float(os.getenv("METRICS_TRACE_SAMPLE_RATE", "0"))
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "1") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0)
+
+_REGISTRY: List["Histogram | Family | Counter"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    # Fixed-bucket latency histogram (seconds). Cheap enough for the hot path:
+    # one bisect and three additions under an uncontended lock.
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        labels: Tuple[Tuple[str, str], ...] = (),
+        register: bool = True,
+    ) -> None:
+        self.name = name
+        self.labels = labels
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+        if register:
+            _REGISTRY.append(self)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def _quantile(self, counts, q: float) -> float:
+        target = q * self._count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        if not count:
+            return {"count": 0, "sum": 0.0}
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "p50_le": self._quantile(counts, 0.50),
+            "p95_le": self._quantile(counts, 0.95),
+            "p99_le": self._quantile(counts, 0.99),
+        }
+
+
+    def render_samples(self) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = _label_str(self.labels, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        le = _label_str(self.labels, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{le} {count}")
+        lines.append(f"{self.name}_sum{_label_str(self.labels)} {total}")
+        lines.append(f"{self.name}_count{_label_str(self.labels)} {count}")
+        return lines
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram", *self.render_samples()]
+
+
+class Family:
+    # Histograms sharing a name, one per label-value combination
+    # (e.g. stage="retrieval"). Children are created on first use.
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], Histogram] = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def labels(self, *values: str) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = Histogram(
+                        self.name, self.description, self.buckets, tuple(zip(self.labelnames, values)), register=False
+                    )
+                    self._children[values] = child
+        return child
+
+    def observe(self, value: float, *values: str) -> None:
+        self.labels(*values).observe(value)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {"/".join(key): child.snapshot() for key, child in list(self._children.items())}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for child in list(self._children.values()):
+            lines.extend(child.render_samples())
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, amount: float = 1.0, *values: str) -> None:
+        with self._lock:
+            self._values[values] = self._values.get(values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            lines.append(f"{self.name}{_label_str(tuple(zip(self.labelnames, values)))} {value}")
+        return lines
+
+
+def render_prometheus() -> str:
+    # Prometheus text exposition format 0.0.4. Values are per worker process;
+    # scrape every worker, or run one worker per container.
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled database connection")
+DB_QUERY = Histogram("db_query_seconds", "Database statement execution time")
+REDIS_COMMAND = Family("redis_command_seconds", "Redis round trip time by command", ["command"], FAST_BUCKETS)
+HTTP_REQUEST = Family("http_request_seconds", "Request time until the response is complete", ["method", "route", "status"])
+STAGE = Family("request_stage_seconds", "Time spent in one stage of a request", ["stage"])
+LLM_REQUEST = Family("llm_request_seconds", "OpenAI completion latency by model", ["model", "mode"], LLM_BUCKETS)
+LLM_FIRST_TOKEN = Family("llm_first_token_seconds", "Time to the first streamed token by model", ["model"], LLM_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens_total", "OpenAI tokens by model and kind", ["model", "kind"])
+
+
+# Per-request stage timings, set by TimingMiddleware. Outside a request (background
+# jobs, scripts) stages still feed the histograms but nothing is collected.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    STAGE.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class stage:
+    # with metrics.stage("quota"): ...   (also fine around awaits)
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "stage":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        record(self.name, time.perf_counter() - self.started)
+
+
+def _server_timing(timings: Dict[str, float], total: float) -> bytes:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class TimingMiddleware:
+    # Pure ASGI so streaming responses pass straight through. Adds Server-Timing
+    # with the stages finished before the response headers (for SSE that is
+    # everything up to the first byte), observes http_request_seconds when the
+    # body is complete, and logs a TRACE line for a METRICS_TRACE_SAMPLE_RATE
+    # sample of requests. Unsampled requests cost a dict and a few perf_counter calls.
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if METRICS_SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(timings, time.perf_counter() - started)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST.observe(elapsed, scope["method"], path, str(status))
+            if METRICS_TRACE_SAMPLE_RATE and random.random() < METRICS_TRACE_SAMPLE_RATE:
+                logger.info(
+                    "TRACE %s",
+                    json.dumps(
+                        {
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "route": path,
+                            "status": status,
+                            "ms": round(elapsed * 1000, 1),
+                            "stages_ms": {k: round(v * 1000, 1) for k, v in timings.items()},
+                        }
+                    ),
+                )
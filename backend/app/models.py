@@ -1,6 +1,9 @@
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column
-from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, Date, func
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, Date, Float, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB
+from pgvector.sqlalchemy import HALFVEC, Vector
+
+from .vector_config import EMBED_DIM, VECTOR_INDEX_TYPE
 
 Base = declarative_base()
 
@@ -46,6 +49,7 @@ class Message(Base):
 
 class Verse(Base):
     __tablename__ = "verses"
+    __table_args__ = (UniqueConstraint("translation", "book", "chapter", "verse", name="uq_verses_ref"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     translation: Mapped[str] = mapped_column(String, index=True)
     book: Mapped[int] = mapped_column(Integer, index=True)
@@ -56,4 +60,40 @@ class Verse(Base):
 class VerseEmbedding(Base):
     __tablename__ = "verse_embeddings"
     verse_id: Mapped[int] = mapped_column(Integer, ForeignKey("verses.id"), primary_key=True)
-    embedding = mapped_column(Vector(1536), nullable=False)
+    embedding = mapped_column(HALFVEC(EMBED_DIM) if VECTOR_INDEX_TYPE == "halfvec" else Vector(EMBED_DIM), nullable=False)
+
+class DailyVersePool(Base):
+    __tablename__ = "daily_verse_pool"
+    __table_args__ = (UniqueConstraint("translation", "book", "chapter", "verse", name="uq_daily_verse_pool_ref"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    translation: Mapped[str] = mapped_column(String)
+    book: Mapped[int] = mapped_column(Integer)
+    chapter: Mapped[int] = mapped_column(Integer)
+    verse: Mapped[int] = mapped_column(Integer)
+    weight: Mapped[float] = mapped_column(Float, default=1.0)
+
+
+class ReadingPlan(Base):
+    __tablename__ = "reading_plans"
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    key: Mapped[str] = mapped_column(String, unique=True)
+    title: Mapped[str] = mapped_column(String)
+    description: Mapped[str | None] = mapped_column(Text, nullable=True)
+    days: Mapped[int] = mapped_column(Integer)
+    lang: Mapped[str] = mapped_column(String, default="en")
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class PlanDay(Base):
+    __tablename__ = "plan_days"
+    __table_args__ = (UniqueConstraint("plan_id", "day_number", name="uq_plan_days_day"),)
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    plan_id: Mapped[str] = mapped_column(String, ForeignKey("reading_plans.id", ondelete="CASCADE"))
+    day_number: Mapped[int] = mapped_column(Integer)
+    refs = mapped_column(JSONB, nullable=False)
+
+class PlanProgress(Base):
+    __tablename__ = "plan_progress"
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    plan_id: Mapped[str] = mapped_column(String, ForeignKey("reading_plans.id", ondelete="CASCADE"), primary_key=True)
+    day_number: Mapped[int] = mapped_column(Integer, primary_key=True)
+    completed_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
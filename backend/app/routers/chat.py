@@ -1,63 +1,148 @@
+import json
+import logging
 import uuid
-from datetime import date, datetime, timezone
+from datetime import date
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
-from ..deps import db_session
-from ..models import Quota, Subscription
+from .. import metrics
 from ..schemas import ChatRequest, ChatResponse, Citation
-from ..services import retrieval, llm
+from ..services import answer_cache, conversations, entitlements, quota, retrieval, llm, singleflight
 
 router = APIRouter()
-FREE_LIMIT = 4
+logger = logging.getLogger(__name__)
 
 
-def _is_active_subscription(subscription: Subscription | None) -> bool:
-    if subscription is None or subscription.status != "active":
+async def _reserve_message(user_id: str, today: date) -> bool:
+    # Returns True when a free-tier message was reserved and must be refunded
+    # if the request fails; subscribers are never counted.
+    with metrics.stage("entitlement"):
+        entitlement = await entitlements.lookup(user_id)
+    if entitlements.is_active(entitlement):
         return False
+    with metrics.stage("quota"):
+        return await quota.consume(user_id, today)
 
-    expires_at = subscription.expires_at
-    if expires_at is None:
-        return True
 
-    if getattr(expires_at, "tzinfo", None) is None:
-        expires_at = expires_at.replace(tzinfo=timezone.utc)
+async def _history(req: ChatRequest) -> list:
+    # Follow-ups get the trimmed tail of their conversation; a history read
+    # failure degrades to a single-turn answer.
+    if not req.conversation_id:
+        return []
+    try:
+        with metrics.stage("history"):
+            return await conversations.history(req.user_id, req.conversation_id)
+    except Exception:
+        logger.warning("HISTORY_UNAVAILABLE", exc_info=True)
+        return []
 
-    return expires_at > datetime.now(timezone.utc)
 
+async def _answer_and_cache(message: str, translation: str, embedding) -> tuple:
+    passages = await retrieval.retrieve(message, translation=translation, embedding=embedding)
+    answer_text, citations = await llm.answer(message, passages)
+    if not llm.is_offline_reply(answer_text):
+        with metrics.stage("cache_store"):
+            await answer_cache.store(message, translation, answer_text, citations, embedding)
+    return answer_text, citations
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    today = date.today()
-    subscription_active = False
 
-    with db_session() as session:
-        subscription = session.get(Subscription, req.user_id)
-        subscription_active = _is_active_subscription(subscription)
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        if not subscription_active:
-            quota = session.get(Quota, (req.user_id, today))
-            messages_used = quota.messages_used if quota else 0
-            if messages_used >= FREE_LIMIT:
-                raise HTTPException(status_code=402, detail={"paywall": True, "limit": FREE_LIMIT})
 
-    passages = await retrieval.retrieve(req.message, translation=req.translation)
-    answer_text, citations = await llm.answer(req.message, passages)
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    today = date.today()
+    reserved = await _reserve_message(req.user_id, today)
     conv_id = req.conversation_id or str(uuid.uuid4())
 
-    if not subscription_active:
-        with db_session() as session:
-            quota = session.get(Quota, (req.user_id, today))
-            if quota is None:
-                quota = Quota(user_id=req.user_id, date=today, messages_used=1)
-                session.add(quota)
-            else:
-                quota.messages_used += 1
-                quota.updated_at = datetime.now(timezone.utc)
-            session.commit()
+    try:
+        history = await _history(req)
+        # An answer that depends on earlier turns is neither served from nor
+        # stored in the shared answer cache.
+        with metrics.stage("cache_lookup"):
+            cached, embedding = (None, None) if history else await answer_cache.lookup(req.message, req.translation)
+        if cached is not None:
+            answer_text, citations = cached["answer"], cached["citations"]
+        elif history:
+            passages = await retrieval.retrieve(req.message, translation=req.translation, embedding=embedding)
+            answer_text, citations = await llm.answer(req.message, passages, history)
+        else:
+            answer_text, citations = await singleflight.do(
+                singleflight.make_key("chat", req.translation, answer_cache.normalize(req.message)),
+                lambda: _answer_and_cache(req.message, req.translation, embedding),
+            )
+    except Exception:
+        if reserved:
+            await quota.refund(req.user_id, today)
+        raise
+    with metrics.stage("persist"):
+        await conversations.record(req.user_id, conv_id, req.message, answer_text)
 
     return ChatResponse(
         answer=answer_text,
         citations=[Citation(**c) for c in citations],
         conversation_id=conv_id,
     )
+
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    today = date.today()
+    reserved = await _reserve_message(req.user_id, today)
+    conv_id = req.conversation_id or str(uuid.uuid4())
+
+    try:
+        history = await _history(req)
+        with metrics.stage("cache_lookup"):
+            cached, embedding = (None, None) if history else await answer_cache.lookup(req.message, req.translation)
+        if cached is not None:
+            passages, cited = [], cached["citations"]
+        else:
+            # Concurrent identical questions share one retrieval; the streamed
+            # answers are per request, and the first to finish fills the cache.
+            passages = await singleflight.do(
+                singleflight.make_key("retrieve", req.translation, answer_cache.normalize(req.message)),
+                lambda: retrieval.retrieve(req.message, translation=req.translation, embedding=embedding),
+            )
+            cited = llm.citations_for(passages)
+    except Exception:
+        if reserved:
+            await quota.refund(req.user_id, today)
+        raise
+    citations = [Citation(**c).model_dump() for c in cited]
+
+    async def events():
+        yield _sse("citations", {"citations": citations, "conversation_id": conv_id})
+        if cached is not None:
+            answer_text = cached["answer"]
+            yield _sse("token", {"delta": answer_text})
+        else:
+            parts = []
+            try:
+                async for delta in llm.stream_answer(req.message, passages, history):
+                    parts.append(delta)
+                    yield _sse("token", {"delta": delta})
+            except HTTPException as exc:
+                if reserved:
+                    await quota.refund(req.user_id, today)
+                error = {"status": exc.status_code, "detail": exc.detail}
+                if exc.headers and "Retry-After" in exc.headers:
+                    error["retry_after"] = int(exc.headers["Retry-After"])
+                yield _sse("error", error)
+                return
+            answer_text = "".join(parts)
+            if not history and not llm.is_offline_reply(answer_text):
+                with metrics.stage("cache_store"):
+                    await answer_cache.store(req.message, req.translation, answer_text, cited, embedding)
+
+        with metrics.stage("persist"):
+            await conversations.record(req.user_id, conv_id, req.message, answer_text)
+        yield _sse("done", {"conversation_id": conv_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
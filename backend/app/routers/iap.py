@@ -1,62 +1,101 @@
-from datetime import datetime, timedelta, timezone
+import logging
+from datetime import datetime, timezone
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..deps import db_session, redis_client
+from ..deps import get_session
 from ..models import Subscription, User
+from ..services import entitlements, storekit
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class VerifyReq(BaseModel):
     user_id: str
     jws: str
 
+
+def _already_granted(subscription: Subscription | None, claims: dict) -> dict | None:
+    # A restore of the transaction this user already holds, claiming no later
+    # expiry, cannot change anything: answer from the row without verifying.
+    if subscription is None or subscription.original_tx_id != str(claims["originalTransactionId"]):
+        return None
+    claimed = storekit.claimed_expiry(claims)
+    if claimed is None or claims.get("revocationDate") is not None:
+        return None
+    current = entitlements.from_subscription(subscription)
+    if not entitlements.is_active(current) or current["expires_at"] is None:
+        return None
+    return current if claimed <= datetime.fromisoformat(current["expires_at"]) else None
+
+
 @router.post("/iap/verify")
-async def verify(req: VerifyReq):
-    if not req.jws or len(req.jws.split('.')) != 3:
-        raise HTTPException(400, "Invalid JWS format")
+async def verify(req: VerifyReq, session: AsyncSession = Depends(get_session)):
+    _, claims = storekit.decode_unverified(req.jws)
+    subscription = await session.get(Subscription, req.user_id)
+    current = _already_granted(subscription, claims)
+    if current is not None:
+        return current
 
-    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-    with db_session() as session:
-        user = session.get(User, req.user_id)
-        if user is None:
-            session.add(User(id=req.user_id))
+    tx = await storekit.verify(req.jws)
+    # A valid JWS proves a purchase happened, not who made it: it must carry
+    # this user's appAccountToken and must not already back another account.
+    if not storekit.owned_by(tx, req.user_id):
+        logger.warning("IAP_ACCOUNT_MISMATCH user_id=%s original_tx_id=%s", req.user_id, tx["original_tx_id"])
+        raise HTTPException(403, "Transaction belongs to another account.")
+    holder = await session.scalar(
+        select(Subscription.user_id)
+        .where(Subscription.original_tx_id == tx["original_tx_id"], Subscription.user_id != req.user_id)
+        .limit(1)
+    )
+    if holder is not None:
+        logger.warning("IAP_TX_CLAIMED user_id=%s original_tx_id=%s", req.user_id, tx["original_tx_id"])
+        raise HTTPException(409, "Transaction is already linked to another account.")
+    expires_at = datetime.fromisoformat(tx["expires_at"]) if tx["expires_at"] else None
+    if tx["revoked"]:
+        status = "revoked"
+    elif expires_at is not None and expires_at <= datetime.now(timezone.utc):
+        status = "expired"
+    else:
+        status = "active"
 
-        subscription = session.get(Subscription, req.user_id)
-        if subscription is None:
-            subscription = Subscription(user_id=req.user_id)
-            session.add(subscription)
+    user = await session.get(User, req.user_id)
+    if user is None:
+        session.add(User(id=req.user_id))
+    if subscription is None:
+        subscription = Subscription(user_id=req.user_id)
+        session.add(subscription)
 
-        subscription.status = "active"
-        subscription.product_id = "weekly.premium"
-        subscription.expires_at = expires_at
-        subscription.updated_at = datetime.now(timezone.utc)
+    subscription.status = status
+    subscription.product_id = tx["product_id"]
+    subscription.original_tx_id = tx["original_tx_id"]
+    subscription.expires_at = expires_at
+    subscription.updated_at = datetime.now(timezone.utc)
+    entitlement = entitlements.from_subscription(subscription)
 
-        session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Another account claimed the same transaction concurrently (unique index).
+        await session.rollback()
+        raise HTTPException(409, "Transaction is already linked to another account.")
 
-    ttl_seconds = int(timedelta(days=7).total_seconds())
-    redis_client.set(f"entitlement:{req.user_id}", "active", ex=ttl_seconds)
-    return {"status": "active", "expires_at": expires_at.isoformat()}
+    await entitlements.publish(req.user_id, entitlement)
+    return {"status": status, "expires_at": expires_at.isoformat() if expires_at else None}
 
 
 @router.get("/iap/entitlement")
 async def entitlement(user_id: str = Query(...)):
-    with db_session() as session:
-        subscription = session.get(Subscription, user_id)
-
-    if subscription is None:
+    current = await entitlements.lookup(user_id)
+    if current["status"] == "none":
         return {"status": "none"}
 
-    now = datetime.now(timezone.utc)
-    expires_at = subscription.expires_at
-    is_active = (
-        subscription.status == "active"
-        and (expires_at is None or expires_at > now)
-    )
-
-    status = "active" if is_active else "expired"
+    status = "active" if entitlements.is_active(current) else "expired"
     payload = {"status": status}
-    if expires_at is not None:
-        payload["expires_at"] = expires_at.isoformat()
+    if current["expires_at"] is not None:
+        payload["expires_at"] = current["expires_at"]
     return payload
@@ -1,10 +1,58 @@
-from fastapi import APIRouter
+import os
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from .. import http_cache
+from ..services import plans as plan_service
+
 router = APIRouter()
 
-@router.get("/plan/john14")
-async def get_plan():
-    return {"days": [{"day": 1, "refs": [["John", 1, 1, 18]]}]}
+PLAN_CACHE_MAX_AGE_S = int(os.getenv("PLAN_CACHE_MAX_AGE_S", "86400"))
+
+
+async def _plan_or_404(plan_ref: str, translation: str) -> plan_service.RenderedPlan:
+    if translation not in plan_service.PLAN_TRANSLATIONS:
+        raise HTTPException(status_code=400, detail="Unknown translation.")
+    plan = await plan_service.get_plan(plan_ref, translation)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan not found.")
+    return plan
+
+
+async def _outline_or_404(plan_ref: str) -> tuple:
+    outline = await plan_service.plan_outline(plan_ref)
+    if outline is None:
+        raise HTTPException(status_code=404, detail="Plan not found.")
+    return outline
+
+
+@router.get("/plan/progress")
+async def get_progress(user_id: str, plan_id: str):
+    plan_id, day_count = await _outline_or_404(plan_id)
+    days = await plan_service.completed_days(user_id, plan_id)
+    return {"plan_id": plan_id, "completed": days, "day_count": day_count}
+
 
 @router.post("/plan/progress")
 async def mark_progress(user_id: str, plan_id: str, day_number: int):
+    # plan_id may be the plan key ("john14") or its id.
+    plan_id, day_count = await _outline_or_404(plan_id)
+    if not 1 <= day_number <= day_count:
+        raise HTTPException(status_code=400, detail="day_number is out of range for this plan.")
+    await plan_service.mark_complete(user_id, plan_id, day_number)
     return {"ok": True}
+
+
+@router.get("/plan/{plan_key}")
+async def get_plan(request: Request, plan_key: str, translation: str = Query("WEB")):
+    plan = await _plan_or_404(plan_key, translation)
+    return http_cache.cached_response(request, plan.summary, PLAN_CACHE_MAX_AGE_S)
+
+
+@router.get("/plan/{plan_key}/day/{day_number}")
+async def get_plan_day(request: Request, plan_key: str, day_number: int, translation: str = Query("WEB")):
+    plan = await _plan_or_404(plan_key, translation)
+    rendered = plan.days.get(day_number)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Plan day not found.")
+    return http_cache.cached_response(request, rendered, PLAN_CACHE_MAX_AGE_S)
@@ -1,69 +1,192 @@
-from fastapi import APIRouter, Query, HTTPException
+import base64
+import hashlib
+import json
+import logging
+import os
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Query, HTTPException, Request
+from redis.exceptions import RedisError
 from sqlalchemy import text as sql_text
-from starlette.concurrency import run_in_threadpool
-from ..deps import db_session
+from .. import http_cache
+from ..deps import db_session, redis_async
+from ..services import singleflight, verse_store
+from ..services import daily_verse as daily_picks
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+VERSE_SEARCH_CACHE_TTL_S = int(os.getenv("VERSE_SEARCH_CACHE_TTL_S", "60"))
+VERSE_PASSAGE_MAX_AGE_S = int(os.getenv("VERSE_PASSAGE_MAX_AGE_S", str(7 * 86400)))
+DAILY_VERSE_MAX_AGE_S = int(os.getenv("DAILY_VERSE_MAX_AGE_S", "300"))
+
+_HEADLINE_OPTIONS = "ShortWords=2,MaxFragments=1,MaxWords=25,MinWords=10,FragmentDelimiter=…"
+
+# The tsquery is built once in `q`; ranking happens over the matches, and
+# ts_headline (which re-parses the raw text) only runs for the returned page.
+_SEARCH_SQL = """
+WITH q AS (SELECT plainto_tsquery('english', :ts_query) AS tsq),
+page AS (
+    SELECT id, book, chapter, verse, text, rank
+    FROM (
+        SELECT v.id, v.book, v.chapter, v.verse, v.text, ts_rank(v.text_tsv, q.tsq) AS rank
+        FROM verses v, q
+        WHERE v.translation = :translation AND v.text_tsv @@ q.tsq
+    ) hits
+    {after}
+    ORDER BY rank DESC, id
+    LIMIT :limit {offset}
+)
+SELECT page.id, page.book, page.chapter, page.verse, page.text, page.rank,
+       ts_headline('english', page.text, q.tsq, :headline_options) AS highlight
+FROM page, q
+ORDER BY page.rank DESC, page.id
+"""
+
+_FIRST_PAGE_SQL = sql_text(_SEARCH_SQL.format(after="", offset="OFFSET :offset"))
+_KEYSET_SQL = sql_text(
+    _SEARCH_SQL.format(
+        after="WHERE rank < :after_rank OR (rank = :after_rank AND id > :after_id)",
+        offset="",
+    )
+)
+
+
+def _encode_cursor(rank: float, verse_id: int) -> str:
+    raw = json.dumps([rank, verse_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, verse_id = json.loads(raw)
+        return float(rank), int(verse_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _cache_key(translation: str, query_text: str, page: str, limit: int) -> str:
+    digest = hashlib.sha256(query_text.encode("utf-8")).hexdigest()[:32]
+    return f"vs:{translation}:{digest}:{page}:{limit}"
+
+
+async def _search(key: str, statement, params: dict, limit: int) -> dict:
+    async with db_session() as session:
+        rows = (await session.execute(statement, params)).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    results = [
+        {
+            "book": row["book"],
+            "chapter": row["chapter"],
+            "verse": row["verse"],
+            "text": row["text"],
+            "highlight": row["highlight"] or row["text"],
+        }
+        for row in rows
+    ]
+    next_cursor = _encode_cursor(float(rows[-1]["rank"]), rows[-1]["id"]) if has_more else None
+    payload = {"results": results, "next_cursor": next_cursor}
+
+    try:
+        await redis_async.set(key, http_cache.dumps(payload), ex=VERSE_SEARCH_CACHE_TTL_S)
+    except RedisError:
+        pass
+    return payload
+
 
 @router.get("/verses/search")
 async def search(
+    request: Request,
     q: str = Query(..., min_length=2),
     translation: str = Query("WEB"),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
 ):
-    query_text = q.strip()
+    query_text = " ".join(q.lower().split())
     if len(query_text) < 2:
         raise HTTPException(status_code=400, detail="Query must be at least 2 characters.")
 
-    statement = sql_text(
-        """
-        SELECT
-            book,
-            chapter,
-            verse,
-            text,
-            ts_headline(
-                'english',
-                text,
-                plainto_tsquery(:ts_query),
-                'ShortWords=2,MaxFragments=1,MaxWords=25,MinWords=10,FragmentDelimiter=…'
-            ) AS highlight
-        FROM verses
-        WHERE translation = :translation
-          AND text_tsv @@ plainto_tsquery(:ts_query)
-        ORDER BY ts_rank(text_tsv, plainto_tsquery(:ts_query)) DESC
-        LIMIT :limit OFFSET :offset
-        """
-    )
-
     params = {
         "ts_query": query_text,
         "translation": translation,
-        "limit": limit,
-        "offset": offset,
+        "limit": limit + 1,
+        "headline_options": _HEADLINE_OPTIONS,
     }
+    if cursor:
+        params["after_rank"], params["after_id"] = _decode_cursor(cursor)
+        statement, page = _KEYSET_SQL, f"c{cursor}"
+    else:
+        params["offset"] = offset
+        statement, page = _FIRST_PAGE_SQL, f"o{offset}"
 
-    def _run_search():
-        with db_session() as session:
-            return session.execute(statement, params).mappings().all()
+    key = _cache_key(translation, query_text, page, limit)
+    try:
+        cached = await redis_async.get(key)
+    except RedisError:
+        cached = None
+    if cached:
+        # Served as stored: no decode/encode round trip.
+        body = cached.encode("utf-8")
+    else:
+        # Identical searches arriving together run the SQL once.
+        body = http_cache.dumps(await singleflight.do(f"search:{key}", lambda: _search(key, statement, params, limit)))
+    return http_cache.cached_response(request, (body, http_cache.body_etag(body)), VERSE_SEARCH_CACHE_TTL_S)
 
-    rows = await run_in_threadpool(_run_search)
 
-    results = [
-        {
-            "book": row["book"],
-            "chapter": row["chapter"],
-            "verse": row["verse"],
-            "text": row["text"],
-            "highlight": row["highlight"] or row["text"],
-        }
-        for row in rows
-    ]
 
-    return {"results": results}
+@router.get("/verses/passage")
+async def passage(
+    request: Request,
+    book: str = Query(...),
+    chapter: int = Query(..., ge=1),
+    start: int = Query(1, ge=1),
+    end: Optional[int] = Query(None, ge=1),
+    translation: str = Query("WEB"),
+):
+    book_no = verse_store.book_number(book)
+    if book_no is None:
+        raise HTTPException(status_code=404, detail="Unknown book.")
+    last = end if end is not None else 999
+    if last < start:
+        raise HTTPException(status_code=400, detail="end must not be before start.")
+
+    # The ETag depends only on the request and the verse data version, so a
+    # revalidation is answered without reading the passage.
+    etag = http_cache.etag_for("passage", translation, book_no, chapter, start, last, verse_store.data_version(translation))
+    unchanged = http_cache.not_modified_response(request, etag, VERSE_PASSAGE_MAX_AGE_S)
+    if unchanged is not None:
+        return unchanged
+    verses = await verse_store.fetch_passage(translation, book_no, chapter, start, last)
+    if not verses:
+        raise HTTPException(status_code=404, detail="Passage not found.")
+    body = http_cache.dumps({"translation": translation, "book": book_no, "chapter": chapter, "verses": verses})
+    return http_cache.cached_response(request, (body, etag), VERSE_PASSAGE_MAX_AGE_S)
+
 
 @router.get("/daily-verse", response_model=dict)
-async def daily_verse(translation: str = "WEB") -> dict:
-    # TODO: select from pool with recency penalty
-    return {"verse": {"book": 19, "chapter": 23, "verse": 1, "text": "The Lord is my shepherd."}}
+async def daily_verse(
+    request: Request,
+    translation: str = "WEB",
+    user_id: Optional[str] = None,
+    day: Optional[date] = None,
+) -> dict:
+    # `day` lets clients ask for their local date, which is always within one
+    # day of server time. Today and tomorrow are precomputed; yesterday's pick
+    # was precomputed as "today" and is still cached (DAILY_VERSE_TTL_S).
+    today = date.today()
+    day = day or today
+    if abs((day - today).days) > 1:
+        raise HTTPException(status_code=400, detail="day must be within one day of today.")
+    try:
+        payload = await daily_picks.get(translation, day, user_id)
+    except RedisError:
+        logger.warning("DAILY_VERSE_CACHE_UNAVAILABLE")
+        return {"date": day.isoformat(), "translation": translation, "verse": dict(daily_picks.FALLBACK)}
+    # Per-user picks are private; the short max-age covers clients that omit
+    # `day` across midnight.
+    return http_cache.cached_response(request, http_cache.render(payload), DAILY_VERSE_MAX_AGE_S, private=bool(user_id))
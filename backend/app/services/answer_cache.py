@@ -0,0 +1,339 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from ..deps import redis_async
+from . import retrieval
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_TTL_S = int(os.getenv("ANSWER_CACHE_TTL_S", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+ANSWER_CACHE_REFRESH_S = float(os.getenv("ANSWER_CACHE_REFRESH_S", "5"))
+ANSWER_CACHE_LOG_MAX = int(os.getenv("ANSWER_CACHE_LOG_MAX", "10000"))
+
+_ENTRY_PREFIX = "anscache:e:"
+_LRU_KEY = "anscache:lru"
+_SIZES_KEY = "anscache:sizes"
+_BYTES_KEY = "anscache:bytes"
+_VECTORS_KEY = "anscache:vec"
+_VERSION_KEY = "anscache:ver"
+_LOG_KEY = "anscache:vlog"
+_META_KEYS = [_LRU_KEY, _SIZES_KEY, _BYTES_KEY, _VECTORS_KEY, _VERSION_KEY, _LOG_KEY]
+
+# KEYS: entry, lru, sizes, bytes, vectors, version, log
+# ARGV: now (ms), ttl
+# A hit slides the TTL and bumps the entry to most-recently-used in one trip.
+_GET_LUA = """
+local value = redis.call('GET', KEYS[1])
+if value then
+  redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+  redis.call('ZADD', KEYS[2], tonumber(ARGV[1]), KEYS[1])
+end
+return value
+"""
+
+# KEYS: entry, lru, sizes, bytes, vectors, version, log
+# ARGV: payload, ttl, now (ms), max_bytes, vector (may be empty), log_max
+# Entries whose TTL already lapsed are purged from the bookkeeping first, then
+# least-recently-used entries are evicted until the byte budget fits again.
+# Every vector added or dropped bumps the version and appends "+key"/"-key" to
+# the log, so the log entry for version v sits at index v - version - 1.
+_SET_LUA = """
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cap = tonumber(ARGV[4])
+local function log(entry)
+  redis.call('INCR', KEYS[6])
+  redis.call('RPUSH', KEYS[7], entry)
+end
+local function drop(key)
+  local size = tonumber(redis.call('HGET', KEYS[3], key) or '0')
+  redis.call('DEL', key)
+  redis.call('ZREM', KEYS[2], key)
+  redis.call('HDEL', KEYS[3], key)
+  if redis.call('HDEL', KEYS[5], key) == 1 then
+    log('-' .. key)
+  end
+  redis.call('DECRBY', KEYS[4], size)
+end
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now - ttl * 1000)) do
+  drop(key)
+end
+if redis.call('HEXISTS', KEYS[3], KEYS[1]) == 1 then
+  drop(KEYS[1])
+end
+local size = string.len(ARGV[1]) + string.len(ARGV[5])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+redis.call('ZADD', KEYS[2], now, KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], size)
+local total = redis.call('INCRBY', KEYS[4], size)
+if ARGV[5] ~= '' then
+  redis.call('HSET', KEYS[5], KEYS[1], ARGV[5])
+  log('+' .. KEYS[1])
+end
+local evicted = 0
+while total > cap do
+  local victim = nil
+  for _, key in ipairs(redis.call('ZRANGE', KEYS[2], 0, 1)) do
+    if key ~= KEYS[1] then
+      victim = key
+      break
+    end
+  end
+  if victim == nil then
+    break
+  end
+  drop(victim)
+  evicted = evicted + 1
+  total = tonumber(redis.call('GET', KEYS[4]) or '0')
+end
+redis.call('LTRIM', KEYS[7], -tonumber(ARGV[6]), -1)
+return evicted
+"""
+
+# KEYS: version, log
+# ARGV: version the caller has applied (-1 for none)
+# Returns {version, 1} when the caller must reload (new, reset, or further
+# behind than the log reaches), else {version, 0, entries after its version...}.
+_CHANGES_LUA = """
+local version = tonumber(redis.call('GET', KEYS[1]) or '0')
+local since = tonumber(ARGV[1])
+local behind = version - since
+if since < 0 or behind < 0 or behind > redis.call('LLEN', KEYS[2]) then
+  return {version, 1}
+end
+local reply = {version, 0}
+if behind > 0 then
+  for _, entry in ipairs(redis.call('LRANGE', KEYS[2], -behind, -1)) do
+    reply[#reply + 1] = entry
+  end
+end
+return reply
+"""
+
+_get_script = redis_async.register_script(_GET_LUA)
+_set_script = redis_async.register_script(_SET_LUA)
+_changes_script = redis_async.register_script(_CHANGES_LUA)
+
+_stats: Dict[str, int] = {
+    "hits_exact": 0,
+    "hits_semantic": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "errors": 0,
+}
+
+
+def normalize(q: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", q.lower()).split())
+
+
+def _entry_key(normalized: str, translation: str) -> str:
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+    return f"{_ENTRY_PREFIX}{translation}:{digest}"
+
+
+def _pack_vector(embedding: List[float]) -> str:
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec)) or 1.0
+    return base64.b64encode((vec / norm).astype(np.float16).tobytes()).decode("ascii")
+
+
+def _unpack_vector(packed: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(packed), dtype=np.float16).astype(np.float32)
+
+
+def _translation(key: str) -> str:
+    return key[len(_ENTRY_PREFIX):].split(":", 1)[0]
+
+
+class _Rows:
+    # One translation's vectors in a growable matrix. Removal moves the last row
+    # into the hole so the live rows stay contiguous.
+
+    def __init__(self, dim: int) -> None:
+        self.keys: List[str] = []
+        self.pos: Dict[str, int] = {}
+        self.matrix = np.empty((64, dim), dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        if vector.shape[0] != self.matrix.shape[1]:
+            return
+        row = self.pos.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == self.matrix.shape[0]:
+                grown = np.empty((2 * row, self.matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self.matrix
+                self.matrix = grown
+            self.keys.append(key)
+            self.pos[key] = row
+        self.matrix[row] = vector
+
+    def remove(self, key: str) -> None:
+        row = self.pos.pop(key, None)
+        if row is None:
+            return
+        moved = self.keys.pop()
+        if moved != key:
+            last = len(self.keys)
+            self.keys[row] = moved
+            self.pos[moved] = row
+            self.matrix[row] = self.matrix[last]
+
+
+class _SemanticIndex:
+    # Per-process mirror of the stored question vectors. A refresh replays only
+    # the log entries past the version this worker has applied, fetching just
+    # the added vectors; the whole hash is scanned only on first use or when the
+    # worker fell further behind than ANSWER_CACHE_LOG_MAX changes.
+
+    def __init__(self) -> None:
+        self.version = -1
+        self.checked_at = 0.0
+        self.by_translation: Dict[str, _Rows] = {}
+
+    async def refresh(self) -> None:
+        now = time.monotonic()
+        if now - self.checked_at < ANSWER_CACHE_REFRESH_S:
+            return
+        self.checked_at = now
+
+        reply = await _changes_script(keys=[_VERSION_KEY, _LOG_KEY], args=[self.version])
+        version, reload = int(reply[0]), int(reply[1])
+        if reload:
+            # Changes made while scanning are replayed by the next refresh;
+            # applying an entry twice is harmless.
+            by_translation: Dict[str, _Rows] = {}
+            async for key, packed in redis_async.hscan_iter(_VECTORS_KEY, count=500):
+                self._put(by_translation, key, packed)
+            self.by_translation = by_translation
+            logger.info("ANSWER_CACHE_INDEX_RELOADED")
+        elif len(reply) > 2:
+            await self._apply(reply[2:])
+        self.version = version
+
+    async def _apply(self, entries: List[str]) -> None:
+        latest: Dict[str, str] = {}
+        for entry in entries:
+            latest[entry[1:]] = entry[0]
+        added = [key for key, op in latest.items() if op == "+"]
+        packed = await redis_async.hmget(_VECTORS_KEY, added) if added else []
+        vectors = dict(zip(added, packed))
+        for key in latest:
+            if vectors.get(key) is None:
+                rows = self.by_translation.get(_translation(key))
+                if rows is not None:
+                    rows.remove(key)
+            else:
+                self._put(self.by_translation, key, vectors[key])
+
+    @staticmethod
+    def _put(by_translation: Dict[str, _Rows], key: str, packed: str) -> None:
+        vector = _unpack_vector(packed)
+        translation = _translation(key)
+        rows = by_translation.get(translation)
+        if rows is None:
+            rows = by_translation[translation] = _Rows(vector.shape[0])
+        rows.put(key, vector)
+
+    def nearest(self, embedding: List[float], translation: str) -> Optional[Tuple[str, float]]:
+        rows = self.by_translation.get(translation)
+        if rows is None or not rows.keys:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        if rows.matrix.shape[1] != query.shape[0]:
+            return None
+        query /= float(np.linalg.norm(query)) or 1.0
+        scores = rows.matrix[: len(rows.keys)] @ query
+        best = int(np.argmax(scores))
+        return rows.keys[best], float(scores[best])
+
+
+_index = _SemanticIndex()
+
+
+async def _fetch(key: str) -> Optional[Dict[str, Any]]:
+    raw = await _get_script(keys=[key] + _META_KEYS, args=[int(time.time() * 1000), ANSWER_CACHE_TTL_S])
+    return json.loads(raw) if raw else None
+
+
+async def lookup(q: str, translation: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    # Returns (cached, embedding). When the semantic tier had to embed the
+    # question, the embedding is handed back so retrieval does not redo it.
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+
+    embedding: Optional[List[float]] = None
+    try:
+        cached = await _fetch(_entry_key(normalize(q), translation))
+        if cached is not None:
+            _stats["hits_exact"] += 1
+            return cached, None
+
+        if ANSWER_CACHE_SEMANTIC:
+            embedding = await retrieval.embed_query(q)
+            if embedding is not None:
+                await _index.refresh()
+                match = _index.nearest(embedding, translation)
+                if match is not None and match[1] >= ANSWER_CACHE_SIMILARITY:
+                    cached = await _fetch(match[0])
+                    if cached is not None:
+                        _stats["hits_semantic"] += 1
+                        return cached, embedding
+    except RedisError:
+        _stats["errors"] += 1
+        logger.warning("ANSWER_CACHE_UNAVAILABLE")
+
+    _stats["misses"] += 1
+    return None, embedding
+
+
+async def store(
+    q: str,
+    translation: str,
+    answer: str,
+    citations: List[Dict[str, Any]],
+    embedding: Optional[List[float]] = None,
+) -> None:
+    if not ANSWER_CACHE_ENABLED or not answer:
+        return
+
+    normalized = normalize(q)
+    payload = json.dumps({"q": normalized, "answer": answer, "citations": citations}, ensure_ascii=False)
+    packed = _pack_vector(embedding) if ANSWER_CACHE_SEMANTIC and embedding is not None else ""
+    try:
+        evicted = await _set_script(
+            keys=[_entry_key(normalized, translation)] + _META_KEYS,
+            args=[
+                payload,
+                ANSWER_CACHE_TTL_S,
+                int(time.time() * 1000),
+                ANSWER_CACHE_MAX_BYTES,
+                packed,
+                ANSWER_CACHE_LOG_MAX,
+            ],
+        )
+    except RedisError:
+        _stats["errors"] += 1
+        logger.warning("ANSWER_CACHE_UNAVAILABLE")
+        return
+    _stats["stores"] += 1
+    _stats["evictions"] += int(evicted or 0)
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY_S = 1.0
+
+_jobs: List[Tuple[str, Optional[Callable[[], Awaitable[None]]], asyncio.Task]] = []
+
+
+async def _run_safely(name: str, fn: Callable[[], Awaitable[None]]) -> None:
+    try:
+        await fn()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("BACKGROUND_%s_FAILED", name.upper())
+
+
+async def _loop(name: str, interval_s: float, fn: Callable[[], Awaitable[None]], immediate: bool) -> None:
+    if immediate:
+        await _run_safely(name, fn)
+    while True:
+        await asyncio.sleep(interval_s)
+        await _run_safely(name, fn)
+
+
+async def _forever(name: str, fn: Callable[[], Awaitable[None]]) -> None:
+    while True:
+        await _run_safely(name, fn)
+        await asyncio.sleep(RESTART_DELAY_S)
+
+
+def run_periodic(
+    name: str,
+    interval_s: float,
+    fn: Callable[[], Awaitable[None]],
+    immediate: bool = False,
+    run_on_shutdown: bool = True,
+) -> None:
+    task = asyncio.create_task(_loop(name, interval_s, fn, immediate), name=name)
+    _jobs.append((name, fn if run_on_shutdown else None, task))
+
+
+def run_forever(name: str, fn: Callable[[], Awaitable[None]]) -> None:
+    # For long-lived consumers such as pub/sub listeners; restarted if they exit.
+    task = asyncio.create_task(_forever(name, fn), name=name)
+    _jobs.append((name, None, task))
+
+
+async def shutdown() -> None:
+    # Stop every loop, then run flush jobs one last time so buffered writes land.
+    jobs = list(_jobs)
+    _jobs.clear()
+    for _, _, task in jobs:
+        task.cancel()
+    await asyncio.gather(*(task for _, _, task in jobs), return_exceptions=True)
+    for name, fn, _ in jobs:
+        if fn is not None:
+            await _run_safely(name, fn)
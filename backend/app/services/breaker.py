@@ -0,0 +1,150 @@
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from redis.exceptions import RedisError
+
+from ..deps import redis_async
+
+logger = logging.getLogger(__name__)
+
+LLM_BREAKER_ENABLED = os.getenv("LLM_BREAKER_ENABLED", "1") == "1"
+LLM_BREAKER_WINDOW_S = int(os.getenv("LLM_BREAKER_WINDOW_S", "30"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+# A successful call slower than this still counts against the circuit.
+LLM_BREAKER_SLOW_S = float(os.getenv("LLM_BREAKER_SLOW_S", "10"))
+LLM_BREAKER_OPEN_S = int(os.getenv("LLM_BREAKER_OPEN_S", "30"))
+LLM_BREAKER_PROBE_TTL_S = int(os.getenv("LLM_BREAKER_PROBE_TTL_S", "30"))
+
+CLOSED, PROBE = "closed", "probe"
+
+_OPEN_KEY = "llm:cb:open"  # present (with TTL) while open
+_HALF_KEY = "llm:cb:half"  # set on trip, cleared by a successful probe
+_PROBE_KEY = "llm:cb:probe"  # the one worker allowed to try while half-open
+
+# KEYS: calls and failures of the current and previous window, open, half
+# ARGV: failed (0/1), window seconds, min calls, failure rate, open seconds
+# Counts one outcome over the last two windows and trips the circuit when
+# enough calls failed. Returns 1 when this call tripped it.
+_RECORD_LUA = """
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], 2 * tonumber(ARGV[2]))
+if ARGV[1] == '1' then
+  redis.call('INCR', KEYS[2])
+  redis.call('EXPIRE', KEYS[2], 2 * tonumber(ARGV[2]))
+end
+local calls = tonumber(redis.call('GET', KEYS[1]) or '0') + tonumber(redis.call('GET', KEYS[3]) or '0')
+local failed = tonumber(redis.call('GET', KEYS[2]) or '0') + tonumber(redis.call('GET', KEYS[4]) or '0')
+if calls >= tonumber(ARGV[3]) and failed >= calls * tonumber(ARGV[4]) and redis.call('EXISTS', KEYS[5]) == 0 then
+  redis.call('SET', KEYS[5], '1', 'EX', ARGV[5])
+  redis.call('SET', KEYS[6], '1')
+  redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+  return 1
+end
+return 0
+"""
+
+# KEYS: probe; ARGV: permit. Deletes the probe lock only if we still hold it.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_record_script = redis_async.register_script(_RECORD_LUA)
+_release_script = redis_async.register_script(_RELEASE_LUA)
+
+# Last state this worker saw, for callers that must not wait on Redis
+# (embedding the query while OpenAI is down).
+_open_until = 0.0
+_stats = {"short_circuited": 0, "tripped": 0, "probes": 0}
+
+
+def _window_keys(now: float) -> list:
+    window = int(now // LLM_BREAKER_WINDOW_S)
+    return [f"llm:cb:calls:{window}", f"llm:cb:fail:{window}", f"llm:cb:calls:{window - 1}", f"llm:cb:fail:{window - 1}"]
+
+
+def _mark_open() -> None:
+    global _open_until
+    _open_until = time.monotonic() + min(LLM_BREAKER_OPEN_S, 5)
+
+
+def recently_open() -> bool:
+    return time.monotonic() < _open_until
+
+
+async def acquire() -> Optional[str]:
+    # CLOSED or PROBE when the caller may call the model, None when the
+    # circuit is open (answer offline). Half-open lets exactly one worker
+    # through at a time; its outcome closes or re-opens the circuit for all.
+    # Fails open when Redis is unreachable.
+    global _open_until
+    if not LLM_BREAKER_ENABLED:
+        return CLOSED
+    try:
+        is_open, half = await redis_async.mget(_OPEN_KEY, _HALF_KEY)
+        if is_open:
+            _mark_open()
+            _stats["short_circuited"] += 1
+            return None
+        if not half:
+            _open_until = 0.0
+            return CLOSED
+        token = f"{PROBE}:{uuid.uuid4().hex}"
+        if await redis_async.set(_PROBE_KEY, token, nx=True, ex=LLM_BREAKER_PROBE_TTL_S):
+            _stats["probes"] += 1
+            return token
+    except RedisError:
+        logger.warning("LLM_BREAKER_UNAVAILABLE")
+        return CLOSED
+    _mark_open()
+    _stats["short_circuited"] += 1
+    return None
+
+
+async def record(permit: str, failed: bool, elapsed: float) -> None:
+    failed = failed or elapsed >= LLM_BREAKER_SLOW_S
+    if not LLM_BREAKER_ENABLED:
+        return
+    try:
+        if permit.startswith(PROBE):
+            if failed:
+                await redis_async.set(_OPEN_KEY, "1", ex=LLM_BREAKER_OPEN_S)
+                logger.warning("LLM_BREAKER_REOPENED")
+                _mark_open()
+            else:
+                await redis_async.delete(_HALF_KEY)
+                logger.info("LLM_BREAKER_CLOSED")
+            await release(permit)
+            return
+        tripped = await _record_script(
+            keys=[*_window_keys(time.time()), _OPEN_KEY, _HALF_KEY],
+            args=[1 if failed else 0, LLM_BREAKER_WINDOW_S, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_FAILURE_RATE, LLM_BREAKER_OPEN_S],
+        )
+    except RedisError:
+        logger.warning("LLM_BREAKER_UNAVAILABLE")
+        return
+    if tripped:
+        _stats["tripped"] += 1
+        _mark_open()
+        logger.error("LLM_BREAKER_OPENED")
+
+
+async def release(permit: str) -> None:
+    # Gives back a probe permit that never reached the model.
+    if not permit.startswith(PROBE):
+        return
+    try:
+        await _release_script(keys=[_PROBE_KEY], args=[permit])
+    except RedisError:
+        logger.warning("LLM_BREAKER_UNAVAILABLE")
+
+
+async def state() -> Dict[str, Any]:
+    is_open, half = await redis_async.mget(_OPEN_KEY, _HALF_KEY)
+    return {"state": "open" if is_open else "half_open" if half else "closed", **_stats}
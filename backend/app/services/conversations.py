@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy import text as sql_text
+
+from ..deps import db_session
+from . import tokens
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_QUEUE_MAX = int(os.getenv("CONVERSATION_QUEUE_MAX", "10000"))
+CONVERSATION_ENQUEUE_TIMEOUT_S = float(os.getenv("CONVERSATION_ENQUEUE_TIMEOUT_S", "1.0"))
+CONVERSATION_FLUSH_INTERVAL_S = float(os.getenv("CONVERSATION_FLUSH_INTERVAL_S", "0.5"))
+CONVERSATION_FLUSH_BATCH = int(os.getenv("CONVERSATION_FLUSH_BATCH", "500"))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+
+# One item per chat exchange; created lazily so it binds to the running loop.
+_queue: asyncio.Queue | None = None
+# Exchanges queued or being written, by conversation, so a follow-up served by
+# this worker sees them before the flush commits.
+_pending: Dict[str, List[Dict[str, Any]]] = {}
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=CONVERSATION_QUEUE_MAX)
+    return _queue
+
+
+async def record(user_id: str, conversation_id: str, question: str, answer: str) -> None:
+    # Queues one exchange for the writer. When the queue is full the caller
+    # waits up to CONVERSATION_ENQUEUE_TIMEOUT_S (backpressure) and the
+    # exchange is dropped after that rather than stalling the response.
+    asked_at = datetime.now(timezone.utc)
+    item = {
+        "user_id": user_id,
+        "conversation_id": conversation_id,
+        "title": " ".join(question.split())[:80],
+        "messages": [
+            {
+                "id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "role": "user",
+                "content": question,
+                "tokens": tokens.count(question),
+                "created_at": asked_at,
+            },
+            {
+                "id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "role": "assistant",
+                "content": answer,
+                "tokens": tokens.count(answer),
+                # Keeps the pair ordered even when both land in the same statement.
+                "created_at": asked_at + timedelta(microseconds=1),
+            },
+        ],
+    }
+    try:
+        await asyncio.wait_for(_get_queue().put(item), CONVERSATION_ENQUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        logger.warning("CONVERSATION_QUEUE_FULL conversation_id=%s", conversation_id)
+        return
+    _pending.setdefault(conversation_id, []).append(item)
+
+
+def _settle(items: List[Dict[str, Any]]) -> None:
+    # Written or dropped: either way history no longer takes them from memory.
+    for item in items:
+        left = [queued for queued in _pending.get(item["conversation_id"], []) if queued is not item]
+        if left:
+            _pending[item["conversation_id"]] = left
+        else:
+            _pending.pop(item["conversation_id"], None)
+
+
+# Each flush is three statements regardless of batch size: the rows travel as
+# parallel arrays and unnest() turns them back into a multi-row insert.
+_USERS_SQL = sql_text(
+    """
+    INSERT INTO users (id) SELECT unnest(CAST(:ids AS text[]))
+    ON CONFLICT (id) DO NOTHING
+    """
+)
+_CONVERSATIONS_SQL = sql_text(
+    """
+    INSERT INTO conversations (id, user_id, title)
+    SELECT * FROM unnest(CAST(:ids AS text[]), CAST(:user_ids AS text[]), CAST(:titles AS text[]))
+    ON CONFLICT (id) DO NOTHING
+    """
+)
+# Client-supplied conversation ids are only appended to by their owner: the
+# join drops messages whose conversation belongs to someone else.
+_MESSAGES_SQL = sql_text(
+    """
+    INSERT INTO messages (id, conversation_id, role, content, tokens, created_at)
+    SELECT m.id, m.conversation_id, m.role, m.content, m.tokens, m.created_at
+    FROM unnest(
+        CAST(:ids AS text[]), CAST(:conversation_ids AS text[]), CAST(:user_ids AS text[]),
+        CAST(:roles AS text[]), CAST(:contents AS text[]), CAST(:tokens AS int[]),
+        CAST(:created_ats AS timestamptz[])
+    ) AS m(id, conversation_id, user_id, role, content, tokens, created_at)
+    JOIN conversations c ON c.id = m.conversation_id AND c.user_id = m.user_id
+    """
+)
+
+
+async def _write(items: List[Dict[str, Any]]) -> None:
+    conversations = {}
+    for item in items:
+        conversations.setdefault(item["conversation_id"], (item["user_id"], item["title"]))
+    messages = [message for item in items for message in item["messages"]]
+    async with db_session() as session:
+        await session.execute(_USERS_SQL, {"ids": sorted({item["user_id"] for item in items})})
+        await session.execute(
+            _CONVERSATIONS_SQL,
+            {
+                "ids": list(conversations),
+                "user_ids": [user_id for user_id, _ in conversations.values()],
+                "titles": [title for _, title in conversations.values()],
+            },
+        )
+        await session.execute(
+            _MESSAGES_SQL,
+            {
+                "ids": [m["id"] for m in messages],
+                "conversation_ids": [m["conversation_id"] for m in messages],
+                "user_ids": [m["user_id"] for m in messages],
+                "roles": [m["role"] for m in messages],
+                "contents": [m["content"] for m in messages],
+                "tokens": [m["tokens"] for m in messages],
+                "created_ats": [m["created_at"] for m in messages],
+            },
+        )
+        await session.commit()
+
+
+async def flush() -> None:
+    # Drains the queue in batches of multi-row inserts. A failed batch is put
+    # back while there is room, so a short database outage loses nothing.
+    queue = _get_queue()
+    while not queue.empty():
+        items = []
+        while len(items) < CONVERSATION_FLUSH_BATCH and not queue.empty():
+            items.append(queue.get_nowait())
+        try:
+            await _write(items)
+        except Exception:
+            requeued = 0
+            for item in items:
+                if queue.full():
+                    break
+                queue.put_nowait(item)
+                requeued += 1
+            if requeued < len(items):
+                _settle(items[requeued:])
+                logger.error("CONVERSATION_DROPPED count=%d", len(items) - requeued)
+            raise
+        _settle(items)
+
+
+_HISTORY_SQL = sql_text(
+    """
+    SELECT m.id, m.role, m.content, m.tokens, m.created_at
+    FROM messages m
+    WHERE m.conversation_id = :conversation_id
+      AND EXISTS (SELECT 1 FROM conversations c WHERE c.id = :conversation_id AND c.user_id = :user_id)
+    ORDER BY m.created_at DESC
+    LIMIT :limit
+    """
+)
+
+
+async def history(
+    user_id: str,
+    conversation_id: str,
+    max_turns: int = HISTORY_MAX_TURNS,
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+) -> List[Dict[str, str]]:
+    # The newest turns that fit in token_budget, oldest first. Only the last
+    # max_turns exchanges are read, using the token counts stored per message.
+    async with db_session() as session:
+        rows = (
+            await session.execute(
+                _HISTORY_SQL,
+                {"conversation_id": conversation_id, "user_id": user_id, "limit": 2 * max_turns},
+            )
+        ).all()
+
+    # Exchanges still waiting for the writer are merged in; one committed while
+    # the query ran can show up in both, so messages are matched by id.
+    stored = {row[0] for row in rows}
+    queued = [
+        (m["id"], m["role"], m["content"], m["tokens"], m["created_at"])
+        for item in _pending.get(conversation_id, [])
+        if item["user_id"] == user_id
+        for m in item["messages"]
+        if m["id"] not in stored
+    ]
+    if queued:
+        rows = sorted([*rows, *queued], key=lambda row: row[4], reverse=True)[: 2 * max_turns]
+
+    kept, used = [], 0
+    # Stored counts mean old turns are never re-tokenized.
+    for _, role, content, stored_tokens, _ in rows:
+        used += stored_tokens or tokens.count(content)
+        if used > token_budget:
+            break
+        kept.append({"role": role, "content": content})
+    kept.reverse()
+    # Never open with a reply whose question was trimmed away.
+    while kept and kept[0]["role"] != "user":
+        kept.pop(0)
+    return kept
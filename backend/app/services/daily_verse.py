@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from ..deps import db_session, redis_async
+from ..models import DailyVersePool
+from . import verse_store
+
+logger = logging.getLogger(__name__)
+
+DAILY_VERSE_TRANSLATIONS = [t for t in os.getenv("DAILY_VERSE_TRANSLATIONS", "WEB").split(",") if t]
+DAILY_VERSE_RECENCY_DAYS = int(os.getenv("DAILY_VERSE_RECENCY_DAYS", "60"))
+DAILY_VERSE_PER_USER = os.getenv("DAILY_VERSE_PER_USER", "0") == "1"
+DAILY_VERSE_TTL_S = int(os.getenv("DAILY_VERSE_TTL_S", str(3 * 24 * 3600)))
+DAILY_VERSE_POOL_TTL_S = float(os.getenv("DAILY_VERSE_POOL_TTL_S", "3600"))
+DAILY_VERSE_PRECOMPUTE_INTERVAL_S = float(os.getenv("DAILY_VERSE_PRECOMPUTE_INTERVAL_S", "3600"))
+
+FALLBACK = {"book": 19, "chapter": 23, "verse": 1, "text": "The Lord is my shepherd."}
+
+PoolEntry = Tuple[int, int, int, float]
+
+_pools: Dict[str, Tuple[float, List[PoolEntry]]] = {}
+_pending: set = set()
+# Strong references to queued precomputes; the loop only keeps weak ones.
+_tasks: Set[asyncio.Task] = set()
+
+
+def _pick_key(translation: str, day: date, user_id: Optional[str]) -> str:
+    key = f"dv:{translation}:{day.isoformat()}"
+    return f"{key}:u:{user_id}" if user_id else key
+
+
+def _recent_key(translation: str, user_id: Optional[str]) -> str:
+    key = f"dv:recent:{translation}"
+    return f"{key}:u:{user_id}" if user_id else key
+
+
+def _ref(entry: PoolEntry) -> str:
+    return f"{entry[0]}:{entry[1]}:{entry[2]}"
+
+
+async def _load_pool(translation: str) -> List[PoolEntry]:
+    loaded_at, pool = _pools.get(translation, (0.0, []))
+    if translation in _pools and time.monotonic() - loaded_at < DAILY_VERSE_POOL_TTL_S:
+        return pool
+
+    statement = (
+        select(DailyVersePool.book, DailyVersePool.chapter, DailyVersePool.verse, DailyVersePool.weight)
+        .where(DailyVersePool.translation == translation, DailyVersePool.weight > 0)
+        .order_by(DailyVersePool.book, DailyVersePool.chapter, DailyVersePool.verse)
+    )
+    async with db_session() as session:
+        pool = [tuple(row) for row in (await session.execute(statement)).all()]
+    _pools[translation] = (time.monotonic(), pool)
+    return pool
+
+
+def choose(pool: List[PoolEntry], last_shown: Dict[str, int], day: date, seed: str) -> PoolEntry:
+    # Weighted draw; a verse shown `age` days ago keeps (age / window)^2 of its
+    # weight, so yesterday's pick is all but excluded and old picks recover fully.
+    # Seeded by (translation, day, user) so every worker draws the same verse.
+    today = day.toordinal()
+    weights = []
+    for entry in pool:
+        shown = last_shown.get(_ref(entry))
+        penalty = 1.0 if shown is None else min(1.0, max(0, today - shown) / DAILY_VERSE_RECENCY_DAYS) ** 2
+        weights.append(entry[3] * penalty)
+    if not any(weights):
+        weights = [entry[3] for entry in pool]
+    rng = random.Random(hashlib.sha256(seed.encode("utf-8")).digest())
+    return rng.choices(pool, weights=weights, k=1)[0]
+
+
+async def precompute(translation: str, day: date, user_id: Optional[str] = None) -> Dict[str, Any]:
+    key = _pick_key(translation, day, user_id)
+    existing = await redis_async.get(key)
+    if existing:
+        return json.loads(existing)
+
+    pool = await _load_pool(translation)
+    verse = dict(FALLBACK)
+    recent_key = _recent_key(translation, user_id)
+    if pool:
+        window_start = day.toordinal() - DAILY_VERSE_RECENCY_DAYS
+        recent = await redis_async.zrangebyscore(recent_key, window_start, day.toordinal() - 1, withscores=True)
+        book, chapter, number, _ = choose(pool, {ref: int(score) for ref, score in recent}, day, key)
+        resolved = await verse_store.fetch_passage(translation, book, chapter, number, number)
+        verse = {"book": book, "chapter": chapter, "verse": number, "text": resolved[0]["text"] if resolved else None}
+
+    payload = {"date": day.isoformat(), "translation": translation, "verse": verse}
+    if await redis_async.set(key, json.dumps(payload, ensure_ascii=False), ex=DAILY_VERSE_TTL_S, nx=True):
+        if pool:
+            async with redis_async.pipeline(transaction=False) as pipe:
+                pipe.zadd(recent_key, {f"{verse['book']}:{verse['chapter']}:{verse['verse']}": day.toordinal()})
+                pipe.zremrangebyscore(recent_key, "-inf", day.toordinal() - 2 * DAILY_VERSE_RECENCY_DAYS)
+                pipe.expire(recent_key, 2 * DAILY_VERSE_RECENCY_DAYS * 24 * 3600)
+                await pipe.execute()
+        return payload
+
+    # Another worker stored the same day first; serve its pick.
+    existing = await redis_async.get(key)
+    return json.loads(existing) if existing else payload
+
+
+def _precompute_later(translation: str, day: date, user_id: str) -> None:
+    key = _pick_key(translation, day, user_id)
+    if key in _pending:
+        return
+    _pending.add(key)
+
+    async def run() -> None:
+        try:
+            await precompute(translation, day, user_id)
+        except Exception:
+            logger.warning("DAILY_VERSE_PRECOMPUTE_FAILED", exc_info=True)
+        finally:
+            _pending.discard(key)
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def get(translation: str, day: date, user_id: Optional[str] = None) -> Dict[str, Any]:
+    # Hot path: one Redis GET. The global pick is precomputed by the background
+    # job; a per-user pick is computed on its first read and tomorrow's is queued.
+    if not DAILY_VERSE_PER_USER:
+        user_id = None
+    cached = await redis_async.get(_pick_key(translation, day, user_id))
+    if cached:
+        payload = json.loads(cached)
+    else:
+        payload = await precompute(translation, day, user_id)
+    if user_id:
+        _precompute_later(translation, day + timedelta(days=1), user_id)
+    return payload
+
+
+async def precompute_upcoming() -> None:
+    today = date.today()
+    for translation in DAILY_VERSE_TRANSLATIONS:
+        for offset in (0, 1):
+            await precompute(translation, today + timedelta(days=offset))
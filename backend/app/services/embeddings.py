@@ -0,0 +1,88 @@
+import hashlib
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, List, Type
+
+from ..vector_config import EMBED_DIM
+from . import llm
+
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "openai")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")
+EMBED_TIMEOUT_S = float(os.getenv("EMBED_TIMEOUT_S", "2.0"))
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+class EmbeddingBackend(ABC):
+    name = "base"
+
+    def __init__(self, dim: int = EMBED_DIM) -> None:
+        self.dim = dim
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def embed(self, texts: List[str], timeout: float | None = None) -> List[List[float]]:
+        ...
+
+
+class OpenAIBackend(EmbeddingBackend):
+    name = "openai"
+
+    def available(self) -> bool:
+        return llm.get_client() is not None
+
+    async def embed(self, texts: List[str], timeout: float | None = None) -> List[List[float]]:
+        client = llm.get_client()
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY is not set")
+        kwargs = {"model": EMBED_MODEL, "input": texts}
+        if self.dim != 1536:
+            kwargs["dimensions"] = self.dim
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        resp = await client.embeddings.create(**kwargs)
+        return [list(item.embedding) for item in sorted(resp.data, key=lambda item: item.index)]
+
+
+class LocalBackend(EmbeddingBackend):
+    # Deterministic feature-hashing embedder (words + bigrams, signed buckets).
+    # No network and stable across processes, so offline runs are reproducible;
+    # texts that share vocabulary land close together.
+    name = "local"
+
+    def _bucket(self, feature: str) -> tuple:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        return value % self.dim, 1.0 if (value >> 63) & 1 else -1.0
+
+    def _embed_one(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        words = _WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for feature in features:
+            index, sign = self._bucket(feature)
+            vec[index] += sign
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        return [x / norm for x in vec]
+
+    async def embed(self, texts: List[str], timeout: float | None = None) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+
+BACKENDS: Dict[str, Type[EmbeddingBackend]] = {
+    OpenAIBackend.name: OpenAIBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str = EMBED_BACKEND) -> EmbeddingBackend:
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"unknown embedding backend {name!r}; choose from {sorted(BACKENDS)}") from None
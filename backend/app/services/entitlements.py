@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from ..deps import db_session, redis_async
+from ..models import Subscription
+
+logger = logging.getLogger(__name__)
+
+ENTITLEMENT_LOCAL_TTL_S = float(os.getenv("ENTITLEMENT_LOCAL_TTL_S", "30"))
+ENTITLEMENT_LOCAL_MAX = int(os.getenv("ENTITLEMENT_LOCAL_MAX", "10000"))
+ENTITLEMENT_REDIS_TTL_S = int(os.getenv("ENTITLEMENT_REDIS_TTL_S", str(7 * 24 * 3600)))
+ENTITLEMENT_NEGATIVE_TTL_S = int(os.getenv("ENTITLEMENT_NEGATIVE_TTL_S", "600"))
+
+INVALIDATE_CHANNEL = "entitlement:invalidate"
+
+
+def _redis_key(user_id: str) -> str:
+    return f"entitlement:{user_id}"
+
+
+class _LocalCache:
+    # Per-process TTL + LRU map; bounded so a flood of distinct users cannot grow it.
+
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_local = _LocalCache(ENTITLEMENT_LOCAL_TTL_S, ENTITLEMENT_LOCAL_MAX)
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def from_subscription(subscription: Subscription | None) -> Dict[str, Any]:
+    if subscription is None:
+        return {"status": "none", "expires_at": None}
+    expires_at = subscription.expires_at
+    return {
+        "status": subscription.status,
+        "expires_at": _as_utc(expires_at).isoformat() if expires_at is not None else None,
+    }
+
+
+def is_active(entitlement: Dict[str, Any]) -> bool:
+    if entitlement.get("status") != "active":
+        return False
+    expires_at = entitlement.get("expires_at")
+    if expires_at is None:
+        return True
+    return _as_utc(datetime.fromisoformat(expires_at)) > datetime.now(timezone.utc)
+
+
+def _redis_ttl(entitlement: Dict[str, Any]) -> int:
+    if not is_active(entitlement):
+        return ENTITLEMENT_NEGATIVE_TTL_S
+    expires_at = entitlement.get("expires_at")
+    if expires_at is None:
+        return ENTITLEMENT_REDIS_TTL_S
+    remaining = (_as_utc(datetime.fromisoformat(expires_at)) - datetime.now(timezone.utc)).total_seconds()
+    return max(1, min(ENTITLEMENT_REDIS_TTL_S, int(remaining)))
+
+
+# KEYS: entitlement; ARGV: expected value, new value, ttl. Replaces the value
+# only if it is still the one we read.
+_REPLACE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return nil
+"""
+
+_replace_script = redis_async.register_script(_REPLACE_LUA)
+
+
+async def _load_from_db(user_id: str) -> Dict[str, Any]:
+    async with db_session() as session:
+        return from_subscription(await session.get(Subscription, user_id))
+
+
+async def lookup(user_id: str) -> Dict[str, Any]:
+    # Process cache -> Redis -> Postgres. The stored record keeps the raw status
+    # and expiry; whether it is still active is decided at read time.
+    entitlement = _local.get(user_id)
+    if entitlement is not None:
+        return entitlement
+
+    try:
+        raw = await redis_async.get(_redis_key(user_id))
+    except RedisError:
+        logger.warning("ENTITLEMENT_CACHE_UNAVAILABLE")
+        raw = None
+    if raw:
+        try:
+            entitlement = json.loads(raw)
+        except ValueError:
+            entitlement = None
+    if isinstance(entitlement, dict):
+        _local.set(user_id, entitlement)
+        return entitlement
+
+    entitlement = await _load_from_db(user_id)
+    try:
+        # Only fills an empty key, or replaces the exact unreadable value seen
+        # above, so a concurrent publish() from /iap/verify is never
+        # overwritten by the older row this request read.
+        if raw:
+            await _replace_script(
+                keys=[_redis_key(user_id)], args=[raw, json.dumps(entitlement), _redis_ttl(entitlement)]
+            )
+        else:
+            await redis_async.set(_redis_key(user_id), json.dumps(entitlement), ex=_redis_ttl(entitlement), nx=True)
+    except RedisError:
+        logger.warning("ENTITLEMENT_CACHE_UNAVAILABLE")
+    _local.set(user_id, entitlement)
+    return entitlement
+
+
+async def publish(user_id: str, entitlement: Dict[str, Any]) -> None:
+    # Called after a subscription row changes: refresh Redis, then tell every
+    # worker to drop its local copy.
+    # The subscription is already committed, so a Redis failure only leaves
+    # other workers on the old entry until its TTL runs out.
+    _local.pop(user_id)
+    try:
+        await redis_async.set(_redis_key(user_id), json.dumps(entitlement), ex=_redis_ttl(entitlement))
+        await redis_async.publish(INVALIDATE_CHANNEL, user_id)
+    except RedisError:
+        logger.warning("ENTITLEMENT_CACHE_UNAVAILABLE user_id=%s", user_id)
+
+
+async def listen() -> None:
+    pubsub = redis_async.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(INVALIDATE_CHANNEL)
+    # Invalidations sent while we were not subscribed are lost, so start clean.
+    _local.clear()
+    try:
+        async for message in pubsub.listen():
+            if message.get("type") == "message":
+                _local.pop(message["data"])
+    finally:
+        await pubsub.aclose()
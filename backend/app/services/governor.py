@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from ..deps import redis_async
+
+logger = logging.getLogger(__name__)
+
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+# Daily spend ceiling across all workers, in USD.
+OPENAI_BUDGET_USD = float(os.getenv("OPENAI_BUDGET_USD", "50"))
+LLM_PRICE_INPUT_PER_1K = float(os.getenv("LLM_PRICE_INPUT_PER_1K", "0.00015"))
+LLM_PRICE_OUTPUT_PER_1K = float(os.getenv("LLM_PRICE_OUTPUT_PER_1K", "0.0006"))
+LLM_GOVERNOR_MAX_WAIT_S = float(os.getenv("LLM_GOVERNOR_MAX_WAIT_S", "2.0"))
+
+_MICROS = 1_000_000
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+# KEYS: tokens-per-minute counter for the current minute, daily spend counter
+# ARGV: tokens, cost (micro-USD), tpm limit, budget (micro-USD), seconds left in the minute
+# Returns {0, 0} when admitted, {1, retry_after} when the minute is full,
+# {2, 0} when the daily budget is spent. Nothing is reserved unless admitted.
+_RESERVE_LUA = """
+local spent = tonumber(redis.call('GET', KEYS[2]) or '0')
+if spent + tonumber(ARGV[2]) > tonumber(ARGV[4]) then
+  return {2, 0}
+end
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used > 0 and used + tonumber(ARGV[1]) > tonumber(ARGV[3]) then
+  return {1, tonumber(ARGV[5])}
+end
+redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('INCRBY', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[2], 172800)
+return {0, 0}
+"""
+
+_reserve_script = redis_async.register_script(_RESERVE_LUA)
+
+
+def cost_micros(prompt_tokens: int, completion_tokens: int) -> int:
+    usd = prompt_tokens / 1000 * LLM_PRICE_INPUT_PER_1K + completion_tokens / 1000 * LLM_PRICE_OUTPUT_PER_1K
+    return math.ceil(usd * _MICROS)
+
+
+def _keys(now: float) -> Dict[str, str]:
+    minute = int(now // 60)
+    return {"tpm": f"llm:tpm:{minute}", "spend": f"llm:spend:{date.today().isoformat()}"}
+
+
+async def reserve(prompt_tokens: int, max_output_tokens: int) -> Optional[Dict]:
+    # Admits one completion against the shared limits, assuming the worst case
+    # of max_output_tokens; settle() returns the unused part afterwards.
+    # Waits (queues) up to LLM_GOVERNOR_MAX_WAIT_S for the next minute, then
+    # sheds with 503 + Retry-After. Returns None when Redis is unreachable.
+    tokens = prompt_tokens + max_output_tokens
+    cost = cost_micros(prompt_tokens, max_output_tokens)
+    deadline = time.monotonic() + LLM_GOVERNOR_MAX_WAIT_S
+    while True:
+        now = time.time()
+        keys = _keys(now)
+        retry_after = 60 - now % 60
+        try:
+            status, _ = await _reserve_script(
+                keys=[keys["tpm"], keys["spend"]],
+                args=[tokens, cost, LLM_TPM_LIMIT, int(OPENAI_BUDGET_USD * _MICROS), math.ceil(retry_after)],
+            )
+        except RedisError:
+            logger.warning("LLM_GOVERNOR_UNAVAILABLE")
+            return None
+
+        if status == 0:
+            return {"keys": keys, "tokens": tokens, "cost": cost}
+        if status == 2:
+            logger.warning("LLM_BUDGET_EXHAUSTED")
+            raise BudgetExhausted()
+        if time.monotonic() + retry_after > deadline:
+            logger.warning("LLM_TPM_SHED retry_after=%.1f", retry_after)
+            raise HTTPException(
+                status_code=503, detail="llm_busy", headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+        await asyncio.sleep(retry_after)
+
+
+async def settle(reservation: Optional[Dict], prompt_tokens: int, completion_tokens: int) -> None:
+    # Replaces the worst-case reservation with actual usage.
+    if reservation is None:
+        return
+    tokens_delta = prompt_tokens + completion_tokens - reservation["tokens"]
+    cost_delta = cost_micros(prompt_tokens, completion_tokens) - reservation["cost"]
+    try:
+        async with redis_async.pipeline(transaction=False) as pipe:
+            pipe.incrby(reservation["keys"]["tpm"], tokens_delta)
+            pipe.incrby(reservation["keys"]["spend"], cost_delta)
+            await pipe.execute()
+    except RedisError:
+        logger.warning("LLM_GOVERNOR_UNAVAILABLE")
+
+
+async def stats() -> Dict:
+    keys = _keys(time.time())
+    tpm, spend = await redis_async.mget([keys["tpm"], keys["spend"]])
+    return {
+        "tpm_used": int(tpm or 0),
+        "tpm_limit": LLM_TPM_LIMIT,
+        "spend_usd": int(spend or 0) / _MICROS,
+        "budget_usd": OPENAI_BUDGET_USD,
+    }
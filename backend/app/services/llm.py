@@ -1,74 +1,312 @@
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any, Tuple
+import time
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 
+import httpx
 from fastapi import HTTPException
-from openai import OpenAI
+from openai import AsyncOpenAI
 from openai import APIStatusError, APITimeoutError, AuthenticationError, RateLimitError
 
+from .. import metrics
+from . import breaker, governor, tokens
+
 SYSTEM = ("You are a respectful Bible assistant. Always cite at least two verses in 'Book Chapter:Verse' format. "
           "Keep quotes concise. English only. Do not invent references.")
 
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "3000"))
+LLM_MAX_PASSAGES = int(os.getenv("LLM_MAX_PASSAGES", "12"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "600"))
+# Whole-call deadline for /chat (hedges included) and time-to-first-token
+# deadline for /chat/stream; both well under the SDK's own LLM_TIMEOUT_S.
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "15"))
+LLM_FIRST_TOKEN_DEADLINE_S = float(os.getenv("LLM_FIRST_TOKEN_DEADLINE_S", "8"))
+# Start a second identical completion if the first has not finished after
+# this many seconds (0 disables); the first one to succeed is used.
+LLM_HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))
+
 logger = logging.getLogger(__name__)
 
+_client: AsyncOpenAI | None = None
+
+
+def init_client() -> AsyncOpenAI | None:
+    global _client
+    api_key = os.getenv("OPENAI_API_KEY")
+    if _client is None and api_key:
+        _client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=LLM_TIMEOUT_S,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                ),
+                timeout=LLM_TIMEOUT_S,
+            ),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def get_client() -> AsyncOpenAI | None:
+    return _client or init_client()
+
 
 def _format_passage(passage: Dict[str, Any]) -> str:
     return f"{passage['translation']} {passage['book']}:{passage['chapter']}:{passage['verse']}"
 
 
+def citations_for(passages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return passages[:2]
+
+
+_UNAVAILABLE = "I am unavailable right now. Please try again later."
+_OFFLINE_INTRO = "I cannot access the language model right now."
+
+
 def _offline_reply(passages: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
     if not passages:
-        return "I am unavailable right now. Please try again later.", []
+        return _UNAVAILABLE, []
 
     refs = [
         f"{_format_passage(p)} — {p['text']}" if p.get("text") else _format_passage(p)
         for p in passages[:2]
     ]
-    intro = "I cannot access the language model right now."
-    ans = f"{intro} Consider these passages:\n" + "\n".join(refs)
-    return ans, passages[:2]
-
-
-async def answer(q: str, passages: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
-    ctx_passages = passages[:6]
-    ctx_lines = [f"- {_format_passage(p)} — {p['text']}" for p in ctx_passages if p.get("text")]
-    prompt = (
-        "Answer the user's question using the verses below. Cite at least two verses.\n\n"
-        + "\n".join(ctx_lines)
-        + f"\n\nQuestion: {q}"
+    ans = f"{_OFFLINE_INTRO} Consider these passages:\n" + "\n".join(refs)
+    return ans, citations_for(passages)
+
+
+def is_offline_reply(text: str) -> bool:
+    # Offline replies must not be cached as if the model had answered.
+    return text == _UNAVAILABLE or text.startswith(_OFFLINE_INTRO)
+
+
+_PROMPT_HEAD = "Answer the user's question using the verses below. Cite at least two verses.\n\n"
+
+
+def build_prompt(
+    q: str, passages: List[Dict[str, Any]], history: Optional[List[Dict[str, str]]] = None
+) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]], int]:
+    # Packs the prompt into LLM_PROMPT_TOKEN_BUDGET: the system prompt and the
+    # question always go in; passages are added in retrieval order while they
+    # fit, then as many of the newest history turns as the remainder allows.
+    # Returns (messages, passages used, prompt tokens).
+    question = f"\n\nQuestion: {q}"
+    used = (
+        tokens.count_message({"content": SYSTEM})
+        + tokens.count_message({"content": _PROMPT_HEAD})
+        + tokens.count(question)
     )
+    ctx_passages, ctx_lines = [], []
+    for p in passages[:LLM_MAX_PASSAGES]:
+        if not p.get("text"):
+            continue
+        line = f"- {_format_passage(p)} — {p['text']}"
+        cost = tokens.count(line) + 1
+        if used + cost > LLM_PROMPT_TOKEN_BUDGET:
+            continue
+        used += cost
+        ctx_passages.append(p)
+        ctx_lines.append(line)
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return _offline_reply(ctx_passages)
+    turns: List[Dict[str, str]] = []
+    for message in reversed(history or []):
+        cost = tokens.count_message(message)
+        if used + cost > LLM_PROMPT_TOKEN_BUDGET:
+            break
+        used += cost
+        turns.append(message)
+    turns.reverse()
+    while turns and turns[0]["role"] != "user":
+        used -= tokens.count_message(turns.pop(0))
 
-    client = OpenAI(api_key=api_key)
-    model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    messages = [
+        {"role": "system", "content": SYSTEM},
+        *turns,
+        {"role": "user", "content": _PROMPT_HEAD + "\n".join(ctx_lines) + question},
+    ]
+    return messages, ctx_passages, used
+
+
+def _observe(model: str, mode: str, elapsed: float, prompt_tokens: int, completion_tokens: int) -> None:
+    metrics.LLM_REQUEST.observe(elapsed, model, mode)
+    metrics.LLM_TOKENS.inc(prompt_tokens, model, "prompt")
+    metrics.LLM_TOKENS.inc(completion_tokens, model, "completion")
+    metrics.record("llm", elapsed)
+
+
+def _llm_http_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, (APITimeoutError, TimeoutError)):
+        logger.error("LLM_TIMEOUT")
+        return HTTPException(status_code=504, detail="llm_timeout")
+    if isinstance(exc, RateLimitError):
+        # The governor should keep us under the limits; if OpenAI still throttles,
+        # tell the client when to come back instead of reporting a failure.
+        logger.error("LLM_RATE_LIMITED")
+        retry_after = exc.response.headers.get("retry-after") or "5"
+        return HTTPException(status_code=503, detail="llm_busy", headers={"Retry-After": retry_after})
+    if isinstance(exc, AuthenticationError):
+        logger.error("LLM_AUTH_RATE")
+        return HTTPException(status_code=502, detail="llm_unavailable")
+    if isinstance(exc, APIStatusError):
+        logger.error("LLM_STATUS_%s", exc.status_code)
+        if exc.status_code == 401:
+            return HTTPException(status_code=502, detail="llm_unavailable")
+        return HTTPException(status_code=502, detail="llm_error")
+    logger.error("LLM_GENERAL")
+    return HTTPException(status_code=502, detail="llm_error")
+
+
+async def _complete(client: AsyncOpenAI, model: str, messages: List[Dict[str, str]], prompt_tokens: int, mode: str):
+    # One completion under its own governor reservation. Raises
+    # BudgetExhausted / HTTPException(503) when the governor will not admit it.
+    with metrics.stage("llm_governor"):
+        reservation = await governor.reserve(prompt_tokens, LLM_MAX_OUTPUT_TOKENS)
+    completion_tokens, resp = 0, None
+    started = time.perf_counter()
     try:
-        resp = client.chat.completions.create(
+        resp = await client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": SYSTEM},
-                {"role": "user", "content": prompt},
-            ],
+            messages=messages,
             temperature=0.3,
+            max_tokens=LLM_MAX_OUTPUT_TOKENS,
         )
-    except APITimeoutError:
-        logger.error("LLM_TIMEOUT")
-        raise HTTPException(status_code=504, detail="llm_timeout")
-    except (AuthenticationError, RateLimitError):
-        logger.error("LLM_AUTH_RATE")
-        raise HTTPException(status_code=502, detail="llm_unavailable")
-    except APIStatusError as exc:
-        if exc.status_code in (401, 429):
-            logger.error("LLM_STATUS_%s", exc.status_code)
-            raise HTTPException(status_code=502, detail="llm_unavailable")
-        logger.error("LLM_STATUS_%s", exc.status_code)
-        raise HTTPException(status_code=502, detail="llm_error")
-    except Exception:
-        logger.error("LLM_GENERAL")
-        raise HTTPException(status_code=502, detail="llm_error")
+        return resp
+    finally:
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens or 0
+        _observe(model, mode, time.perf_counter() - started, prompt_tokens, completion_tokens)
+        await governor.settle(reservation, prompt_tokens, completion_tokens)
+
+
+async def _hedged(client: AsyncOpenAI, model: str, messages: List[Dict[str, str]], prompt_tokens: int):
+    primary = asyncio.create_task(_complete(client, model, messages, prompt_tokens, "complete"))
+    if LLM_HEDGE_AFTER_S <= 0:
+        return await primary
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=LLM_HEDGE_AFTER_S)
+        if not done:
+            metrics.record("llm_hedge", 0.0)
+            tasks.add(asyncio.create_task(_complete(client, model, messages, prompt_tokens, "hedge")))
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Both failed (a hedge the governor refused counts as failed): report the primary.
+        return primary.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def answer(
+    q: str, passages: List[Dict[str, Any]], history: Optional[List[Dict[str, str]]] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    messages, ctx_passages, prompt_tokens = build_prompt(q, passages, history)
+    client = get_client()
+    if client is None:
+        return _offline_reply(ctx_passages or passages)
+    permit = await breaker.acquire()
+    if permit is None:
+        # Circuit open: answer from the retrieved passages without waiting on OpenAI.
+        return _offline_reply(ctx_passages or passages)
+
+    model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(LLM_DEADLINE_S):
+            resp = await _hedged(client, model, messages, prompt_tokens)
+    except governor.BudgetExhausted:
+        await breaker.release(permit)
+        return _offline_reply(ctx_passages or passages)
+    except HTTPException:
+        await breaker.release(permit)
+        raise
+    except Exception as exc:
+        await breaker.record(permit, True, time.perf_counter() - started)
+        raise _llm_http_error(exc) from exc
+    await breaker.record(permit, False, time.perf_counter() - started)
 
     choices = getattr(resp, "choices", [])
     text = choices[0].message.content if choices else ""
-    return text, ctx_passages[:2]
+    return text, citations_for(ctx_passages)
+
+
+async def _open_stream(client: AsyncOpenAI, model: str, messages: List[Dict[str, str]]):
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=LLM_MAX_OUTPUT_TOKENS,
+        stream=True,
+    )
+    chunks = stream.__aiter__()
+    return chunks, await anext(chunks, None)
+
+
+async def stream_answer(
+    q: str, passages: List[Dict[str, Any]], history: Optional[List[Dict[str, str]]] = None
+) -> AsyncIterator[str]:
+    messages, ctx_passages, prompt_tokens = build_prompt(q, passages, history)
+    client = get_client()
+    permit = await breaker.acquire() if client is not None else None
+    if permit is None:
+        text, _ = _offline_reply(ctx_passages or passages)
+        yield text
+        return
+
+    try:
+        with metrics.stage("llm_governor"):
+            reservation = await governor.reserve(prompt_tokens, LLM_MAX_OUTPUT_TOKENS)
+    except governor.BudgetExhausted:
+        await breaker.release(permit)
+        text, _ = _offline_reply(ctx_passages or passages)
+        yield text
+        return
+    except HTTPException:
+        await breaker.release(permit)
+        raise
+
+    # Streamed answers are not hedged (the user already sees the first
+    # attempt); the deadline covers the request and its first chunk, and the
+    # breaker records that outcome.
+    model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    parts: List[str] = []
+    started = time.perf_counter()
+    try:
+        try:
+            chunks, first = await asyncio.wait_for(_open_stream(client, model, messages), LLM_FIRST_TOKEN_DEADLINE_S)
+        except Exception:
+            await breaker.record(permit, True, time.perf_counter() - started)
+            raise
+        await breaker.record(permit, False, time.perf_counter() - started)
+        if first is None:
+            return
+        metrics.LLM_FIRST_TOKEN.observe(time.perf_counter() - started, model)
+        chunk = first
+        while chunk is not None:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+            chunk = await anext(chunks, None)
+    except Exception as exc:
+        raise _llm_http_error(exc) from exc
+    finally:
+        completion_tokens = tokens.count("".join(parts))
+        _observe(model, "stream", time.perf_counter() - started, prompt_tokens, completion_tokens)
+        await governor.settle(reservation, prompt_tokens, completion_tokens)
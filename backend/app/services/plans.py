@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, or_, select
+from sqlalchemy import text as sql_text
+
+from .. import http_cache
+from ..deps import db_session, redis_async
+from ..models import PlanDay, PlanProgress, ReadingPlan
+from . import verse_store
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_TTL_S = float(os.getenv("PLAN_CACHE_TTL_S", "3600"))
+PLAN_CACHE_MAX = int(os.getenv("PLAN_CACHE_MAX", "256"))
+PLAN_TRANSLATIONS = {t for t in os.getenv("PLAN_TRANSLATIONS", "WEB").split(",") if t}
+PLAN_PROGRESS_FLUSH_INTERVAL_S = float(os.getenv("PLAN_PROGRESS_FLUSH_INTERVAL_S", "5"))
+PLAN_PROGRESS_FLUSH_BATCH = int(os.getenv("PLAN_PROGRESS_FLUSH_BATCH", "500"))
+PLAN_PROGRESS_PENDING_TTL_S = int(os.getenv("PLAN_PROGRESS_PENDING_TTL_S", str(24 * 3600)))
+
+_DIRTY_KEY = "plan_progress:dirty"
+
+
+class RenderedPlan:
+    # Every response body of one plan in one translation, serialized once with
+    # its ETag. Requests only pick bytes out of these dicts.
+
+    def __init__(self, plan_id: str, key: str, day_count: int) -> None:
+        self.id = plan_id
+        self.key = key
+        self.day_count = day_count
+        self.summary: Tuple[bytes, str] = (b"", "")
+        self.days: Dict[int, Tuple[bytes, str]] = {}
+
+
+# LRU, bounded by PLAN_CACHE_MAX; locks only exist while a load is running.
+_plans: "OrderedDict[Tuple[str, str], Tuple[float, RenderedPlan]]" = OrderedDict()
+_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+
+def normalize_refs(refs: Any) -> List[list]:
+    # Stored refs are {"John": [[1, 1, 18]]} (book -> [chapter, start, end]);
+    # older rows and the API use flat [["John", 1, 1, 18]].
+    if isinstance(refs, str):
+        refs = json.loads(refs)
+    if isinstance(refs, dict):
+        return [[book, *span] for book, spans in refs.items() for span in spans]
+    return [list(ref) for ref in refs]
+
+
+async def _resolve(translation: str, ref: list) -> Dict[str, Any]:
+    book, chapter, start, end = ref[0], int(ref[1]), int(ref[2]), int(ref[3])
+    book_no = verse_store.book_number(book)
+    verses = await verse_store.fetch_passage(translation, book_no, chapter, start, end) if book_no else []
+    return {
+        "book": book,
+        "book_number": book_no,
+        "chapter": chapter,
+        "start": start,
+        "end": end,
+        "text": " ".join(v["text"] for v in verses),
+        "verses": [{"verse": v["verse"], "text": v["text"]} for v in verses],
+    }
+
+
+async def _load(plan_ref: str, translation: str) -> Optional[RenderedPlan]:
+    async with db_session() as session:
+        plan = (
+            await session.execute(select(ReadingPlan).where(or_(ReadingPlan.key == plan_ref, ReadingPlan.id == plan_ref)))
+        ).scalar_one_or_none()
+        if plan is None:
+            return None
+        days = (
+            await session.execute(
+                select(PlanDay.day_number, PlanDay.refs).where(PlanDay.plan_id == plan.id).order_by(PlanDay.day_number)
+            )
+        ).all()
+
+    rendered = RenderedPlan(plan.id, plan.key, max(plan.days, days[-1][0] if days else 0))
+    outline = []
+    for day_number, refs in days:
+        refs = normalize_refs(refs)
+        outline.append({"day": day_number, "refs": refs})
+        passages = [await _resolve(translation, ref) for ref in refs]
+        rendered.days[day_number] = http_cache.render(
+            {"plan": plan.key, "day": day_number, "translation": translation, "refs": refs, "passages": passages}
+        )
+    rendered.summary = http_cache.render(
+        {
+            "id": plan.id,
+            "key": plan.key,
+            "title": plan.title,
+            "description": plan.description,
+            "lang": plan.lang,
+            "translation": translation,
+            "day_count": rendered.day_count,
+            "days": outline,
+        }
+    )
+    return rendered
+
+
+def _cached(cache_key: Tuple[str, str]) -> Optional[RenderedPlan]:
+    cached = _plans.get(cache_key)
+    if cached is None or time.monotonic() - cached[0] >= PLAN_CACHE_TTL_S:
+        return None
+    _plans.move_to_end(cache_key)
+    return cached[1]
+
+
+async def get_plan(plan_ref: str, translation: str = "WEB") -> Optional[RenderedPlan]:
+    # Plans are immutable once published, so each worker resolves a plan once
+    # per TTL. The lock keeps a start-of-day burst to a single load.
+    if translation not in PLAN_TRANSLATIONS:
+        return None
+    cache_key = (plan_ref, translation)
+    cached = _cached(cache_key)
+    if cached is not None:
+        return cached
+
+    lock = _locks.setdefault(cache_key, asyncio.Lock())
+    async with lock:
+        cached = _cached(cache_key)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        try:
+            plan = await _load(plan_ref, translation)
+        finally:
+            if _locks.get(cache_key) is lock:
+                del _locks[cache_key]
+        if plan is None:
+            return None
+        _plans[cache_key] = (time.monotonic(), plan)
+        while len(_plans) > PLAN_CACHE_MAX:
+            _plans.popitem(last=False)
+        logger.info(
+            "PLAN_LOADED key=%s translation=%s days=%d ms=%.1f",
+            plan.key, translation, len(plan.days), (time.perf_counter() - started) * 1000,
+        )
+        return plan
+
+
+# (id, day_count) per plan key or id, for the progress endpoints: they never
+# need the rendered passages, nor a translation.
+_outlines: "OrderedDict[str, Tuple[float, Tuple[str, int]]]" = OrderedDict()
+
+
+async def plan_outline(plan_ref: str) -> Optional[Tuple[str, int]]:
+    cached = _outlines.get(plan_ref)
+    if cached is not None and time.monotonic() - cached[0] < PLAN_CACHE_TTL_S:
+        _outlines.move_to_end(plan_ref)
+        return cached[1]
+    async with db_session() as session:
+        row = (
+            await session.execute(
+                select(ReadingPlan.id, func.greatest(ReadingPlan.days, func.coalesce(func.max(PlanDay.day_number), 0)))
+                .outerjoin(PlanDay, PlanDay.plan_id == ReadingPlan.id)
+                .where(or_(ReadingPlan.key == plan_ref, ReadingPlan.id == plan_ref))
+                .group_by(ReadingPlan.id)
+            )
+        ).first()
+    if row is None:
+        return None
+    outline = (row[0], int(row[1]))
+    _outlines[plan_ref] = (time.monotonic(), outline)
+    while len(_outlines) > PLAN_CACHE_MAX:
+        _outlines.popitem(last=False)
+    return outline
+
+
+_UPSERT_SQL = sql_text(
+    """
+    INSERT INTO plan_progress (user_id, plan_id, day_number, completed_at)
+    VALUES (:user_id, :plan_id, :day_number, now())
+    ON CONFLICT (user_id, plan_id, day_number) DO NOTHING
+    """
+)
+
+
+def _member(user_id: str, plan_id: str, day_number: int) -> str:
+    return f"{plan_id}|{day_number}|{user_id}"
+
+
+def _pending_key(user_id: str, plan_id: str) -> str:
+    return f"plan_progress:{plan_id}:{user_id}"
+
+
+async def _upsert(rows: List[Dict]) -> None:
+    async with db_session() as session:
+        await session.execute(_UPSERT_SQL, rows)
+        await session.commit()
+
+
+async def mark_complete(user_id: str, plan_id: str, day_number: int) -> None:
+    # One round trip per tap: the dirty set feeds the flusher, and the per-user
+    # pending set makes the tap visible to reads before it is flushed.
+    try:
+        async with redis_async.pipeline(transaction=False) as pipe:
+            pipe.sadd(_DIRTY_KEY, _member(user_id, plan_id, day_number))
+            pipe.sadd(_pending_key(user_id, plan_id), day_number)
+            pipe.expire(_pending_key(user_id, plan_id), PLAN_PROGRESS_PENDING_TTL_S)
+            await pipe.execute()
+    except RedisError:
+        logger.warning("PLAN_PROGRESS_BUFFER_UNAVAILABLE")
+        await _upsert([{"user_id": user_id, "plan_id": plan_id, "day_number": day_number}])
+
+
+async def completed_days(user_id: str, plan_id: str) -> List[int]:
+    async with db_session() as session:
+        stored = (
+            await session.execute(
+                select(PlanProgress.day_number).where(PlanProgress.user_id == user_id, PlanProgress.plan_id == plan_id)
+            )
+        ).scalars().all()
+    days: Set[int] = set(stored)
+    try:
+        days.update(int(day) for day in await redis_async.smembers(_pending_key(user_id, plan_id)))
+    except RedisError:
+        logger.warning("PLAN_PROGRESS_BUFFER_UNAVAILABLE")
+    return sorted(days)
+
+
+async def flush() -> None:
+    # Write-behind: drain the dirty set in batches, one multi-row upsert each.
+    while True:
+        members = await redis_async.spop(_DIRTY_KEY, PLAN_PROGRESS_FLUSH_BATCH)
+        if not members:
+            return
+
+        rows = []
+        for member in members:
+            plan_id, day_number, user_id = member.split("|", 2)
+            rows.append({"user_id": user_id, "plan_id": plan_id, "day_number": int(day_number)})
+
+        try:
+            await _upsert(rows)
+        except Exception:
+            await redis_async.sadd(_DIRTY_KEY, *members)
+            raise
+
+        if len(members) < PLAN_PROGRESS_FLUSH_BATCH:
+            return
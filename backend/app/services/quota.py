@@ -0,0 +1,185 @@
+import logging
+import os
+from datetime import date
+from typing import Dict, List
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from sqlalchemy import text as sql_text
+
+from ..deps import db_session, redis_async
+
+logger = logging.getLogger(__name__)
+
+FREE_LIMIT = int(os.getenv("FREE_LIMIT", "4"))
+QUOTA_KEY_TTL_S = int(os.getenv("QUOTA_KEY_TTL_S", str(2 * 24 * 3600)))
+QUOTA_FLUSH_INTERVAL_S = float(os.getenv("QUOTA_FLUSH_INTERVAL_S", "5"))
+QUOTA_FLUSH_BATCH = int(os.getenv("QUOTA_FLUSH_BATCH", "500"))
+# What consume() does when Redis is unreachable: "db" counts in Postgres
+# directly (slower, still exact), "closed" answers 503, "open" lets the
+# message through uncounted.
+QUOTA_REDIS_DOWN_POLICY = os.getenv("QUOTA_REDIS_DOWN_POLICY", "db")
+
+_DIRTY_KEY = "quota:dirty"
+
+# KEYS: counter, dirty set
+# ARGV: limit, ttl, member
+# Returns the new count, -1 without incrementing when the limit is reached,
+# or -2 when the counter does not exist yet and must be seeded from Postgres.
+# A counter that was written without a TTL (a manual or bench seed) gets one.
+_CONSUME_LUA = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+  return -2
+end
+local used = tonumber(current)
+if used >= tonumber(ARGV[1]) then
+  return -1
+end
+used = redis.call('INCR', KEYS[1])
+if redis.call('TTL', KEYS[1]) < 0 then
+  redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+redis.call('SADD', KEYS[2], ARGV[3])
+return used
+"""
+
+# KEYS: counter, dirty set
+# ARGV: member
+_REFUND_LUA = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used > 0 then
+  used = redis.call('DECR', KEYS[1])
+  redis.call('SADD', KEYS[2], ARGV[1])
+end
+return used
+"""
+
+_consume_script = redis_async.register_script(_CONSUME_LUA)
+_refund_script = redis_async.register_script(_REFUND_LUA)
+
+_SEED_SQL = sql_text("SELECT messages_used FROM quotas WHERE user_id = :user_id AND date = :date")
+
+# Redis-down fallbacks: the same check-and-increment, done by Postgres.
+_DB_CONSUME_SQL = sql_text(
+    """
+    INSERT INTO quotas (user_id, date, messages_used, updated_at)
+    VALUES (:user_id, :date, 1, now())
+    ON CONFLICT (user_id, date)
+    DO UPDATE SET messages_used = quotas.messages_used + 1, updated_at = now()
+    WHERE quotas.messages_used < :limit
+    RETURNING messages_used
+    """
+)
+_DB_REFUND_SQL = sql_text(
+    """
+    UPDATE quotas SET messages_used = messages_used - 1, updated_at = now()
+    WHERE user_id = :user_id AND date = :date AND messages_used > 0
+    """
+)
+
+_UPSERT_SQL = sql_text(
+    """
+    INSERT INTO quotas (user_id, date, messages_used, updated_at)
+    VALUES (:user_id, :date, :messages_used, now())
+    ON CONFLICT (user_id, date)
+    DO UPDATE SET messages_used = EXCLUDED.messages_used, updated_at = now()
+    """
+)
+
+
+def _member(user_id: str, day: date) -> str:
+    return f"{day.isoformat()}|{user_id}"
+
+
+def _counter_key(user_id: str, day: date) -> str:
+    return f"quota:{day.isoformat()}:{user_id}"
+
+
+async def _seed(user_id: str, day: date) -> None:
+    # A missing counter (first message of the day, or a flushed/evicted key)
+    # starts from what Postgres already recorded. NX: a concurrent seed or
+    # increment wins.
+    async with db_session() as session:
+        used = (await session.execute(_SEED_SQL, {"user_id": user_id, "date": day})).scalar()
+    await redis_async.set(_counter_key(user_id, day), int(used or 0), ex=QUOTA_KEY_TTL_S, nx=True)
+
+
+async def _consume_db(user_id: str, day: date, limit: int) -> bool:
+    async with db_session() as session:
+        used = (
+            await session.execute(_DB_CONSUME_SQL, {"user_id": user_id, "date": day, "limit": limit})
+        ).scalar()
+        await session.commit()
+    if used is None:
+        raise HTTPException(status_code=402, detail={"paywall": True, "limit": limit})
+    return True
+
+
+async def consume(user_id: str, day: date, limit: int = FREE_LIMIT) -> bool:
+    # Atomically checks the daily limit and reserves one message. Returns whether
+    # a unit was reserved; a Redis outage follows QUOTA_REDIS_DOWN_POLICY.
+    keys = [_counter_key(user_id, day), _DIRTY_KEY]
+    args = [limit, QUOTA_KEY_TTL_S, _member(user_id, day)]
+    try:
+        used = int(await _consume_script(keys=keys, args=args))
+        if used == -2:
+            await _seed(user_id, day)
+            used = int(await _consume_script(keys=keys, args=args))
+    except RedisError:
+        logger.warning("QUOTA_UNAVAILABLE policy=%s", QUOTA_REDIS_DOWN_POLICY)
+        if QUOTA_REDIS_DOWN_POLICY == "db":
+            return await _consume_db(user_id, day, limit)
+        if QUOTA_REDIS_DOWN_POLICY == "closed":
+            raise HTTPException(status_code=503, detail="quota_unavailable", headers={"Retry-After": "5"})
+        return False
+
+    if used < 0:
+        raise HTTPException(status_code=402, detail={"paywall": True, "limit": limit})
+    return True
+
+
+async def refund(user_id: str, day: date) -> None:
+    try:
+        await _refund_script(keys=[_counter_key(user_id, day), _DIRTY_KEY], args=[_member(user_id, day)])
+    except RedisError:
+        logger.warning("QUOTA_UNAVAILABLE")
+        if QUOTA_REDIS_DOWN_POLICY == "db":
+            async with db_session() as session:
+                await session.execute(_DB_REFUND_SQL, {"user_id": user_id, "date": day})
+                await session.commit()
+
+
+async def _upsert(rows: List[Dict]) -> None:
+    async with db_session() as session:
+        await session.execute(_UPSERT_SQL, rows)
+        await session.commit()
+
+
+async def flush() -> None:
+    # Write-behind: drain the dirty set and upsert the current counters.
+    while True:
+        members = await redis_async.spop(_DIRTY_KEY, QUOTA_FLUSH_BATCH)
+        if not members:
+            return
+
+        refs = []
+        for member in members:
+            day, user_id = member.split("|", 1)
+            refs.append((user_id, date.fromisoformat(day)))
+        counts = await redis_async.mget([_counter_key(user_id, day) for user_id, day in refs])
+        rows = [
+            {"user_id": user_id, "date": day, "messages_used": int(count)}
+            for (user_id, day), count in zip(refs, counts)
+            if count is not None
+        ]
+
+        try:
+            if rows:
+                await _upsert(rows)
+        except Exception:
+            await redis_async.sadd(_DIRTY_KEY, *members)
+            raise
+
+        if len(members) < QUOTA_FLUSH_BATCH:
+            return
@@ -1,6 +1,193 @@
-from typing import List, Dict, Any
-async def retrieve(q: str, translation: str = "WEB", k_text: int = 50, k_vec: int = 50) -> List[Dict[str, Any]]:
+import asyncio
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import text as sql_text
+
+from .. import metrics
+from ..deps import db_session
+from . import breaker, embeddings, vector_index
+
+logger = logging.getLogger(__name__)
+
+RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+RETRIEVAL_LIMIT = int(os.getenv("RETRIEVAL_LIMIT", "8"))
+RETRIEVAL_TIMEOUT_S = float(os.getenv("RETRIEVAL_TIMEOUT_S", "2.0"))
+
+# Questions rarely contain every term of a verse, so the lexical leg matches any
+# stemmed term (OR) and lets ts_rank_cd reward verses that cover more of them.
+_QUERY_CTE = """
+    q AS (
+        SELECT replace(plainto_tsquery('english', :q)::text, ' & ', ' | ')::tsquery AS tsq
+    ),
+    lex AS (
+        SELECT id, row_number() OVER (ORDER BY rank DESC, id) AS rnk
+        FROM (
+            SELECT v.id, ts_rank_cd(v.text_tsv, q.tsq) AS rank
+            FROM verses v, q
+            WHERE v.translation = :translation AND v.text_tsv @@ q.tsq
+            ORDER BY rank DESC, v.id
+            LIMIT :k_text
+        ) ranked
+    )"""
+
+# With a relaxed iterative scan the LIMIT can see rows slightly out of order;
+# the outer row_number() over dist ranks them exactly.
+_VECTOR_CTE = """,
+    vec AS (
+        SELECT id, row_number() OVER (ORDER BY dist, id) AS rnk
+        FROM (
+            SELECT e.verse_id AS id, e.embedding <=> CAST(:embedding AS {column_type}) AS dist
+            FROM verse_embeddings e
+            JOIN verses v ON v.id = e.verse_id
+            WHERE v.translation = :translation
+            ORDER BY e.embedding <=> CAST(:embedding AS {column_type})
+            LIMIT :k_vec
+        ) nearest
+    )"""
+
+_FUSION = """,
+    fused AS (
+        SELECT id, sum(1.0 / (:rrf_k + rnk)) AS score
+        FROM ({legs}) legs
+        GROUP BY id
+    )
+SELECT translation, book, chapter, verse, text, score
+FROM (
+    SELECT DISTINCT ON (v.book, v.chapter, v.verse)
+        v.translation, v.book, v.chapter, v.verse, v.text, f.score
+    FROM fused f
+    JOIN verses v ON v.id = f.id
+    ORDER BY v.book, v.chapter, v.verse, f.score DESC
+) deduped
+ORDER BY score DESC, book, chapter, verse
+LIMIT :limit
+"""
+
+_LEXICAL_SQL = sql_text(
+    "WITH" + _QUERY_CTE + _FUSION.format(legs="SELECT id, rnk FROM lex")
+)
+_HYBRID_SQL = sql_text(
+    "WITH" + _QUERY_CTE + _VECTOR_CTE.format(column_type=vector_index.column_type())
+    + _FUSION.format(legs="SELECT id, rnk FROM lex UNION ALL SELECT id, rnk FROM vec")
+)
+
+
+def _vector_literal(embedding: List[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+async def embed_query(q: str) -> Optional[List[float]]:
+    backend = embeddings.get_backend()
+    if not backend.available():
+        return None
+    if backend.name == "openai" and breaker.recently_open():
+        # OpenAI is failing: go lexical-only instead of waiting out EMBED_TIMEOUT_S.
+        return None
+
+    try:
+        vectors = await backend.embed([q], timeout=embeddings.EMBED_TIMEOUT_S)
+    except Exception:
+        logger.warning("EMBED_FAILED", exc_info=True)
+        return None
+    return vectors[0]
+
+
+# Transaction-local, so the pooled connection goes back with the server default.
+_EF_SEARCH_SQL = sql_text("SELECT set_config('hnsw.ef_search', :ef_search, true)")
+_ITERATIVE_SCAN_SQL = sql_text(
+    """
+    SELECT set_config('hnsw.ef_search', :ef_search, true),
+           set_config('hnsw.iterative_scan', :iterative_scan, true),
+           set_config('hnsw.max_scan_tuples', :max_scan_tuples, true)
+    """
+)
+
+
+async def set_hnsw_search(session, ef_search: int) -> None:
+    # Search settings for the HNSW scan of the current transaction.
+    if vector_index.VECTOR_ITERATIVE_SCAN == "off":
+        await session.execute(_EF_SEARCH_SQL, {"ef_search": str(ef_search)})
+        return
+    await session.execute(
+        _ITERATIVE_SCAN_SQL,
+        {
+            "ef_search": str(ef_search),
+            "iterative_scan": vector_index.VECTOR_ITERATIVE_SCAN,
+            "max_scan_tuples": str(vector_index.VECTOR_MAX_SCAN_TUPLES),
+        },
+    )
+
+
+async def _search(params: Dict[str, Any], ef_search: int) -> List[Dict[str, Any]]:
+    hybrid = "embedding" in params
+    async with db_session() as session:
+        if hybrid:
+            await set_hnsw_search(session, ef_search)
+        rows = (await session.execute(_HYBRID_SQL if hybrid else _LEXICAL_SQL, params)).mappings().all()
     return [
-        {"translation": translation, "book": 19, "chapter": 23, "verse": 1, "text": "The Lord is my shepherd; I shall not want."},
-        {"translation": translation, "book": 19, "chapter": 46, "verse": 1, "text": "God is our refuge and strength, a very present help in trouble."},
+        {
+            "translation": row["translation"],
+            "book": row["book"],
+            "chapter": row["chapter"],
+            "verse": row["verse"],
+            "text": row["text"],
+            "score": float(row["score"]),
+        }
+        for row in rows
     ]
+
+
+async def retrieve(
+    q: str,
+    translation: str = "WEB",
+    k_text: int = 50,
+    k_vec: int = 50,
+    limit: int = RETRIEVAL_LIMIT,
+    embedding: Optional[List[float]] = None,
+    timings: Optional[Dict[str, float]] = None,
+    ef_search: int = vector_index.VECTOR_EF_SEARCH,
+) -> List[Dict[str, Any]]:
+    # Lexical and vector top-k, RRF fusion and dedupe run as one statement.
+    # `timings` (if given) receives per-stage milliseconds: embed, search, total.
+    # `ef_search` trades vector recall for latency; it is raised to k_vec if lower.
+    started = time.perf_counter()
+    stage_ms: Dict[str, float] = {"embed": 0.0, "search": 0.0}
+    query_text = q.strip()
+    passages: List[Dict[str, Any]] = []
+
+    if query_text:
+        params: Dict[str, Any] = {
+            "q": query_text,
+            "translation": translation,
+            "k_text": k_text,
+            "rrf_k": RRF_K,
+            "limit": limit,
+        }
+
+        if k_vec > 0:
+            if embedding is None:
+                embedding = await embed_query(query_text)
+            stage_ms["embed"] = (time.perf_counter() - started) * 1000
+            if embedding is not None:
+                params["embedding"] = _vector_literal(embedding)
+                params["k_vec"] = k_vec
+
+        search_started = time.perf_counter()
+        try:
+            passages = await asyncio.wait_for(
+                _search(params, vector_index.ef_search_for(k_vec, ef_search)), RETRIEVAL_TIMEOUT_S
+            )
+        except asyncio.TimeoutError:
+            logger.error("RETRIEVAL_TIMEOUT")
+        stage_ms["search"] = (time.perf_counter() - search_started) * 1000
+
+    stage_ms["total"] = (time.perf_counter() - started) * 1000
+    if stage_ms["embed"]:
+        metrics.record("embed", stage_ms["embed"] / 1000)
+    metrics.record("retrieval", stage_ms["search"] / 1000)
+    if timings is not None:
+        timings.update(stage_ms)
+    return passages
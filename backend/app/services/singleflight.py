@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from ..deps import redis_async
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+SINGLEFLIGHT_LOCK_TTL_S = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_S", "40"))
+SINGLEFLIGHT_WAIT_S = float(os.getenv("SINGLEFLIGHT_WAIT_S", "40"))
+SINGLEFLIGHT_RESULT_TTL_S = int(os.getenv("SINGLEFLIGHT_RESULT_TTL_S", "5"))
+
+# KEYS: lock; ARGV: owner token. Deletes the lock only if we still own it.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_release_script = redis_async.register_script(_RELEASE_LUA)
+
+_inflight: Dict[str, asyncio.Task] = {}
+_stats = {"leader": 0, "shared_local": 0, "shared_remote": 0, "fallback": 0}
+
+
+def make_key(namespace: str, *parts: str) -> str:
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:32]
+    return f"{namespace}:{digest}"
+
+
+async def _wait_remote(result_key: str, channel: str) -> Optional[Dict[str, Any]]:
+    # Subscribe before checking the result key, so a leader finishing between
+    # the two calls is seen one way or the other.
+    pubsub = redis_async.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(channel)
+        stored = await redis_async.get(result_key)
+        if stored:
+            return json.loads(stored)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SINGLEFLIGHT_WAIT_S
+        while (remaining := deadline - loop.time()) > 0:
+            message = await pubsub.get_message(timeout=remaining)
+            if message is not None:
+                return json.loads(message["data"])
+        return None
+    finally:
+        await pubsub.aclose()
+
+
+async def _run(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    lock_key, result_key, channel = f"sf:lock:{key}", f"sf:result:{key}", f"sf:done:{key}"
+    token = uuid.uuid4().hex
+    try:
+        leader = await redis_async.set(lock_key, token, nx=True, ex=SINGLEFLIGHT_LOCK_TTL_S)
+    except RedisError:
+        logger.warning("SINGLEFLIGHT_UNAVAILABLE")
+        return await fn()
+
+    if not leader:
+        try:
+            shared = await _wait_remote(result_key, channel)
+        except RedisError:
+            logger.warning("SINGLEFLIGHT_UNAVAILABLE")
+            shared = None
+        if shared is None or "retry" in shared:
+            # The leader died, timed out or failed unexpectedly: do the work here.
+            _stats["fallback"] += 1
+            return await fn()
+        _stats["shared_remote"] += 1
+        if "error" in shared:
+            raise HTTPException(**shared["error"])
+        return shared["value"]
+
+    _stats["leader"] += 1
+    outcome: Dict[str, Any] = {"retry": True}
+    try:
+        value = await fn()
+        outcome = {"value": value}
+        return value
+    except HTTPException as exc:
+        outcome = {"error": {"status_code": exc.status_code, "detail": exc.detail, "headers": exc.headers}}
+        raise
+    finally:
+        try:
+            payload = json.dumps(outcome, ensure_ascii=False)
+            async with redis_async.pipeline(transaction=False) as pipe:
+                pipe.set(result_key, payload, ex=SINGLEFLIGHT_RESULT_TTL_S)
+                pipe.publish(channel, payload)
+                await pipe.execute()
+            await _release_script(keys=[lock_key], args=[token])
+        except RedisError:
+            logger.warning("SINGLEFLIGHT_UNAVAILABLE")
+
+
+def _forget(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # mark retrieved; every caller has already seen it
+
+
+async def do(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    # Identical concurrent calls share one execution of fn: callers in this
+    # process await the same task, and other workers wait on the Redis
+    # result channel of whichever worker holds the lock. Results must be
+    # JSON-serializable (tuples come back as lists from other workers).
+    # HTTPExceptions are shared too; any other failure makes remote waiters
+    # run fn themselves.
+    if not SINGLEFLIGHT_ENABLED:
+        return await fn()
+
+    task = _inflight.get(key)
+    if task is None:
+        # A task, not the first caller's coroutine, so a disconnecting client
+        # does not cancel the work for everyone else.
+        task = asyncio.create_task(_run(key, fn))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    else:
+        _stats["shared_local"] += 1
+    return await asyncio.shield(task)
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)
@@ -0,0 +1,262 @@
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature, UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from ..deps import redis_async
+
+logger = logging.getLogger(__name__)
+
+# Apple Root CA - G3 (https://www.apple.com/certificateauthority/), or the
+# local CA from scripts/dev/make_iap_fixtures.py. Comma-separated PEM/DER files.
+IAP_ROOT_CERT_PATHS = os.getenv(
+    "IAP_ROOT_CERT_PATHS",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "apple", "AppleRootCA-G3.cer"),
+)
+IAP_BUNDLE_ID = os.getenv("IAP_BUNDLE_ID", "")
+IAP_MEMO_MAX_TTL_S = int(os.getenv("IAP_MEMO_MAX_TTL_S", str(30 * 24 * 3600)))
+IAP_CERT_CACHE_SIZE = int(os.getenv("IAP_CERT_CACHE_SIZE", "64"))
+# Reject transactions the app did not tag with the buyer's appAccountToken.
+# Off until every shipped app version sets it on purchase.
+IAP_REQUIRE_ACCOUNT_TOKEN = os.getenv("IAP_REQUIRE_ACCOUNT_TOKEN", "0") == "1"
+
+# appAccountToken is a UUID: ids that are UUIDs are used as they are, any
+# other user id maps to uuid5(_ACCOUNT_NAMESPACE, user_id). The app must
+# derive it the same way when it calls Product.purchase(options:).
+_ACCOUNT_NAMESPACE = uuid.UUID("6f1c2a52-3d0e-5b8e-9a41-7c2d9e0b4f13")
+
+# Marker extensions Apple puts on the App Store signing certificates.
+_LEAF_OID = x509.ObjectIdentifier("1.2.840.113635.100.6.11.1")
+_INTERMEDIATE_OID = x509.ObjectIdentifier("1.2.840.113635.100.6.2.1")
+
+
+class InvalidTransaction(Exception):
+    pass
+
+
+def _b64url(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _ms_to_iso(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc).isoformat()
+
+
+def claimed_expiry(claims: Dict[str, Any]) -> Optional[datetime]:
+    # expiresDate of claims that went through decode_unverified (numeric, in range).
+    value = claims.get("expiresDate")
+    return None if value is None else datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def decode_unverified(jws: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Header and claims, without checking anything: enough to pick the memo
+    # entry and to skip work for restores that change nothing.
+    try:
+        jws.encode("ascii")
+        header_b64, payload_b64, _ = jws.split(".")
+        header = json.loads(_b64url(header_b64))
+        claims = json.loads(_b64url(payload_b64))
+    except (ValueError, binascii.Error):
+        raise HTTPException(400, "Invalid JWS format")
+    if not isinstance(header, dict) or not isinstance(claims, dict) or not claims.get("originalTransactionId"):
+        raise HTTPException(400, "Invalid JWS format")
+    for field in ("expiresDate", "revocationDate"):
+        value = claims.get(field)
+        # Milliseconds since the epoch; the bound also rejects NaN/Infinity.
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value < 10**14):
+            raise HTTPException(400, "Invalid JWS format")
+    return header, claims
+
+
+_roots: Tuple[x509.Certificate, ...] = ()
+
+
+def load_trust_roots() -> Tuple[x509.Certificate, ...]:
+    # Called from the app lifespan: a deployment without a usable root must
+    # not start and then answer every purchase with an error.
+    global _roots
+    roots: List[x509.Certificate] = []
+    for path in filter(None, (p.strip() for p in IAP_ROOT_CERT_PATHS.split(","))):
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            logger.error("IAP_ROOT_CERT_MISSING path=%s", path)
+            continue
+        if b"-----BEGIN CERTIFICATE-----" in data:
+            roots.extend(x509.load_pem_x509_certificates(data))
+        else:
+            roots.append(x509.load_der_x509_certificate(data))
+    if not roots:
+        raise RuntimeError(
+            f"No App Store root certificate in IAP_ROOT_CERT_PATHS={IAP_ROOT_CERT_PATHS!r}; download "
+            "https://www.apple.com/certificateauthority/AppleRootCA-G3.cer (scripts/dev/bootstrap.sh does)"
+        )
+    _roots = tuple(roots)
+    _verify_chain.cache_clear()
+    return _roots
+
+
+def _trusted_roots() -> Tuple[x509.Certificate, ...]:
+    return _roots or load_trust_roots()
+
+
+@lru_cache(maxsize=IAP_CERT_CACHE_SIZE)
+def _load_cert(der_b64: str) -> x509.Certificate:
+    # Every purchase from one signing key carries the same x5c strings.
+    try:
+        return x509.load_der_x509_certificate(base64.b64decode(der_b64, validate=True))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidTransaction("unparseable x5c certificate")
+
+
+def _issued_by(cert: x509.Certificate, issuer: x509.Certificate) -> bool:
+    try:
+        cert.verify_directly_issued_by(issuer)
+        return True
+    except (ValueError, TypeError, InvalidSignature, UnsupportedAlgorithm):
+        return False
+
+
+@lru_cache(maxsize=IAP_CERT_CACHE_SIZE)
+def _verify_chain(x5c: Tuple[str, ...]) -> Tuple[datetime, datetime]:
+    # Signatures and marker extensions of leaf -> intermediate -> trusted root.
+    # Returns the window in which the whole chain is valid; the caller checks
+    # it against the clock, so the cached result never goes stale.
+    roots = _trusted_roots()
+    if len(x5c) < 2:
+        raise InvalidTransaction("x5c chain too short")
+    certs = [_load_cert(c) for c in x5c]
+    leaf, intermediate = certs[0], certs[1]
+    try:
+        leaf.extensions.get_extension_for_oid(_LEAF_OID)
+        intermediate.extensions.get_extension_for_oid(_INTERMEDIATE_OID)
+    except (x509.ExtensionNotFound, ValueError):
+        raise InvalidTransaction("not an App Store signing certificate")
+    for cert, issuer in zip(certs, certs[1:]):
+        if not _issued_by(cert, issuer):
+            raise InvalidTransaction("broken certificate chain")
+
+    last = certs[-1]
+    if not any(last == root or _issued_by(last, root) for root in roots):
+        raise InvalidTransaction("untrusted root")
+    chain = certs + [root for root in roots if _issued_by(last, root)][:1]
+    return max(c.not_valid_before_utc for c in chain), min(c.not_valid_after_utc for c in chain)
+
+
+def _verify_signature(jws: str, header: Dict[str, Any]) -> None:
+    x5c = header.get("x5c")
+    if header.get("alg") != "ES256" or not isinstance(x5c, list) or not all(isinstance(c, str) for c in x5c):
+        raise InvalidTransaction("unsupported JWS header")
+    not_before, not_after = _verify_chain(tuple(x5c))
+    if not not_before <= datetime.now(timezone.utc) <= not_after:
+        raise InvalidTransaction("certificate chain expired")
+
+    signing_input, _, signature_b64 = jws.rpartition(".")
+    try:
+        signature = _b64url(signature_b64)
+    except (ValueError, binascii.Error):
+        raise InvalidTransaction("bad signature encoding")
+    if len(signature) != 64:
+        raise InvalidTransaction("bad ES256 signature length")
+    der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+    key = _load_cert(x5c[0]).public_key()
+    if not isinstance(key, ec.EllipticCurvePublicKey):
+        raise InvalidTransaction("leaf key is not EC")
+    try:
+        key.verify(der, signing_input.encode("ascii"), ec.ECDSA(hashes.SHA256()))
+    except InvalidSignature:
+        raise InvalidTransaction("bad signature")
+
+
+def app_account_token(user_id: str) -> str:
+    try:
+        return str(uuid.UUID(user_id))
+    except ValueError:
+        return str(uuid.uuid5(_ACCOUNT_NAMESPACE, user_id))
+
+
+def owned_by(tx: Dict[str, Any], user_id: str) -> bool:
+    # Whether the verified transaction may be granted to user_id, going by the
+    # appAccountToken the app attached at purchase time.
+    token = tx.get("app_account_token")
+    if not token:
+        return not IAP_REQUIRE_ACCOUNT_TOKEN
+    try:
+        return str(uuid.UUID(str(token))) == app_account_token(user_id)
+    except ValueError:
+        return False
+
+
+def _transaction(claims: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "original_tx_id": str(claims["originalTransactionId"]),
+        "transaction_id": str(claims.get("transactionId") or ""),
+        "product_id": claims.get("productId"),
+        "expires_at": _ms_to_iso(claims.get("expiresDate")),
+        "revoked": claims.get("revocationDate") is not None,
+        "environment": claims.get("environment"),
+        "app_account_token": claims.get("appAccountToken"),
+    }
+
+
+def _memo_key(original_tx_id: str) -> str:
+    return f"iap:tx:v2:{original_tx_id}"  # v2: memo carries app_account_token
+
+
+def _memo_ttl(tx: Dict[str, Any]) -> int:
+    if tx["expires_at"] is None:
+        return IAP_MEMO_MAX_TTL_S
+    remaining = (datetime.fromisoformat(tx["expires_at"]) - datetime.now(timezone.utc)).total_seconds()
+    return max(60, min(IAP_MEMO_MAX_TTL_S, int(remaining)))
+
+
+async def verify(jws: str) -> Dict[str, Any]:
+    # Verified transaction for a StoreKit 2 signed transaction. Results are
+    # memoized per original transaction together with a digest of the exact
+    # JWS, so a restore storm re-sending the same token skips the crypto while
+    # any other token for that transaction is verified in full.
+    header, claims = decode_unverified(jws)
+    original_tx_id = str(claims["originalTransactionId"])
+    digest = hashlib.sha256(jws.encode("utf-8")).hexdigest()
+    try:
+        raw = await redis_async.get(_memo_key(original_tx_id))
+    except RedisError:
+        logger.warning("IAP_MEMO_UNAVAILABLE")
+        raw = None
+    if raw:
+        memo = json.loads(raw)
+        if memo.get("digest") == digest:
+            return memo["tx"]
+
+    try:
+        _verify_signature(jws, header)
+    except InvalidTransaction as exc:
+        logger.warning("IAP_VERIFY_FAILED original_tx_id=%s reason=%s", original_tx_id, exc)
+        raise HTTPException(400, "Invalid transaction signature.")
+    if IAP_BUNDLE_ID and claims.get("bundleId") != IAP_BUNDLE_ID:
+        logger.warning("IAP_BUNDLE_MISMATCH original_tx_id=%s bundle=%s", original_tx_id, claims.get("bundleId"))
+        raise HTTPException(400, "Transaction is for another app.")
+
+    tx = _transaction(claims)
+    try:
+        await redis_async.set(_memo_key(original_tx_id), json.dumps({"digest": digest, "tx": tx}), ex=_memo_ttl(tx))
+    except RedisError:
+        logger.warning("IAP_MEMO_UNAVAILABLE")
+    return tx
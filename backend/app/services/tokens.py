@@ -0,0 +1,43 @@
+import logging
+import os
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # pinned in requirements.txt; only partial installs lack it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        # The BPE file is fetched on first use and cached (TIKTOKEN_CACHE_DIR);
+        # without it counts fall back to the character heuristic below.
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        logger.warning("TOKENIZER_UNAVAILABLE encoding=%s", TOKENIZER_ENCODING)
+        return None
+
+
+@lru_cache(maxsize=50000)
+def count(text: str) -> int:
+    # Verses and the system prompt repeat across requests, so counts are
+    # memoized; the encoding itself is loaded once per process.
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # About four characters per token for English text; errs slightly high.
+    return max(1, (len(text) + 3) // 4)
+
+
+def count_message(message: dict) -> int:
+    # Chat formatting adds a few tokens per message on top of the content.
+    return count(message.get("content") or "") + 4
@@ -0,0 +1,41 @@
+import os
+
+from ..vector_config import EMBED_DIM, VECTOR_INDEX_TYPE
+
+# Storage and index settings for verse_embeddings. Embeddings are unit-length,
+# so cosine distance is the right metric; half precision halves the heap and
+# index size with no measurable recall loss at this corpus size, and EMBED_DIM
+# below 1536 (text-embedding-3 `dimensions`) shrinks both further.
+# EMBED_DIM and VECTOR_INDEX_TYPE live in app/vector_config.py.
+# Changing these needs the 0007 migration re-run (or embed_verses --defer-index).
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "100"))
+# The index holds every translation, and the translation filter is applied to
+# what the scan returns: a plain scan stops after ef_search candidates, most
+# of them other translations. Iterative scans (pgvector >= 0.8) keep going
+# until k rows pass the filter; "off" for older pgvector.
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")  # relaxed_order | strict_order | off
+VECTOR_MAX_SCAN_TUPLES = int(os.getenv("VECTOR_MAX_SCAN_TUPLES", "20000"))
+
+if VECTOR_ITERATIVE_SCAN not in ("relaxed_order", "strict_order", "off"):
+    raise ValueError(f"VECTOR_ITERATIVE_SCAN must be relaxed_order, strict_order or off, not {VECTOR_ITERATIVE_SCAN!r}")
+
+INDEX_NAME = "verse_embed_hnsw"
+
+
+def column_type(dim: int = EMBED_DIM) -> str:
+    return f"{VECTOR_INDEX_TYPE}({dim})"
+
+
+def index_sql(m: int = VECTOR_HNSW_M, ef_construction: int = VECTOR_HNSW_EF_CONSTRUCTION) -> str:
+    return (
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON verse_embeddings "
+        f"USING hnsw (embedding {VECTOR_INDEX_TYPE}_cosine_ops) "
+        f"WITH (m = {int(m)}, ef_construction = {int(ef_construction)})"
+    )
+
+
+def ef_search_for(k: int, ef_search: int = VECTOR_EF_SEARCH) -> int:
+    # HNSW returns at most ef_search rows, so it must cover the requested k.
+    return max(int(ef_search), int(k))
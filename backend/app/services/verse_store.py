@@ -0,0 +1,238 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text as sql_text
+
+from ..deps import db_session
+
+VERSE_STORE_DIR = os.getenv("VERSE_STORE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "data", "verse_store"))
+VERSE_STORE_CHECK_S = float(os.getenv("VERSE_STORE_CHECK_S", "30"))
+# Bump after re-importing verses into Postgres; part of the passage ETags.
+VERSES_DATA_VERSION = os.getenv("VERSES_DATA_VERSION", "1")
+
+BOOKS = [
+    "Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy", "Joshua", "Judges", "Ruth",
+    "1 Samuel", "2 Samuel", "1 Kings", "2 Kings", "1 Chronicles", "2 Chronicles", "Ezra",
+    "Nehemiah", "Esther", "Job", "Psalms", "Proverbs", "Ecclesiastes", "Song of Solomon",
+    "Isaiah", "Jeremiah", "Lamentations", "Ezekiel", "Daniel", "Hosea", "Joel", "Amos",
+    "Obadiah", "Jonah", "Micah", "Nahum", "Habakkuk", "Zephaniah", "Haggai", "Zechariah",
+    "Malachi", "Matthew", "Mark", "Luke", "John", "Acts", "Romans", "1 Corinthians",
+    "2 Corinthians", "Galatians", "Ephesians", "Philippians", "Colossians", "1 Thessalonians",
+    "2 Thessalonians", "1 Timothy", "2 Timothy", "Titus", "Philemon", "Hebrews", "James",
+    "1 Peter", "2 Peter", "1 John", "2 John", "3 John", "Jude", "Revelation",
+]
+_BOOK_NUMBERS = {name.lower(): i for i, name in enumerate(BOOKS, start=1)}
+_BOOK_NUMBERS.update({"psalm": 19, "song of songs": 22})
+
+
+def book_number(book: int | str) -> Optional[int]:
+    if isinstance(book, int) or str(book).isdigit():
+        number = int(book)
+        return number if 1 <= number <= len(BOOKS) else None
+    return _BOOK_NUMBERS.get(" ".join(str(book).lower().split()))
+
+
+# Snapshot layout (native little-endian, every section 4-byte aligned):
+#   magic "HVS1" | version, n_books, n_chapters, n_slots, blob_len (u32) | translation (16 bytes)
+#   book_chapter_start  u32[n_books + 2]  chapters of book b are rows [s[b], s[b + 1])
+#   chapter_slot_start  u32[n_chapters + 1]  slots of a chapter row; slot k is verse k + 1
+#   slot_offsets        u32[n_slots + 1]  byte offsets into the blob
+#   blob                each present verse is its UTF-8 text plus one trailing space, so a
+#                       verse range inside a chapter is a single contiguous slice.
+_MAGIC = b"HVS1"
+_VERSION = 1
+_HEADER = struct.Struct("<4s5I16s")
+
+
+def build(rows: Iterable[Tuple[int, int, int, str]], translation: str, path: str) -> Dict[str, int]:
+    # `rows` must be ordered by (book, chapter, verse). The file is written next to
+    # `path` and renamed into place, so running workers keep their old mapping.
+    chapters: Dict[Tuple[int, int], Dict[int, bytes]] = {}
+    n_books = 0
+    for book, chapter, verse, text in rows:
+        chapters.setdefault((book, chapter), {})[verse] = " ".join(text.split()).encode("utf-8")
+        n_books = max(n_books, book)
+
+    book_chapter_start = array("I", [0] * (n_books + 2))
+    chapter_slot_start = array("I")
+    slot_offsets = array("I", [0])
+    blob = bytearray()
+    for book in range(1, n_books + 2):
+        book_chapter_start[book] = len(chapter_slot_start)
+        if book > n_books:
+            break
+        max_chapter = max((c for b, c in chapters if b == book), default=0)
+        for chapter in range(1, max_chapter + 1):
+            chapter_slot_start.append(len(slot_offsets) - 1)
+            verses = chapters.get((book, chapter), {})
+            for verse in range(1, max(verses, default=0) + 1):
+                text = verses.get(verse)
+                if text:
+                    blob += text + b" "
+                slot_offsets.append(len(blob))
+    chapter_slot_start.append(len(slot_offsets) - 1)
+    blob += b"\0" * (-len(blob) % 4)
+
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, n_books, len(chapter_slot_start) - 1, len(slot_offsets) - 1, len(blob),
+        translation.encode("ascii")[:16].ljust(16, b"\0"),
+    )
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for section in (book_chapter_start, chapter_slot_start, slot_offsets):
+            section.tofile(f)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return {"books": n_books, "chapters": len(chapter_slot_start) - 1, "slots": len(slot_offsets) - 1, "bytes": len(blob)}
+
+
+class VerseStore:
+    # Read-only mmap of one translation snapshot. Pages are shared through the OS
+    # page cache by every worker that maps the same file, and lookups are array
+    # indexing into memoryviews, with no parsing at startup.
+
+    def __init__(self, path: str) -> None:
+        if sys.byteorder != "little":
+            raise RuntimeError("verse store snapshots are little-endian")
+        self.path = path
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_books, n_chapters, n_slots, blob_len, translation = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a verse store snapshot")
+        self.translation = translation.rstrip(b"\0").decode("ascii")
+        self.n_books = n_books
+
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+        self._book_chapter_start = view[pos:pos + 4 * (n_books + 2)].cast("I")
+        pos += 4 * (n_books + 2)
+        self._chapter_slot_start = view[pos:pos + 4 * (n_chapters + 1)].cast("I")
+        pos += 4 * (n_chapters + 1)
+        self._slot_offsets = view[pos:pos + 4 * (n_slots + 1)].cast("I")
+        pos += 4 * (n_slots + 1)
+        self._blob = view[pos:pos + blob_len]
+
+    def _slots(self, book: int, chapter: int) -> Optional[Tuple[int, int]]:
+        if not 1 <= book <= self.n_books or chapter < 1:
+            return None
+        row = self._book_chapter_start[book] + chapter - 1
+        if row >= self._book_chapter_start[book + 1]:
+            return None
+        return self._chapter_slot_start[row], self._chapter_slot_start[row + 1]
+
+    def _span(self, first_slot: int, last_slot: int) -> memoryview:
+        start = self._slot_offsets[first_slot]
+        end = self._slot_offsets[last_slot + 1]
+        if end > start and self._blob[end - 1] == 0x20:
+            end -= 1
+        return self._blob[start:end]
+
+    def verse_bytes(self, book: int, chapter: int, verse: int) -> Optional[memoryview]:
+        slots = self._slots(book, chapter)
+        if slots is None or not 1 <= verse <= slots[1] - slots[0]:
+            return None
+        span = self._span(slots[0] + verse - 1, slots[0] + verse - 1)
+        return span if len(span) else None
+
+    def range_bytes(self, book: int, chapter: int, start: int, end: int) -> Optional[memoryview]:
+        # Verses start..end of one chapter joined by single spaces, as one slice.
+        slots = self._slots(book, chapter)
+        if slots is None:
+            return None
+        count = slots[1] - slots[0]
+        start, end = max(start, 1), min(end, count)
+        if start > end:
+            return None
+        return self._span(slots[0] + start - 1, slots[0] + end - 1)
+
+    def verse(self, book: int, chapter: int, verse: int) -> Optional[str]:
+        span = self.verse_bytes(book, chapter, verse)
+        return str(span, "utf-8") if span is not None else None
+
+    def verses(self, book: int, chapter: int, start: int, end: int) -> List[Dict[str, Any]]:
+        slots = self._slots(book, chapter)
+        if slots is None:
+            return []
+        out = []
+        for verse in range(max(start, 1), min(end, slots[1] - slots[0]) + 1):
+            span = self._span(slots[0] + verse - 1, slots[0] + verse - 1)
+            if len(span):
+                out.append({"book": book, "chapter": chapter, "verse": verse, "text": str(span, "utf-8")})
+        return out
+
+    def close(self) -> None:
+        for view in (self._book_chapter_start, self._chapter_slot_start, self._slot_offsets, self._blob):
+            view.release()
+        self._mm.close()
+
+
+_stores: Dict[str, Tuple[float, Optional[VerseStore]]] = {}
+
+
+def snapshot_path(translation: str) -> str:
+    return os.path.join(VERSE_STORE_DIR, f"{translation}.hvs")
+
+
+def get_store(translation: str) -> Optional[VerseStore]:
+    # Opened lazily per process; a rebuilt snapshot is picked up on the next
+    # check after its mtime changes.
+    now = time.monotonic()
+    checked_at, store = _stores.get(translation, (0.0, None))
+    if now - checked_at < VERSE_STORE_CHECK_S and translation in _stores:
+        return store
+
+    path = snapshot_path(translation)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        _stores[translation] = (now, None)
+        return None
+    if store is None or store.mtime_ns != mtime_ns:
+        # The previous mapping is left to the GC: callers may still hold views into it.
+        store = VerseStore(path)
+    _stores[translation] = (now, store)
+    return store
+
+
+def data_version(translation: str) -> str:
+    # Identifies the verse text a passage is read from without reading it:
+    # the snapshot's mtime when there is one, otherwise VERSES_DATA_VERSION.
+    store = get_store(translation)
+    if store is None:
+        return VERSES_DATA_VERSION
+    return f"{VERSES_DATA_VERSION}.{store.mtime_ns}"
+
+
+_PASSAGE_SQL = sql_text(
+    """
+    SELECT book, chapter, verse, text FROM verses
+    WHERE translation = :translation AND book = :book AND chapter = :chapter
+      AND verse BETWEEN :start AND :end
+    ORDER BY verse
+    """
+)
+
+
+async def fetch_passage(translation: str, book: int, chapter: int, start: int, end: int) -> List[Dict[str, Any]]:
+    store = get_store(translation)
+    if store is not None:
+        return store.verses(book, chapter, start, end)
+
+    async with db_session() as session:
+        rows = (
+            await session.execute(
+                _PASSAGE_SQL,
+                {"translation": translation, "book": book, "chapter": chapter, "start": start, "end": end},
+            )
+        ).mappings().all()
+    return [dict(row) for row in rows]
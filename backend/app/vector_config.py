@@ -0,0 +1,10 @@
+import os
+
+# Shape of the stored verse embeddings, shared by the ORM model, the embedding
+# backends and the index helpers. Kept free of service imports so that
+# importing app.models does not pull in the LLM client.
+EMBED_DIM = int(os.getenv("EMBED_DIM", "1536"))
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "halfvec")  # halfvec | vector
+
+if VECTOR_INDEX_TYPE not in ("halfvec", "vector"):
+    raise ValueError(f"VECTOR_INDEX_TYPE must be halfvec or vector, not {VECTOR_INDEX_TYPE!r}")
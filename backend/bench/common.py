@@ -0,0 +1,95 @@
+import json, os, platform, subprocess, time
+
+# Shared timing, reporting and baseline helpers for bench/micro.py and bench/load.py.
+# A result file is {"meta": {...}, "results": {name: {count, ops_s, p50_ms, p95_ms, p99_ms, ...}}}.
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+QUESTIONS = ["what does the bible say about anxiety", "how do i forgive someone", "love your neighbor",
+             "the lord is my shepherd", "faith without works", "peace that passes understanding",
+             "strength in weakness", "do not be afraid"]
+SEARCH_TERMS = ["shepherd", "love one another", "faith", "light of the world", "refuge and strength"]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies_s, elapsed_s, errors=0):
+    values = sorted(latencies_s)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'ops_s': round(len(values) / elapsed_s, 1) if elapsed_s else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def meta(**extra):
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        sha = None
+    return {'commit': sha, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'machine': platform.machine(), **extra}
+
+
+def print_table(results):
+    print(f"{'benchmark':<34}{'count':>8}{'err':>6}{'ops/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<34}{r['count']:>8}{r['errors']:>6}{r['ops_s']:>11.1f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+
+
+def save(path, meta_info, results):
+    if os.sep not in path and not path.endswith('.json'):
+        path = os.path.join(BASELINE_DIR, f'{path}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'meta': meta_info, 'results': results}, f, indent=2, sort_keys=True)
+    print(f'saved {path}')
+
+
+def compare(path, results, threshold):
+    # Prints per-benchmark deltas against a saved run and returns the names whose
+    # p95 regressed by more than `threshold` (0.10 = 10%) or whose error count grew.
+    if os.sep not in path and not path.endswith('.json'):
+        path = os.path.join(BASELINE_DIR, f'{path}.json')
+    with open(path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {path} (commit {baseline['meta'].get('commit')})")
+    regressions = []
+    for name, r in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f'{name:<34} (new)')
+            continue
+        delta = (r['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        ops = (r['ops_s'] - base['ops_s']) / base['ops_s'] if base['ops_s'] else 0.0
+        flag = ''
+        if delta > threshold or r['errors'] > base['errors']:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<34} p95 {base['p95_ms']:.3f} -> {r['p95_ms']:.3f} ms ({delta:+.1%}), ops/s {ops:+.1%}{flag}")
+    return regressions
+
+
+def add_output_args(ap):
+    ap.add_argument('--save', metavar='NAME_OR_PATH', help='write results; a bare name goes to bench/baselines/NAME.json')
+    ap.add_argument('--compare', metavar='NAME_OR_PATH', help='compare against a saved run')
+    ap.add_argument('--threshold', type=float, default=0.10, help='allowed p95 regression before exiting 1')
+
+
+def finish(args, meta_info, results):
+    print_table(results)
+    if args.save:
+        save(args.save, meta_info, results)
+    if args.compare and compare(args.compare, results, args.threshold):
+        raise SystemExit(1)
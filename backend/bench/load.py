@@ -0,0 +1,100 @@
+import argparse, asyncio, os, random, sys, time
+from collections import Counter, defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench import common  # noqa: E402
+
+# End-to-end load driver for a running API (see bench/run_local.sh for the full
+# local stack: Postgres+pgvector and Redis from docker-compose, scripts/dev/fake_openai.py
+# standing in for OpenAI). Closed loop: --concurrency workers each send the next
+# request as soon as the previous one finishes, for --duration seconds.
+#   python -m bench.load --url http://localhost:8000 --mix chat=1,search=3,daily=6 --save load-local
+#
+# Run the API with a high FREE_LIMIT, otherwise chat turns into 402s after four messages per user.
+
+
+def _zipf_choice(rng, items, s=1.1):
+    # A few hot items and a long tail, like push-notification traffic.
+    weights = [1 / (i + 1) ** s for i in range(len(items))]
+    return rng.choices(items, weights=weights, k=1)[0]
+
+
+def _request(kind, rng, args):
+    if kind == 'chat':
+        return 'POST', '/v1/chat', {'json': {'user_id': f'load-{rng.randrange(args.users)}', 'message': _zipf_choice(rng, common.QUESTIONS),
+                                             'translation': 'WEB'}}
+    if kind == 'search':
+        return 'GET', '/v1/verses/search', {'params': {'q': _zipf_choice(rng, common.SEARCH_TERMS), 'translation': 'WEB', 'limit': 20}}
+    if kind == 'daily':
+        return 'GET', '/v1/daily-verse', {'params': {'translation': 'WEB'}}
+    raise ValueError(kind)
+
+
+async def worker(client, args, kinds, weights, deadline, seed, latencies, statuses):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights=weights, k=1)[0]
+        method, path, kw = _request(kind, rng, args)
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, path, **kw)
+            status = resp.status_code
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+        elapsed = time.perf_counter() - started
+        statuses[kind][status] += 1
+        if status == 200:
+            latencies[kind].append(elapsed)
+
+
+async def run(args):
+    mix = dict(part.split('=') for part in args.mix.split(','))
+    kinds, weights = list(mix), [float(w) for w in mix.values()]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        if args.warmup:
+            print(f'warming up for {args.warmup}s...', flush=True)
+            warm = time.perf_counter() + args.warmup
+            await asyncio.gather(*(worker(client, args, kinds, weights, warm, -i, defaultdict(list), defaultdict(Counter))
+                                   for i in range(args.concurrency)))
+        latencies, statuses = defaultdict(list), defaultdict(Counter)
+        print(f'running {args.concurrency} workers for {args.duration}s against {args.url}', flush=True)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, args, kinds, weights, started + args.duration, args.seed + i, latencies, statuses)
+                               for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = {}
+    for kind in kinds:
+        errors = sum(n for status, n in statuses[kind].items() if status != 200)
+        results[f'load_{kind}'] = common.summarize(latencies[kind], elapsed, errors)
+    results['load_total'] = common.summarize([x for kind in kinds for x in latencies[kind]], elapsed,
+                                             sum(r['errors'] for r in results.values()))
+    for kind in kinds:
+        other = {str(k): v for k, v in statuses[kind].items() if k != 200}
+        if other:
+            print(f'{kind}: non-200 responses {other}')
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--url', default=os.getenv('BENCH_URL', 'http://localhost:8000'))
+    ap.add_argument('--mix', default='chat=1,search=3,daily=6', help='endpoint weights')
+    ap.add_argument('--concurrency', type=int, default=32)
+    ap.add_argument('--duration', type=float, default=30)
+    ap.add_argument('--warmup', type=float, default=5)
+    ap.add_argument('--users', type=int, default=1000, help='distinct chat user ids')
+    ap.add_argument('--timeout', type=float, default=60)
+    ap.add_argument('--seed', type=int, default=1)
+    common.add_output_args(ap)
+    args = ap.parse_args()
+    results = asyncio.run(run(args))
+    common.finish(args, common.meta(kind='load', url=args.url, mix=args.mix, concurrency=args.concurrency,
+                                    duration=args.duration), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import argparse, asyncio, json, os, random, sys, tempfile, time, uuid
+from datetime import date
+
+from sqlalchemy import text as sql_text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench import common  # noqa: E402
+from app.deps import db_session, redis_async  # noqa: E402
+from app.routers import verses  # noqa: E402
+from app.services import embeddings, llm, quota, retrieval, tokens, verse_store  # noqa: E402
+
+# Microbenchmarks for the hot paths. Pure ones always run; redis/db ones need the
+# services from docker-compose (REDIS_URL / DATABASE_URL, see .env.example):
+#   cd backend && python -m bench.micro --iterations 2000 --save micro-local
+#   python -m bench.micro --only prompt,verse_store --compare micro-local
+
+QUESTIONS, SEARCH_TERMS = common.QUESTIONS, common.SEARCH_TERMS
+
+
+def _passages(n):
+    rng = random.Random(7)
+    words = "the lord is my shepherd i shall not want he makes me lie down in green pastures".split()
+    return [{'translation': 'WEB', 'book': rng.randint(1, 66), 'chapter': rng.randint(1, 50), 'verse': rng.randint(1, 40),
+             'text': ' '.join(rng.choice(words) for _ in range(rng.randint(12, 40))), 'score': 1.0 / (i + 1)}
+            for i in range(n)]
+
+
+def _sync_loop(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    samples, started = [], time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter(); fn(); samples.append(time.perf_counter() - t)
+    return common.summarize(samples, time.perf_counter() - started)
+
+
+async def _async_loop(fn, iterations, warmup):
+    for _ in range(warmup):
+        await fn()
+    samples, errors, started = [], 0, time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        try:
+            await fn()
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - t)
+    return common.summarize(samples, time.perf_counter() - started, errors)
+
+
+async def bench_prompt(args):
+    passages = _passages(50)
+    history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': ' '.join(['word'] * 60)} for i in range(12)]
+    out = {'format_passage': _sync_loop(lambda: [llm._format_passage(p) for p in passages[:8]], args.iterations, args.warmup)}
+    out['build_prompt'] = _sync_loop(lambda: llm.build_prompt(QUESTIONS[0], passages, history), args.iterations, args.warmup)
+
+    def cold_prompt():
+        tokens.count.cache_clear()
+        llm.build_prompt(QUESTIONS[0], passages, history)
+    out['build_prompt_cold_tokenizer'] = _sync_loop(cold_prompt, max(1, args.iterations // 10), 1)
+    return out
+
+
+async def bench_verse_store(args):
+    path = verse_store.snapshot_path('WEB')
+    if not os.path.exists(path):
+        # Synthetic Bible-shaped snapshot: 66 books x 30 chapters x 30 verses.
+        path = os.path.join(tempfile.mkdtemp(), 'WEB.hvs')
+        verse_store.build(((b, c, v, f'verse text {b}:{c}:{v} ' * 3) for b in range(1, 67) for c in range(1, 31)
+                           for v in range(1, 31)), 'WEB', path)
+    store = verse_store.VerseStore(path)
+    rng = random.Random(1)
+    refs = [(rng.randint(1, store.n_books), rng.randint(1, 20), rng.randint(1, 20)) for _ in range(1000)]
+    out = {'verse_store_verse': _sync_loop(lambda: store.verse(*refs[rng.randrange(1000)]), args.iterations, args.warmup)}
+    out['verse_store_passage_18'] = _sync_loop(lambda: store.verses(43, 1, 1, 18), args.iterations, args.warmup)
+    return out
+
+
+async def bench_quota(args):
+    day, users = date.today(), [f'bench-{uuid.uuid4().hex[:8]}-{i}' for i in range(100)]
+    rng = random.Random(3)
+    # Pre-seeded counters: the benchmark covers the Redis path, not the first-of-day seed from Postgres.
+    await redis_async.mset({quota._counter_key(u, day): 0 for u in users})
+    try:
+        out = {'quota_consume': await _async_loop(lambda: quota.consume(rng.choice(users), day, limit=10 ** 9),
+                                                  args.iterations, args.warmup)}
+    finally:
+        await redis_async.delete(*[quota._counter_key(u, day) for u in users])
+        await redis_async.srem(quota._DIRTY_KEY, *[quota._member(u, day) for u in users])
+    return out
+
+
+async def bench_retrieval(args):
+    # Embeddings come from the deterministic local backend so the numbers cover
+    # the fused SQL only, not an embedding round trip.
+    backend = embeddings.get_backend('local')
+    vectors = dict(zip(QUESTIONS, await backend.embed(QUESTIONS)))
+    rng = random.Random(5)
+
+    async def one(hybrid):
+        q = rng.choice(QUESTIONS)
+        await retrieval.retrieve(q, embedding=vectors[q] if hybrid else None)
+
+    n = max(1, args.iterations // 10)
+    return {'retrieve_hybrid': await _async_loop(lambda: one(True), n, args.warmup),
+            'retrieve_lexical': await _async_loop(lambda: one(False), n, args.warmup)}
+
+
+async def bench_search_plans(args):
+    # EXPLAIN ANALYZE of the search statements: planning/execution time as
+    # Postgres reports it, plus whether the GIN index is used.
+    out, plans = {}, {}
+    for term in SEARCH_TERMS:
+        params = {'ts_query': term, 'translation': 'WEB', 'limit': 21, 'offset': 0,
+                  'headline_options': verses._HEADLINE_OPTIONS}
+        async with db_session() as session:
+            rows = (await session.execute(verses._FIRST_PAGE_SQL, params)).mappings().all()
+        variants = [('first_page', verses._FIRST_PAGE_SQL, params)]
+        if len(rows) > 20:
+            variants.append(('keyset', verses._KEYSET_SQL, {**params, 'after_rank': float(rows[19]['rank']), 'after_id': rows[19]['id']}))
+        for label, statement, p in variants:
+            samples = []
+            for _ in range(max(3, args.iterations // 100)):
+                async with db_session() as session:
+                    plan = (await session.execute(sql_text('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + statement.text), p)).scalar()
+                plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+                samples.append((plan['Planning Time'] + plan['Execution Time']) / 1000)
+            key = f'search_plan_{label}'
+            out.setdefault(key, []).extend(samples)
+            plans[f'{label}:{term}'] = 'verses_tsv_idx' in json.dumps(plan)
+    for label, idx in plans.items():
+        if not idx:
+            print(f'warning: {label} does not use verses_tsv_idx')
+    return {k: common.summarize(v, sum(v)) for k, v in out.items()}
+
+
+BENCHES = {'prompt': (bench_prompt, None), 'verse_store': (bench_verse_store, None), 'quota': (bench_quota, 'redis'),
+           'retrieval': (bench_retrieval, 'db'), 'search_plans': (bench_search_plans, 'db')}
+
+
+async def _reachable(kind):
+    try:
+        if kind == 'redis':
+            await redis_async.ping()
+        elif kind == 'db':
+            async with db_session():
+                pass
+        return True
+    except Exception as exc:
+        print(f'skipping {kind} benchmarks: {type(exc).__name__}: {exc}')
+        return False
+
+
+async def run(args):
+    selected = args.only.split(',') if args.only else list(BENCHES)
+    available, results = {}, {}
+    for name in selected:
+        fn, needs = BENCHES[name]
+        if needs:
+            if needs not in available:
+                available[needs] = await _reachable(needs)
+            if not available[needs]:
+                continue
+        print(f'running {name}...', flush=True)
+        results.update(await fn(args))
+    await redis_async.aclose()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--only', help=f"comma-separated subset of: {','.join(BENCHES)}")
+    ap.add_argument('--iterations', type=int, default=1000)
+    ap.add_argument('--warmup', type=int, default=20)
+    common.add_output_args(ap)
+    args = ap.parse_args()
+    results = asyncio.run(run(args))
+    common.finish(args, common.meta(kind='micro', iterations=args.iterations, tokenizer=bool(tokens.tiktoken)), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse, asyncio, os, random, sys, time
+
+from sqlalchemy import text as sql_text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench import common  # noqa: E402
+from app.deps import db_session  # noqa: E402
+from app.services import embeddings, retrieval, vector_index  # noqa: E402
+
+# Recall@k and latency of the HNSW index against exact search, per ef_search.
+# Run it after building the index you want to evaluate (migration 0007 or
+# embed_verses.py --defer-index), then again with other VECTOR_INDEX_TYPE /
+# EMBED_DIM / VECTOR_HNSW_* settings, and keep the smallest index whose recall holds:
+#   cd backend && python -m bench.vector_recall --backend local --ef 10,20,40,80,160 --save recall-halfvec-m16
+
+_KNN_SQL = """
+SELECT e.verse_id FROM verse_embeddings e JOIN verses v ON v.id = e.verse_id
+WHERE v.translation = :translation
+ORDER BY e.embedding <=> CAST(:embedding AS {column_type})
+LIMIT :k
+""".format(column_type=vector_index.column_type())
+_SIZE_SQL = """
+SELECT pg_relation_size('verse_embeddings'), pg_relation_size(to_regclass(:index)),
+       (SELECT count(*) FROM verse_embeddings)
+"""
+
+
+async def _knn(embedding, args, ef_search=None):
+    params = {'embedding': retrieval._vector_literal(embedding), 'translation': args.translation, 'k': args.k}
+    async with db_session() as session:
+        if ef_search is None:
+            # Exact: no index scan, so Postgres sorts every distance.
+            await session.execute(sql_text('SET LOCAL enable_indexscan = off'))
+        else:
+            await retrieval.set_hnsw_search(session, ef_search)
+        started = time.perf_counter()
+        ids = (await session.execute(sql_text(_KNN_SQL), params)).scalars().all()
+        return ids, time.perf_counter() - started
+
+
+async def run(args):
+    async with db_session() as session:
+        texts = (await session.execute(sql_text(
+            'SELECT text FROM verses WHERE translation = :t ORDER BY random() LIMIT :n'), {'t': args.translation, 'n': args.queries})).scalars().all()
+        table_bytes, index_bytes, rows = (await session.execute(sql_text(_SIZE_SQL), {'index': vector_index.INDEX_NAME})).one()
+    rng = random.Random(11)
+    # Verse fragments plus the question set: queries near, but not equal to, stored vectors.
+    queries = [' '.join(t.split()[:rng.randint(4, 10)]) for t in texts] + common.QUESTIONS
+    vectors = await embeddings.get_backend(args.backend).embed(queries)
+
+    exact, exact_times = [], []
+    for vec in vectors:
+        ids, elapsed = await _knn(vec, args)
+        exact.append(set(ids))
+        exact_times.append(elapsed)
+    results = {'exact': common.summarize(exact_times, sum(exact_times))}
+
+    for ef in [int(x) for x in args.ef.split(',')]:
+        recalls, times = [], []
+        for vec, truth in zip(vectors, exact):
+            ids, elapsed = await _knn(vec, args, ef_search=max(ef, args.k) if args.clamp else ef)
+            recalls.append(len(truth & set(ids)) / max(1, len(truth)))
+            times.append(elapsed)
+        results[f'ef_search_{ef}'] = {**common.summarize(times, sum(times)), 'recall': round(sum(recalls) / len(recalls), 4)}
+
+    print(f"\n{vector_index.column_type()} m={vector_index.VECTOR_HNSW_M} ef_construction={vector_index.VECTOR_HNSW_EF_CONSTRUCTION}: "
+          f"{rows} rows, table {table_bytes / 2**20:.1f} MiB, index {(index_bytes or 0) / 2**20:.1f} MiB")
+    for name, r in results.items():
+        if 'recall' in r:
+            print(f"{name:<20} recall@{args.k} {r['recall']:.3f}  p50 {r['p50_ms']:.2f} ms  p95 {r['p95_ms']:.2f} ms")
+    return results, {'column_type': vector_index.column_type(), 'm': vector_index.VECTOR_HNSW_M,
+                     'ef_construction': vector_index.VECTOR_HNSW_EF_CONSTRUCTION, 'rows': rows,
+                     'table_bytes': table_bytes, 'index_bytes': index_bytes, 'k': args.k}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--backend', default=embeddings.EMBED_BACKEND, choices=sorted(embeddings.BACKENDS),
+                    help='must match the backend that filled verse_embeddings')
+    ap.add_argument('--translation', default='WEB')
+    ap.add_argument('--queries', type=int, default=200)
+    ap.add_argument('--k', type=int, default=50, help='matches retrieval k_vec')
+    ap.add_argument('--ef', default='10,20,40,80,160,320')
+    ap.add_argument('--clamp', action='store_true', help='raise ef_search to k like retrieval does')
+    common.add_output_args(ap)
+    args = ap.parse_args()
+    results, info = asyncio.run(run(args))
+    common.finish(args, common.meta(kind='vector_recall', **info), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import fakeredis.aioredis
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "scripts", "dev"))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    # One in-memory Redis per test, swapped in for every module that holds the
+    # shared client (and its registered scripts).
+    from app import deps
+
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(deps, "redis_async", client)
+
+    def use(*modules):
+        for module in modules:
+            monkeypatch.setattr(module, "redis_async", client)
+            for name, value in list(vars(module).items()):
+                if name.endswith("_script") and hasattr(value, "script"):
+                    monkeypatch.setattr(module, name, client.register_script(value.script))
+        return client
+
+    return use
@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+
+import numpy as np
+import pytest
+
+from app.services import answer_cache, retrieval
+
+CITATIONS = [{"ref": "John 11:35"}]
+
+
+@pytest.fixture(autouse=True)
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_SEMANTIC", False)
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_REFRESH_S", 0)
+    monkeypatch.setattr(answer_cache, "_index", answer_cache._SemanticIndex())
+    monkeypatch.setattr(answer_cache, "_stats", dict.fromkeys(answer_cache._stats, 0))
+    # A clock that moves 1ms per reading keeps the LRU order deterministic.
+    clock = itertools.count(1_700_000_000_000)
+    monkeypatch.setattr(answer_cache.time, "time", lambda: next(clock) / 1000)
+    return fake_redis(answer_cache)
+
+
+@pytest.fixture
+def semantic(monkeypatch):
+    # Questions embed to fixed unit vectors; "weep" phrasings land close together.
+    vectors = {
+        "why did jesus weep": [1.0, 0.0, 0.0],
+        "why was jesus weeping": [0.98, 0.2, 0.0],
+        "what is grace": [0.0, 1.0, 0.0],
+        "who was moses": [0.0, 0.0, 1.0],
+    }
+
+    async def embed(q):
+        return vectors[answer_cache.normalize(q)]
+
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_SEMANTIC", True)
+    monkeypatch.setattr(retrieval, "embed_query", embed)
+    return vectors
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def store(q, answer="answer", vectors=None):
+    embedding = vectors[answer_cache.normalize(q)] if vectors else None
+    run(answer_cache.store(q, "WEB", answer, CITATIONS, embedding))
+
+
+def key(q):
+    return answer_cache._entry_key(answer_cache.normalize(q), "WEB")
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    store("Why did Jesus weep?", "He loved Lazarus.")
+    cached, embedding = run(answer_cache.lookup("why did jesus WEEP", "WEB"))
+    assert cached == {"q": "why did jesus weep", "answer": "He loved Lazarus.", "citations": CITATIONS}
+    assert embedding is None
+    assert run(answer_cache.lookup("why did jesus weep", "KJV")) == (None, None)
+    assert answer_cache.stats()["hits_exact"] == 1 and answer_cache.stats()["misses"] == 1
+
+
+def test_byte_cap_evicts_least_recently_used(redis, monkeypatch):
+    store("who was moses")
+    size = int(run(redis.get(answer_cache._BYTES_KEY)))
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_MAX_BYTES", 3 * size)
+    store("what is grace")
+    store("who was david")
+    # Reading moses makes grace the least recently used entry.
+    run(answer_cache.lookup("who was moses", "WEB"))
+    store("who was paul")
+
+    assert run(redis.exists(key("what is grace"))) == 0
+    for q in ("who was moses", "who was david", "who was paul"):
+        assert run(redis.exists(key(q))) == 1
+    sizes = run(redis.hgetall(answer_cache._SIZES_KEY))
+    assert set(sizes) == {key("who was moses"), key("who was david"), key("who was paul")}
+    assert int(run(redis.get(answer_cache._BYTES_KEY))) == sum(map(int, sizes.values()))
+    assert answer_cache.stats()["evictions"] == 1
+
+
+def test_restore_replaces_the_entry_without_double_counting(redis):
+    store("who was moses", "short")
+    store("who was moses", "a much longer answer")
+    sizes = run(redis.hgetall(answer_cache._SIZES_KEY))
+    assert list(sizes) == [key("who was moses")]
+    assert int(run(redis.get(answer_cache._BYTES_KEY))) == int(sizes[key("who was moses")])
+
+
+def test_lapsed_entries_are_purged_from_the_bookkeeping(redis):
+    store("who was moses")
+    # Last used well over a TTL ago: Redis expired it, the metadata must follow.
+    run(redis.zadd(answer_cache._LRU_KEY, {key("who was moses"): 0}))
+    store("what is grace")
+    assert run(redis.zrange(answer_cache._LRU_KEY, 0, -1)) == [key("what is grace")]
+    assert list(run(redis.hgetall(answer_cache._SIZES_KEY))) == [key("what is grace")]
+
+
+def test_semantic_hit_returns_the_embedding(semantic):
+    store("why did jesus weep", "He loved Lazarus.", semantic)
+    store("what is grace", "Unmerited favour.", semantic)
+    cached, embedding = run(answer_cache.lookup("Why was Jesus weeping?", "WEB"))
+    assert cached["answer"] == "He loved Lazarus."
+    assert embedding == semantic["why was jesus weeping"]
+    assert answer_cache.stats()["hits_semantic"] == 1
+    cached, embedding = run(answer_cache.lookup("who was moses", "WEB"))
+    assert cached is None and embedding == semantic["who was moses"]
+
+
+def test_index_applies_only_the_new_changes(semantic, redis, monkeypatch):
+    store("why did jesus weep", "wept", semantic)
+    run(answer_cache.lookup("who was moses", "WEB"))  # first use scans the hash
+    assert answer_cache._index.by_translation["WEB"].keys == [key("why did jesus weep")]
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("incremental refresh must not rescan the hash")
+
+    monkeypatch.setattr(redis, "hscan_iter", no_scan)
+    monkeypatch.setattr(redis, "hgetall", no_scan)
+    store("what is grace", "favour", semantic)
+    run(answer_cache.lookup("who was moses", "WEB"))
+    assert sorted(answer_cache._index.by_translation["WEB"].keys) == sorted(
+        [key("why did jesus weep"), key("what is grace")]
+    )
+
+    # Evicting an entry drops its row from every worker's index.
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_MAX_BYTES", 1)
+    store("who was moses", "lawgiver", semantic)
+    run(answer_cache.lookup("why was jesus weeping", "WEB"))
+    assert answer_cache._index.by_translation["WEB"].keys == [key("who was moses")]
+    assert answer_cache.stats()["hits_semantic"] == 0
+
+
+def test_worker_behind_the_trimmed_log_rescans(semantic, redis, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_LOG_MAX", 2)
+    store("why did jesus weep", "wept", semantic)
+    run(answer_cache.lookup("who was moses", "WEB"))
+    store("what is grace", "favour", semantic)
+    store("what is grace", "favour again", semantic)  # -grace, +grace
+    assert run(redis.llen(answer_cache._LOG_KEY)) == 2
+
+    cached, _ = run(answer_cache.lookup("why was jesus weeping", "WEB"))
+    assert cached["answer"] == "wept"
+    assert answer_cache._index.version == int(run(redis.get(answer_cache._VERSION_KEY))) == 4
+    assert len(answer_cache._index.by_translation["WEB"].keys) == 2
+
+
+def test_rows_stay_contiguous_after_removal():
+    rows = answer_cache._Rows(2)
+    for i, name in enumerate("abc"):
+        rows.put(name, np.array([i, 1], dtype=np.float32))
+    rows.remove("a")
+    assert rows.keys == ["c", "b"]
+    assert rows.pos == {"c": 0, "b": 1}
+    assert rows.matrix[:2].tolist() == [[2, 1], [1, 1]]
+    rows.put("d", np.zeros(3, dtype=np.float32))  # wrong dimension
+    assert "d" not in rows.pos
+
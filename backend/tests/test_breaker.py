@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.services import breaker
+
+
+@pytest.fixture(autouse=True)
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(breaker, "LLM_BREAKER_ENABLED", True)
+    monkeypatch.setattr(breaker, "LLM_BREAKER_MIN_CALLS", 4)
+    # Long windows so a test never straddles a window boundary.
+    monkeypatch.setattr(breaker, "LLM_BREAKER_WINDOW_S", 3600)
+    monkeypatch.setattr(breaker, "LLM_BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(breaker, "LLM_BREAKER_OPEN_S", 30)
+    monkeypatch.setattr(breaker, "_open_until", 0.0)
+    monkeypatch.setattr(breaker, "_stats", {"short_circuited": 0, "tripped": 0, "probes": 0})
+    return fake_redis(breaker)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _calls(outcomes):
+    for failed in outcomes:
+        permit = await breaker.acquire()
+        assert permit == breaker.CLOSED
+        await breaker.record(permit, failed, 0.1)
+
+
+def test_stays_closed_below_min_calls_and_failure_rate(redis):
+    async def go():
+        await _calls([True, True, True])  # all failed, but under LLM_BREAKER_MIN_CALLS
+        first = (await breaker.state())["state"]
+        await redis.flushall()
+        await _calls([False] * 5 + [True] * 3)  # 3 of 8 failed
+        return first, (await breaker.state())["state"]
+
+    assert run(go()) == ("closed", "closed")
+
+
+def test_slow_success_counts_as_failure(redis):
+    async def go():
+        for _ in range(4):
+            await breaker.record(breaker.CLOSED, False, breaker.LLM_BREAKER_SLOW_S)
+        return await breaker.state()
+
+    assert run(go())["state"] == "open"
+
+
+def test_trip_open_probe_close(redis):
+    async def go():
+        await _calls([True, False, True, True])
+        assert (await breaker.state())["state"] == "open"
+        assert breaker.recently_open()
+        # Open: every caller is short-circuited.
+        assert await breaker.acquire() is None
+        # The open key expires: half-open admits exactly one probe.
+        await redis.delete("llm:cb:open")
+        probe = await breaker.acquire()
+        assert probe.startswith(breaker.PROBE)
+        assert await breaker.acquire() is None
+        await breaker.record(probe, False, 0.1)
+        state = await breaker.state()
+        return state, await breaker.acquire(), await redis.exists("llm:cb:probe")
+
+    state, permit, probe_left = run(go())
+    assert state["state"] == "closed" and state["tripped"] == 1 and state["probes"] == 1
+    assert permit == breaker.CLOSED
+    assert not probe_left
+
+
+def test_failed_probe_reopens(redis):
+    async def go():
+        await _calls([True] * 4)
+        await redis.delete("llm:cb:open")
+        probe = await breaker.acquire()
+        await breaker.record(probe, True, 0.1)
+        return await breaker.state(), await redis.ttl("llm:cb:open"), await redis.exists("llm:cb:probe")
+
+    state, ttl, probe_left = run(go())
+    assert state["state"] == "open"
+    assert 0 < ttl <= breaker.LLM_BREAKER_OPEN_S
+    assert not probe_left
+
+
+def test_release_only_drops_our_own_probe(redis):
+    async def go():
+        await _calls([True] * 4)
+        await redis.delete("llm:cb:open")
+        probe = await breaker.acquire()
+        await redis.set("llm:cb:probe", "probe:someone-else")
+        await breaker.release(probe)
+        other = await redis.get("llm:cb:probe")
+        await redis.set("llm:cb:probe", probe)
+        await breaker.release(probe)
+        return other, await redis.exists("llm:cb:probe")
+
+    other, left = run(go())
+    assert other == "probe:someone-else"
+    assert not left
+
+
+def test_window_counters_expire(redis):
+    async def go():
+        await _calls([True, False])
+        keys = breaker._window_keys(time.time())[:2]
+        return [await redis.ttl(key) for key in keys]
+
+    assert all(0 < ttl <= 2 * breaker.LLM_BREAKER_WINDOW_S for ttl in run(go()))
+
+
+def test_fails_open_without_redis(monkeypatch):
+    async def down(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(breaker.redis_async, "mget", down)
+    assert run(breaker.acquire()) == breaker.CLOSED
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+import fake_openai
+from app import main
+from app.routers import chat
+from app.services import answer_cache, breaker, conversations, governor, llm, retrieval, singleflight
+
+PASSAGES = [
+    {"translation": "WEB", "book": 19, "chapter": 23, "verse": 1, "text": "The Lord is my shepherd."},
+    {"translation": "WEB", "book": 19, "chapter": 46, "verse": 1, "text": "God is our refuge and strength."},
+    {"translation": "WEB", "book": 40, "chapter": 11, "verse": 28, "text": "Come to me."},
+]
+
+
+@pytest.fixture(scope="module")
+def openai_server():
+    # scripts/dev/fake_openai.py on a real socket, without artificial latency.
+    # Records the client address of every request it serves.
+    peers = []
+
+    async def recording(scope, receive, send):
+        if scope["type"] == "http":
+            peers.append(scope["client"])
+        await fake_openai.app(scope, receive, send)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(recording, host="127.0.0.1", port=port, lifespan="off", ws="none", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(fake_openai, "LATENCY_MS", 0.0)
+        mp.setattr(fake_openai, "JITTER_MS", 0.0)
+        mp.setattr(fake_openai, "TOKEN_DELAY_MS", 0.0)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while not server.started:
+            assert time.monotonic() < deadline, "fake OpenAI server did not start"
+            time.sleep(0.01)
+        yield f"http://127.0.0.1:{port}/v1", peers
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+@pytest.fixture(autouse=True)
+def backend(openai_server, monkeypatch, fake_redis):
+    base_url, peers = openai_server
+    peers.clear()
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+    monkeypatch.setattr(llm, "_client", None)
+    monkeypatch.setattr(breaker, "_open_until", 0.0)
+    monkeypatch.setattr(fake_openai, "ERROR_RATE", 0.0)
+    fake_redis(breaker, governor, singleflight)
+
+    async def no_quota(user_id, today):
+        return False
+
+    async def no_cache(message, translation):
+        return None, None
+
+    async def skip_store(*args):
+        pass
+
+    async def passages(message, translation, embedding=None):
+        return PASSAGES
+
+    recorded = []
+
+    async def record(*args):
+        recorded.append(args)
+
+    monkeypatch.setattr(chat, "_reserve_message", no_quota)
+    monkeypatch.setattr(answer_cache, "lookup", no_cache)
+    monkeypatch.setattr(answer_cache, "store", skip_store)
+    monkeypatch.setattr(retrieval, "retrieve", passages)
+    monkeypatch.setattr(conversations, "record", record)
+    return peers, recorded
+
+
+def run(calls):
+    # One event loop per test, like a worker: the app's OpenAI client lives
+    # for the whole loop and is closed at the end, as the lifespan does.
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://app") as http:
+                return await calls(http)
+        finally:
+            await llm.close_client()
+
+    return asyncio.run(go())
+
+
+def frames(body: str) -> list:
+    # SSE frames as (event, data); every frame must be "event:"/"data:" lines
+    # terminated by a blank line.
+    assert body.endswith("\n\n")
+    events = []
+    for frame in body[:-2].split("\n\n"):
+        event_line, data_line = frame.split("\n")
+        assert event_line.startswith("event: ") and data_line.startswith("data: ")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def _ask(message="How do I find peace?"):
+    return {"user_id": "u1", "message": message}
+
+
+def test_chat_answers_from_the_model(backend):
+    _, recorded = backend
+
+    async def calls(http):
+        return await http.post("/v1/chat", json=_ask())
+
+    resp = run(calls)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["answer"] == fake_openai.REPLY
+    assert [c["verse"] for c in body["citations"]] == [1, 1]
+    assert recorded == [("u1", body["conversation_id"], "How do I find peace?", fake_openai.REPLY)]
+
+
+def test_stream_framing(backend):
+    _, recorded = backend
+
+    async def calls(http):
+        return await http.post("/v1/chat/stream", json=_ask())
+
+    resp = run(calls)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert resp.headers["cache-control"] == "no-cache"
+    events = frames(resp.text)
+    names = [name for name, _ in events]
+    assert names[0] == "citations" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    citations, done = events[0][1], events[-1][1]
+    assert len(citations["citations"]) == 2
+    assert done == {"conversation_id": citations["conversation_id"]}
+    answer = "".join(data["delta"] for name, data in events if name == "token")
+    assert answer == fake_openai.REPLY
+    assert recorded == [("u1", done["conversation_id"], "How do I find peace?", fake_openai.REPLY)]
+
+
+def test_stream_reports_upstream_failure_as_error_event(backend, monkeypatch):
+    _, recorded = backend
+    monkeypatch.setattr(fake_openai, "ERROR_RATE", 1.0)
+
+    async def calls(http):
+        return await http.post("/v1/chat/stream", json=_ask())
+
+    resp = run(calls)
+    assert resp.status_code == 200
+    events = frames(resp.text)
+    assert [name for name, _ in events] == ["citations", "error"]
+    assert events[1][1] == {"status": 502, "detail": "llm_error"}
+    assert recorded == []
+
+
+def test_stream_reports_governor_shed_with_retry_after(backend, monkeypatch):
+    peers, _ = backend
+    monkeypatch.setattr(governor, "LLM_TPM_LIMIT", 1)
+    monkeypatch.setattr(governor, "LLM_GOVERNOR_MAX_WAIT_S", 0.0)
+
+    async def calls(http):
+        await governor.redis_async.set(governor._keys(time.time())["tpm"], 1)
+        return await http.post("/v1/chat/stream", json=_ask())
+
+    events = frames(run(calls).text)
+    assert [name for name, _ in events] == ["citations", "error"]
+    assert events[1][1]["status"] == 503 and events[1][1]["detail"] == "llm_busy"
+    assert 0 < events[1][1]["retry_after"] <= 60
+    # Shed before anything was sent upstream.
+    assert peers == []
+
+
+def test_client_and_connection_are_reused(backend):
+    peers, _ = backend
+
+    async def calls(http):
+        clients = []
+        for path in ("/v1/chat", "/v1/chat/stream", "/v1/chat"):
+            resp = await http.post(path, json=_ask(f"question for {path} {len(clients)}"))
+            assert resp.status_code == 200
+            clients.append(llm.get_client())
+        return clients
+
+    clients = run(calls)
+    assert clients[0] is not None
+    assert all(client is clients[0] for client in clients)
+    # Three completions over one keep-alive connection to the fake server.
+    assert len(peers) == 3
+    assert len(set(peers)) == 1
@@ -0,0 +1,122 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services import conversations
+
+
+class _DB:
+    # The conversations and messages tables, answering conversations.py's statements.
+
+    def __init__(self):
+        self.owners = {}
+        self.messages = []
+        self.fail = False
+
+    @asynccontextmanager
+    async def session(self):
+        yield self
+
+    async def execute(self, stmt, params):
+        if stmt is conversations._USERS_SQL:
+            if self.fail:
+                raise ConnectionError("db down")
+            return None
+        if stmt is conversations._CONVERSATIONS_SQL:
+            for conversation_id, user_id in zip(params["ids"], params["user_ids"]):
+                self.owners.setdefault(conversation_id, user_id)
+            return None
+        if stmt is conversations._MESSAGES_SQL:
+            for i, conversation_id in enumerate(params["conversation_ids"]):
+                if self.owners[conversation_id] == params["user_ids"][i]:
+                    self.messages.append(
+                        (conversation_id,)
+                        + tuple(params[k][i] for k in ("ids", "roles", "contents", "tokens", "created_ats"))
+                    )
+            return None
+        if stmt is conversations._HISTORY_SQL:
+            rows = []
+            if self.owners.get(params["conversation_id"]) == params["user_id"]:
+                rows = [m[1:] for m in self.messages if m[0] == params["conversation_id"]]
+            rows.sort(key=lambda row: row[4], reverse=True)
+            return _Result(rows[: params["limit"]])
+        raise AssertionError(f"unexpected statement {stmt}")
+
+    async def commit(self):
+        pass
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = _DB()
+    monkeypatch.setattr(conversations, "db_session", db.session)
+    monkeypatch.setattr(conversations, "_queue", None)
+    monkeypatch.setattr(conversations, "_pending", {})
+    return db
+
+
+def contents(turns):
+    return [turn["content"] for turn in turns]
+
+
+def test_history_includes_exchanges_not_yet_flushed(db):
+    async def go():
+        await conversations.record("u1", "c1", "q1", "a1")
+        await conversations.flush()
+        await conversations.record("u1", "c1", "q2", "a2")
+        before = await conversations.history("u1", "c1")
+        await conversations.flush()
+        return before, await conversations.history("u1", "c1")
+
+    before, after = asyncio.run(go())
+    assert contents(before) == ["q1", "a1", "q2", "a2"]
+    assert after == before
+    assert conversations._pending == {}
+
+
+def test_pending_exchanges_count_against_the_turn_limit(db):
+    async def go():
+        for n in range(4):
+            await conversations.record("u1", "c1", f"q{n}", f"a{n}")
+        await conversations.record("u1", "c2", "other", "conversation")
+        return await conversations.history("u1", "c1", max_turns=2)
+
+    assert contents(asyncio.run(go())) == ["q2", "a2", "q3", "a3"]
+
+
+def test_pending_exchanges_of_other_users_are_not_shown(db):
+    async def go():
+        await conversations.record("u2", "c1", "not yours", "hidden")
+        return await conversations.history("u1", "c1")
+
+    assert asyncio.run(go()) == []
+
+
+def test_exchange_committed_during_the_read_is_not_duplicated(db):
+    # The writer committed but has not settled the item yet when history reads.
+    async def go():
+        await conversations.record("u1", "c1", "q1", "a1")
+        await conversations._write(list(conversations._pending["c1"]))
+        return await conversations.history("u1", "c1")
+
+    assert contents(asyncio.run(go())) == ["q1", "a1"]
+
+
+def test_failed_flush_keeps_exchanges_visible(db):
+    async def go():
+        await conversations.record("u1", "c1", "q1", "a1")
+        db.fail = True
+        with pytest.raises(ConnectionError):
+            await conversations.flush()
+        return await conversations.history("u1", "c1")
+
+    assert contents(asyncio.run(go())) == ["q1", "a1"]
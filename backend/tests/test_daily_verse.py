@@ -0,0 +1,96 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from app.services import daily_verse
+
+DAY = date(2026, 10, 18)
+POOL = [(19, 23, 1, 1.0), (43, 3, 16, 2.0), (50, 4, 13, 1.0), (40, 11, 28, 4.0)]
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(daily_verse, "DAILY_VERSE_RECENCY_DAYS", 10)
+
+
+def shown(days_ago):
+    return (DAY - timedelta(days=days_ago)).toordinal()
+
+
+def drawn_weights(monkeypatch, last_shown):
+    seen = {}
+
+    class Spy:
+        def __init__(self, seed):
+            seen["seed"] = seed
+
+        def choices(self, population, weights, k):
+            seen["weights"] = weights
+            return population[:k]
+
+    monkeypatch.setattr(daily_verse.random, "Random", Spy)
+    daily_verse.choose(POOL, last_shown, DAY, "dv:WEB:2026-10-18")
+    return seen["weights"]
+
+
+def test_same_seed_draws_the_same_verse():
+    picks = {daily_verse.choose(POOL, {}, DAY, "dv:WEB:2026-10-18") for _ in range(20)}
+    assert len(picks) == 1
+    # Different days (or users) are seeded differently and spread over the pool.
+    assert len({daily_verse.choose(POOL, {}, DAY, f"dv:WEB:{n}") for n in range(200)}) == len(POOL)
+
+
+def test_repeat_penalty_is_age_over_window_squared(monkeypatch):
+    weights = drawn_weights(monkeypatch, {"19:23:1": shown(1), "43:3:16": shown(5), "50:4:13": shown(30)})
+    assert weights == pytest.approx([1.0 * 0.1**2, 2.0 * 0.5**2, 1.0, 4.0])
+
+
+def test_verse_shown_today_is_excluded(monkeypatch):
+    assert drawn_weights(monkeypatch, {"40:11:28": shown(0)})[3] == 0
+
+
+def test_everything_recent_falls_back_to_base_weights(monkeypatch):
+    recent = {daily_verse._ref(entry): shown(0) for entry in POOL}
+    assert drawn_weights(monkeypatch, recent) == [1.0, 2.0, 1.0, 4.0]
+
+
+def test_penalty_shifts_the_draw():
+    # Matthew 11:28 carries half the pool's weight; shown yesterday it is almost never drawn.
+    seeds = [f"dv:WEB:{n}" for n in range(400)]
+    fresh = sum(daily_verse.choose(POOL, {}, DAY, s)[:3] == (40, 11, 28) for s in seeds)
+    penalized = sum(daily_verse.choose(POOL, {"40:11:28": shown(1)}, DAY, s)[:3] == (40, 11, 28) for s in seeds)
+    assert fresh > 150
+    assert penalized < 10
+
+
+def test_precompute_records_the_pick_and_penalizes_it_next_day(fake_redis, monkeypatch):
+    redis = fake_redis(daily_verse)
+    monkeypatch.setattr(daily_verse, "_pools", {"WEB": (float("inf"), POOL[:2])})
+    monkeypatch.setattr(daily_verse, "DAILY_VERSE_POOL_TTL_S", float("inf"))
+
+    async def passage(translation, book, chapter, start, end):
+        return [{"book": book, "chapter": chapter, "verse": start, "text": f"{book}:{chapter}:{start}"}]
+
+    monkeypatch.setattr(daily_verse.verse_store, "fetch_passage", passage)
+
+    async def go():
+        first = await daily_verse.precompute("WEB", DAY)
+        again = await daily_verse.get("WEB", DAY)
+        second = await daily_verse.precompute("WEB", DAY + timedelta(days=1))
+        recent = await redis.zrange(daily_verse._recent_key("WEB", None), 0, -1, withscores=True)
+        return first, again, second, recent
+
+    first, again, second, recent = run(go())
+    assert again == first
+    # With a two-verse pool yesterday's pick keeps (1/10)^2 of its weight.
+    assert second["verse"] != first["verse"]
+    assert dict(recent) == {ref(first["verse"]): DAY.toordinal(), ref(second["verse"]): DAY.toordinal() + 1}
+
+
+def ref(verse):
+    return f"{verse['book']}:{verse['chapter']}:{verse['verse']}"
+
+
+def run(coro):
+    return asyncio.run(coro)
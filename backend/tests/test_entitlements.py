@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.services import entitlements
+
+ACTIVE = {"status": "active", "expires_at": None}
+FREE = {"status": "none", "expires_at": None}
+
+
+@pytest.fixture
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(entitlements, "_local", entitlements._LocalCache(30, 100))
+    return fake_redis(entitlements)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    rows = {}
+
+    async def load(user_id):
+        return rows.get(user_id, FREE)
+
+    monkeypatch.setattr(entitlements, "_load_from_db", load)
+    return rows
+
+
+@pytest.mark.parametrize("legacy", ["active", "1", "[]"])
+def test_lookup_replaces_unparseable_cache_entry(redis, db, legacy):
+    db["u1"] = ACTIVE
+
+    async def go():
+        await redis.set("entitlement:u1", legacy)
+        found = await entitlements.lookup("u1")
+        return found, await redis.get("entitlement:u1"), await redis.ttl("entitlement:u1")
+
+    found, stored, ttl = asyncio.run(go())
+    assert found == ACTIVE
+    assert json.loads(stored) == ACTIVE
+    assert ttl > 0
+
+
+def test_lookup_keeps_a_concurrent_publish(redis, db, monkeypatch):
+    # The row read from Postgres predates a purchase published meanwhile.
+    async def load(user_id):
+        await redis.set("entitlement:u1", json.dumps(ACTIVE))
+        return FREE
+
+    monkeypatch.setattr(entitlements, "_load_from_db", load)
+
+    async def go():
+        await redis.set("entitlement:u1", "active")
+        await entitlements.lookup("u1")
+        return await redis.get("entitlement:u1")
+
+    assert json.loads(asyncio.run(go())) == ACTIVE
+
+
+def test_publish_survives_redis_outage(redis, monkeypatch):
+    async def down(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(redis, "set", down)
+    entitlements._local.set("u1", FREE)
+    asyncio.run(entitlements.publish("u1", ACTIVE))
+    assert entitlements._local.get("u1") is None
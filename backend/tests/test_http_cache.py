@@ -0,0 +1,56 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app import http_cache, metrics
+
+SMALL = {"verse": "Jesus wept."}
+BIG = {"verses": ["In the beginning God created the heavens and the earth."] * 100}
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Same middleware order as app.main: timing outside compression.
+    app = FastAPI()
+    app.add_middleware(http_cache.CompressionMiddleware)
+    app.add_middleware(metrics.TimingMiddleware)
+
+    @app.get("/small")
+    async def small(request: Request):
+        return http_cache.cached_response(request, http_cache.render(SMALL), 60)
+
+    @app.get("/big")
+    async def big(request: Request):
+        return http_cache.cached_response(request, http_cache.render(BIG), 60)
+
+    return TestClient(app)
+
+
+def test_uncompressed_body_revalidates_with_the_same_tag(client):
+    first = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in first.headers
+    etag = first.headers["etag"]
+    again = client.get("/small", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+
+
+def test_compressed_body_keeps_its_suffixed_tag(client):
+    first = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["content-encoding"] == "gzip"
+    etag = first.headers["etag"]
+    assert etag.endswith('-gzip"')
+    again = client.get("/big", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    plain = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] == etag.replace('-gzip"', '"')
+
+
+def test_revalidations_are_labelled_with_their_route(client):
+    etag = client.get("/small", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    client.get("/small", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    exposition = metrics.render_prometheus()
+    assert 'route="/small",status="304"' in exposition
+    assert 'route="unmatched",status="304"' not in exposition
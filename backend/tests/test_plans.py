@@ -0,0 +1,49 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services import plans
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Progress never renders the plan, so it works whatever translations are served.
+    monkeypatch.setattr(plans, "PLAN_TRANSLATIONS", {"KJV"})
+    marked = []
+
+    async def outline(plan_ref):
+        return ("plan-1", 14) if plan_ref in ("john14", "plan-1") else None
+
+    async def rendered(*args):
+        raise AssertionError("progress must not render the plan")
+
+    async def completed(user_id, plan_id):
+        return [day for user, plan, day in marked if (user, plan) == (user_id, plan_id)]
+
+    async def mark(user_id, plan_id, day_number):
+        marked.append((user_id, plan_id, day_number))
+
+    monkeypatch.setattr(plans, "plan_outline", outline)
+    monkeypatch.setattr(plans, "get_plan", rendered)
+    monkeypatch.setattr(plans, "completed_days", completed)
+    monkeypatch.setattr(plans, "mark_complete", mark)
+    return TestClient(main.app), marked
+
+
+def test_progress_by_key_without_rendering(client):
+    http, marked = client
+    assert http.post("/v1/plan/progress", params={"user_id": "u1", "plan_id": "john14", "day_number": 3}).json() == {"ok": True}
+    assert marked == [("u1", "plan-1", 3)]
+    assert http.get("/v1/plan/progress", params={"user_id": "u1", "plan_id": "john14"}).json() == {
+        "plan_id": "plan-1",
+        "completed": [3],
+        "day_count": 14,
+    }
+
+
+@pytest.mark.parametrize("plan_id, day, status", [("john14", 0, 400), ("john14", 15, 400), ("missing", 1, 404)])
+def test_progress_rejects_bad_input(client, plan_id, day, status):
+    http, marked = client
+    resp = http.post("/v1/plan/progress", params={"user_id": "u1", "plan_id": plan_id, "day_number": day})
+    assert resp.status_code == status
+    assert marked == []
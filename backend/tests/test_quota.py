@@ -0,0 +1,158 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from app.services import quota
+
+DAY = date(2026, 10, 18)
+
+
+class _DB:
+    # The quotas table, answering the statements quota.py sends.
+
+    def __init__(self):
+        self.used = {}
+        self.upserts = 0
+
+    @asynccontextmanager
+    async def session(self):
+        yield self
+
+    async def execute(self, stmt, params):
+        if stmt is quota._UPSERT_SQL:
+            self.upserts += 1
+            for row in params:
+                self.used[(row["user_id"], row["date"])] = row["messages_used"]
+            return _Result(None)
+        key = (params["user_id"], params["date"])
+        if stmt is quota._SEED_SQL:
+            return _Result(self.used.get(key))
+        if stmt is quota._DB_CONSUME_SQL:
+            used = self.used.get(key, 0)
+            if used >= params["limit"]:
+                return _Result(None)
+            self.used[key] = used + 1
+            return _Result(used + 1)
+        if stmt is quota._DB_REFUND_SQL:
+            if self.used.get(key, 0) > 0:
+                self.used[key] -= 1
+            return _Result(None)
+        raise AssertionError(f"unexpected statement {stmt}")
+
+    async def commit(self):
+        pass
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = _DB()
+    monkeypatch.setattr(quota, "db_session", db.session)
+    return db
+
+
+@pytest.fixture
+def redis(fake_redis):
+    return fake_redis(quota)
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    async def down(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(quota, "_consume_script", down)
+    monkeypatch.setattr(quota, "_refund_script", down)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def paywalled(coro):
+    with pytest.raises(HTTPException) as exc:
+        run(coro)
+    return exc.value.status_code
+
+
+def test_consume_counts_up_to_the_limit(db, redis):
+    for _ in range(3):
+        assert run(quota.consume("u1", DAY, limit=3))
+    assert paywalled(quota.consume("u1", DAY, limit=3)) == 402
+    assert run(redis.get(quota._counter_key("u1", DAY))) == "3"
+    assert 0 < run(redis.ttl(quota._counter_key("u1", DAY))) <= quota.QUOTA_KEY_TTL_S
+
+
+def test_missing_counter_is_seeded_from_postgres(db, redis):
+    # Redis lost the key (eviction, restart) after two messages were flushed.
+    db.used[("u1", DAY)] = 2
+    assert run(quota.consume("u1", DAY, limit=3))
+    assert paywalled(quota.consume("u1", DAY, limit=3)) == 402
+
+
+def test_counter_without_ttl_gets_one(db, redis):
+    key = quota._counter_key("u1", DAY)
+    run(redis.set(key, 0))
+    run(quota.consume("u1", DAY, limit=3))
+    assert run(redis.ttl(key)) > 0
+
+
+def test_refund_gives_the_message_back_once(db, redis):
+    run(quota.consume("u1", DAY, limit=1))
+    run(quota.refund("u1", DAY))
+    run(quota.refund("u1", DAY))
+    assert run(redis.get(quota._counter_key("u1", DAY))) == "0"
+    assert run(quota.consume("u1", DAY, limit=1))
+
+
+def test_flush_upserts_dirty_counters(db, redis, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_FLUSH_BATCH", 2)
+    for user in ("u1", "u2", "u3"):
+        run(quota.consume(user, DAY, limit=5))
+    run(quota.consume("u1", DAY, limit=5))
+    run(quota.flush())
+    assert db.used == {("u1", DAY): 2, ("u2", DAY): 1, ("u3", DAY): 1}
+    assert db.upserts == 2
+    assert run(redis.scard(quota._DIRTY_KEY)) == 0
+
+
+def test_failed_flush_puts_members_back(db, redis, monkeypatch):
+    run(quota.consume("u1", DAY, limit=5))
+
+    async def broken(rows):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(quota, "_upsert", broken)
+    with pytest.raises(RuntimeError):
+        run(quota.flush())
+    assert run(redis.smembers(quota._DIRTY_KEY)) == {quota._member("u1", DAY)}
+
+
+def test_redis_down_db_policy_counts_in_postgres(db, redis_down, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_REDIS_DOWN_POLICY", "db")
+    assert run(quota.consume("u1", DAY, limit=1))
+    assert paywalled(quota.consume("u1", DAY, limit=1)) == 402
+    run(quota.refund("u1", DAY))
+    assert db.used[("u1", DAY)] == 0
+
+
+def test_redis_down_closed_policy_sheds(db, redis_down, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_REDIS_DOWN_POLICY", "closed")
+    assert paywalled(quota.consume("u1", DAY)) == 503
+
+
+def test_redis_down_open_policy_lets_through_uncounted(db, redis_down, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_REDIS_DOWN_POLICY", "open")
+    assert run(quota.consume("u1", DAY)) is False
+    assert db.used == {}
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import singleflight
+
+
+@pytest.fixture(autouse=True)
+def redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_WAIT_S", 2.0)
+    monkeypatch.setattr(singleflight, "_inflight", {})
+    monkeypatch.setattr(singleflight, "_stats", {"leader": 0, "shared_local": 0, "shared_remote": 0, "fallback": 0})
+    return fake_redis(singleflight)
+
+
+KEY = singleflight.make_key("chat", "WEB", "how do i pray")
+
+
+def test_local_callers_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": 42}
+
+    async def go():
+        return await asyncio.gather(*(singleflight.do(KEY, work) for _ in range(5)))
+
+    assert run(go()) == [{"answer": 42}] * 5
+    assert len(calls) == 1
+    assert singleflight.stats()["leader"] == 1 and singleflight.stats()["shared_local"] == 4
+    assert singleflight._inflight == {}
+
+
+def test_leader_releases_lock_and_publishes_result(redis):
+    async def go():
+        value = await singleflight.do(KEY, _value("v"))
+        return value, await redis.get(f"sf:lock:{KEY}"), await redis.get(f"sf:result:{KEY}")
+
+    value, lock, result = run(go())
+    assert value == "v"
+    assert lock is None
+    assert json.loads(result) == {"value": "v"}
+
+
+def test_remote_waiter_gets_the_leaders_result(redis):
+    # Another worker holds the lock; this one waits on the result channel.
+    async def go():
+        await redis.set(f"sf:lock:{KEY}", "other-worker")
+        waiter = asyncio.create_task(singleflight.do(KEY, _fail))
+        await asyncio.sleep(0.05)
+        await redis.publish(f"sf:done:{KEY}", json.dumps({"value": ["text", []]}))
+        return await waiter
+
+    assert run(go()) == ["text", []]
+    assert singleflight.stats()["shared_remote"] == 1
+
+
+def test_remote_waiter_reads_a_result_stored_before_it_subscribed(redis):
+    async def go():
+        await redis.set(f"sf:lock:{KEY}", "other-worker")
+        await redis.set(f"sf:result:{KEY}", json.dumps({"value": "early"}))
+        return await singleflight.do(KEY, _fail)
+
+    assert run(go()) == "early"
+
+
+def test_remote_http_errors_are_shared(redis):
+    async def go():
+        await redis.set(f"sf:lock:{KEY}", "other-worker")
+        error = {"status_code": 503, "detail": "llm_busy", "headers": {"Retry-After": "5"}}
+        await redis.set(f"sf:result:{KEY}", json.dumps({"error": error}))
+        await singleflight.do(KEY, _fail)
+
+    with pytest.raises(HTTPException) as exc:
+        run(go())
+    assert exc.value.status_code == 503 and exc.value.headers == {"Retry-After": "5"}
+
+
+def test_failed_leader_releases_and_tells_waiters_to_retry(redis):
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def go():
+        with pytest.raises(RuntimeError):
+            await singleflight.do(KEY, broken)
+        return await redis.get(f"sf:lock:{KEY}"), await redis.get(f"sf:result:{KEY}")
+
+    lock, result = run(go())
+    assert lock is None
+    assert json.loads(result) == {"retry": True}
+
+
+def test_waiter_falls_back_when_the_leader_asks_for_retry(redis):
+    async def go():
+        await redis.set(f"sf:lock:{KEY}", "other-worker")
+        await redis.set(f"sf:result:{KEY}", json.dumps({"retry": True}))
+        return await singleflight.do(KEY, _value("mine"))
+
+    assert run(go()) == "mine"
+    assert singleflight.stats()["fallback"] == 1
+
+
+def test_waiter_falls_back_after_timeout(redis, monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_WAIT_S", 0.1)
+
+    async def go():
+        await redis.set(f"sf:lock:{KEY}", "dead-worker")
+        return await singleflight.do(KEY, _value("mine"))
+
+    assert run(go()) == "mine"
+    assert singleflight.stats()["fallback"] == 1
+
+
+def test_lock_of_another_owner_is_not_released(redis):
+    # The leader's lock expired and another worker took it over meanwhile.
+    async def slow():
+        await redis.set(f"sf:lock:{KEY}", "new-owner")
+        return "v"
+
+    async def go():
+        await singleflight.do(KEY, slow)
+        return await redis.get(f"sf:lock:{KEY}")
+
+    assert run(go()) == "new-owner"
+
+
+def _value(value):
+    async def fn():
+        return value
+
+    return fn
+
+
+async def _fail():
+    raise AssertionError("should have used the shared result")
+
+
+def run(coro):
+    return asyncio.run(coro)
@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import make_iap_fixtures
+from app import main
+from app.deps import get_session
+from app.models import Subscription
+from app.services import entitlements, storekit
+
+BUNDLE_ID = "hollychat.Holly"
+
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    out = tmp_path_factory.mktemp("iap")
+    return make_iap_fixtures.build(str(out), bundle_id=BUNDLE_ID), str(out / "root.pem")
+
+
+@pytest.fixture(autouse=True)
+def trusted(fixtures, monkeypatch, fake_redis):
+    _, root = fixtures
+    monkeypatch.setattr(storekit, "IAP_ROOT_CERT_PATHS", root)
+    monkeypatch.setattr(storekit, "IAP_BUNDLE_ID", BUNDLE_ID)
+    storekit.load_trust_roots()
+    fake_redis(storekit, entitlements)
+    yield
+    monkeypatch.setattr(storekit, "_roots", ())
+    storekit._verify_chain.cache_clear()
+
+
+def verify(jws):
+    return asyncio.run(storekit.verify(jws))
+
+
+def rejected(jws):
+    with pytest.raises(HTTPException) as exc:
+        verify(jws)
+    return exc.value.status_code
+
+
+def test_valid_transaction(fixtures):
+    tx = verify(fixtures[0]["active"])
+    assert tx["original_tx_id"] == "2000000000000001"
+    assert tx["product_id"] == "weekly.premium"
+    assert not tx["revoked"]
+    assert datetime.fromisoformat(tx["expires_at"]) > datetime.now(timezone.utc)
+
+
+def test_expired_and_revoked_are_verified_as_such(fixtures):
+    assert datetime.fromisoformat(verify(fixtures[0]["expired"])["expires_at"]) < datetime.now(timezone.utc)
+    assert verify(fixtures[0]["revoked"])["revoked"]
+
+
+@pytest.mark.parametrize("name", ["tampered", "other_bundle", "untrusted_root", "no_marker"])
+def test_rejected_fixtures(fixtures, name):
+    assert rejected(fixtures[0][name]) == 400
+
+
+def _b64(obj):
+    return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "header, claims",
+    [
+        ({"alg": "ES256", "x5c": ["AAAA", "!!!!"]}, {"originalTransactionId": "1"}),
+        ({"alg": "ES256", "x5c": [["nested"], {"a": 1}]}, {"originalTransactionId": "1"}),
+        ({"alg": "ES256", "x5c": "not-a-list"}, {"originalTransactionId": "1"}),
+        ({"alg": "ES256", "x5c": []}, {"originalTransactionId": "1", "expiresDate": "soon"}),
+        ({"alg": "ES256", "x5c": []}, {"originalTransactionId": "1", "expiresDate": 1e300}),
+    ],
+)
+def test_malformed_tokens_are_400(header, claims):
+    assert rejected(f"{_b64(header)}.{_b64(claims)}.c2ln") == 400
+
+
+def test_memo_skips_crypto_for_the_same_token(fixtures, monkeypatch):
+    jws = fixtures[0]["active"]
+    first = verify(jws)
+
+    def fail(*args):
+        raise AssertionError("verified twice")
+
+    monkeypatch.setattr(storekit, "_verify_signature", fail)
+    assert verify(jws) == first
+    # A different token for the same original transaction is not served from the memo.
+    with pytest.raises(AssertionError):
+        verify(fixtures[0]["renewed"])
+
+
+def test_missing_root_fails_loudly(monkeypatch, tmp_path):
+    monkeypatch.setattr(storekit, "IAP_ROOT_CERT_PATHS", str(tmp_path / "missing.cer"))
+    with pytest.raises(RuntimeError):
+        storekit.load_trust_roots()
+
+
+class _Session:
+    # Just enough of AsyncSession for /iap/verify.
+
+    def __init__(self):
+        self.rows = {}
+
+    async def get(self, model, key):
+        return self.rows.get((model, key))
+
+    def add(self, obj):
+        self.rows[(type(obj), getattr(obj, "user_id", None) or obj.id)] = obj
+
+    async def scalar(self, stmt):
+        # Only the "held by another user" lookup of /iap/verify.
+        params = stmt.compile().params
+        for (model, user_id), row in self.rows.items():
+            if model is Subscription and user_id != params["user_id_1"] and row.original_tx_id == params["original_tx_id_1"]:
+                return user_id
+        return None
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def client():
+    session = _Session()
+
+    async def override():
+        yield session
+
+    main.app.dependency_overrides[get_session] = override
+    yield TestClient(main.app), session
+    main.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("name, status", [("active", "active"), ("expired", "expired"), ("revoked", "revoked")])
+def test_verify_endpoint_status(fixtures, client, name, status):
+    http, session = client
+    resp = http.post("/v1/iap/verify", json={"user_id": "u1", "jws": fixtures[0][name]})
+    assert resp.status_code == 200
+    assert resp.json()["status"] == status
+    assert session.rows[(Subscription, "u1")].original_tx_id == json.loads(
+        base64.urlsafe_b64decode(fixtures[0][name].split(".")[1] + "==")
+    )["originalTransactionId"]
+
+
+def test_verify_endpoint_rejects_tampered(fixtures, client):
+    http, _ = client
+    assert http.post("/v1/iap/verify", json={"user_id": "u1", "jws": fixtures[0]["tampered"]}).status_code == 400
+
+
+def test_restore_of_granted_transaction_skips_verification(fixtures, client, monkeypatch):
+    http, _ = client
+    jws = fixtures[0]["active"]
+    assert http.post("/v1/iap/verify", json={"user_id": "u1", "jws": jws}).json()["status"] == "active"
+
+    async def fail(jws):
+        raise AssertionError("verified again")
+
+    monkeypatch.setattr(storekit, "verify", fail)
+    assert http.post("/v1/iap/verify", json={"user_id": "u1", "jws": jws}).json()["status"] == "active"
+
+
+def test_transaction_held_by_another_account_is_refused(fixtures, client):
+    http, session = client
+    jws = fixtures[0]["active"]
+    assert http.post("/v1/iap/verify", json={"user_id": "u1", "jws": jws}).status_code == 200
+    assert http.post("/v1/iap/verify", json={"user_id": "u2", "jws": jws}).status_code == 409
+    assert (Subscription, "u2") not in session.rows
+
+
+def test_app_account_token_must_match_user(fixtures, client):
+    http, session = client
+    jws = fixtures[0]["tagged"]
+    assert http.post("/v1/iap/verify", json={"user_id": "u2", "jws": jws}).status_code == 403
+    assert (Subscription, "u2") not in session.rows
+    owner = make_iap_fixtures.ACCOUNT_TOKEN
+    assert http.post("/v1/iap/verify", json={"user_id": owner, "jws": jws}).json()["status"] == "active"
+
+
+def test_untagged_transactions_need_a_token_when_required(fixtures, client, monkeypatch):
+    http, _ = client
+    monkeypatch.setattr(storekit, "IAP_REQUIRE_ACCOUNT_TOKEN", True)
+    assert http.post("/v1/iap/verify", json={"user_id": "u1", "jws": fixtures[0]["active"]}).status_code == 403
+
+
+def test_app_account_token_for_non_uuid_ids_is_stable():
+    token = storekit.app_account_token("apple-user-1")
+    assert token == storekit.app_account_token("apple-user-1") != storekit.app_account_token("apple-user-2")
+    assert storekit.owned_by({"app_account_token": token.upper()}, "apple-user-1")
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.services import verse_store
+
+ROWS = [
+    (1, 1, 1, "In the beginning God created the heavens and the earth."),
+    (1, 1, 2, "The earth was  formless\nand empty."),
+    (1, 1, 4, "God saw the light, and saw that it was good."),  # verse 3 missing
+    (1, 2, 1, "The heavens, the earth, and all their vast array were finished."),
+    (43, 11, 35, "Jesus wept."),
+    (43, 11, 36, "The Jews therefore said, “See how much affection he had for him!”"),
+]
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(verse_store, "VERSE_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(verse_store, "VERSE_STORE_CHECK_S", 0)
+    monkeypatch.setattr(verse_store, "_stores", {})
+    return tmp_path
+
+
+@pytest.fixture
+def store(store_dir):
+    stats = verse_store.build(iter(ROWS), "WEB", verse_store.snapshot_path("WEB"))
+    assert stats["books"] == 43
+    opened = verse_store.VerseStore(verse_store.snapshot_path("WEB"))
+    yield opened
+    opened.close()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    calls = []
+
+    class Session:
+        async def execute(self, stmt, params):
+            assert stmt is verse_store._PASSAGE_SQL
+            calls.append(params)
+            return Result()
+
+    class Result:
+        def mappings(self):
+            return self
+
+        def all(self):
+            return [{"book": 43, "chapter": 11, "verse": 35, "text": "Jesus wept."}]
+
+    @asynccontextmanager
+    async def session():
+        yield Session()
+
+    monkeypatch.setattr(verse_store, "db_session", session)
+    return calls
+
+
+def test_round_trip_through_the_snapshot(store, db):
+    assert store.translation == "WEB"
+    passage = asyncio.run(verse_store.fetch_passage("WEB", 43, 11, 35, 36))
+    assert passage == [
+        {"book": 43, "chapter": 11, "verse": 35, "text": "Jesus wept."},
+        {"book": 43, "chapter": 11, "verse": 36, "text": ROWS[5][3]},
+    ]
+    assert db == []
+
+
+def test_text_is_whitespace_normalized_and_ranges_are_one_slice(store):
+    assert store.verse(1, 1, 2) == "The earth was formless and empty."
+    assert str(store.range_bytes(1, 1, 1, 2), "utf-8") == f"{ROWS[0][3]} The earth was formless and empty."
+
+
+def test_missing_verses_are_skipped(store):
+    assert store.verse(1, 1, 3) is None
+    assert [v["verse"] for v in store.verses(1, 1, 1, 4)] == [1, 2, 4]
+    assert str(store.range_bytes(1, 1, 2, 4), "utf-8").endswith("empty. God saw the light, and saw that it was good.")
+
+
+@pytest.mark.parametrize(
+    "book, chapter, verse",
+    [(0, 1, 1), (44, 1, 1), (66, 1, 1), (1, 0, 1), (1, 3, 1), (2, 1, 1), (1, 1, 0), (1, 1, 5), (43, 12, 1)],
+)
+def test_out_of_range_references_are_empty(store, book, chapter, verse):
+    assert store.verse(book, chapter, verse) is None
+    assert store.verses(book, chapter, verse, verse) == []
+
+
+def test_ranges_are_clamped_to_the_chapter(store):
+    assert [v["verse"] for v in store.verses(43, 11, 30, 99)] == [35, 36]
+    assert store.range_bytes(1, 1, 5, 9) is None
+    assert store.range_bytes(1, 1, 3, 1) is None
+
+
+def test_falls_back_to_sql_without_a_snapshot(store_dir, db):
+    passage = asyncio.run(verse_store.fetch_passage("KJV", 43, 11, 35, 35))
+    assert passage == [{"book": 43, "chapter": 11, "verse": 35, "text": "Jesus wept."}]
+    assert db == [{"translation": "KJV", "book": 43, "chapter": 11, "start": 35, "end": 35}]
+    assert verse_store.data_version("KJV") == verse_store.VERSES_DATA_VERSION
+
+
+def test_rebuilt_snapshot_is_picked_up(store_dir):
+    path = verse_store.snapshot_path("WEB")
+    verse_store.build(iter(ROWS[:1]), "WEB", path)
+    first = verse_store.get_store("WEB")
+    assert first.verse(43, 11, 35) is None
+
+    verse_store.build(iter(ROWS), "WEB", path)
+    os.utime(path, ns=(first.mtime_ns + 1_000_000, first.mtime_ns + 1_000_000))
+    second = verse_store.get_store("WEB")
+    assert second is not first
+    assert second.verse(43, 11, 35) == "Jesus wept."
+    assert verse_store.data_version("WEB").endswith(str(second.mtime_ns))
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_rejects_files_that_are_not_snapshots(store_dir):
+    path = verse_store.snapshot_path("WEB")
+    with open(path, "wb") as f:
+        f.write(b"HVS0" + bytes(60))
+    with pytest.raises(ValueError):
+        verse_store.VerseStore(path)
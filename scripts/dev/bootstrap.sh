@@ -1,6 +1,8 @@
 #!/usr/bin/env bash
 set -euo pipefail
 echo "[1/6] Setup env"; cp -n .env.example .env || true
+# App Store root for /v1/iap/verify; the API refuses to start without one.
+mkdir -p backend/data/apple; [ -f backend/data/apple/AppleRootCA-G3.cer ] || curl -sSfL -o backend/data/apple/AppleRootCA-G3.cer https://www.apple.com/certificateauthority/AppleRootCA-G3.cer
 echo "[2/6] Docker up"; docker compose up -d --build
 echo "[3/6] DB migrations"; docker compose exec api alembic upgrade head
 echo "[4/6] Seed minimal"; python scripts/etl/seed_minimal.py || true
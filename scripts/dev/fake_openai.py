@@ -0,0 +1,92 @@
+# Minimal OpenAI-compatible server for local runs, load tests and benchmarks.
+#   uvicorn --app-dir scripts/dev fake_openai:app --port 8081
+#   OPENAI_BASE_URL=http://localhost:8081/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+import asyncio, hashlib, json, math, os, random, time, uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "300"))
+JITTER_MS = float(os.getenv("FAKE_OPENAI_JITTER_MS", "50"))
+TOKEN_DELAY_MS = float(os.getenv("FAKE_OPENAI_TOKEN_DELAY_MS", "15"))
+ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0"))
+EMBED_DIM = int(os.getenv("FAKE_OPENAI_EMBED_DIM", "1536"))
+REPLY = ("Scripture offers comfort here. Psalm 23:1 says the Lord is my shepherd, "
+         "and Psalm 46:1 calls God our refuge and strength, a very present help in trouble.")
+
+app = FastAPI(title="fake-openai")
+
+
+async def _latency():
+    await asyncio.sleep(max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000)
+
+
+def _failure():
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse({"error": {"message": "fake overload", "type": "server_error"}}, status_code=503)
+    return None
+
+
+def _usage(prompt, completion):
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o-mini")
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+    words = REPLY.split(" ")
+    await _latency()
+    failure = _failure()
+    if failure is not None:
+        return failure
+    cid, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+
+    if not body.get("stream"):
+        return {
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+            "usage": _usage(prompt_tokens, len(words)),
+        }
+
+    async def chunks():
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(TOKEN_DELAY_MS / 1000)
+        last = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(last)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+def _embed(text, dim):
+    # Deterministic unit vector derived from the text so repeated runs are comparable.
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dim = int(body.get("dimensions") or EMBED_DIM)
+    await _latency()
+    failure = _failure()
+    if failure is not None:
+        return failure
+    data = [{"object": "embedding", "index": i, "embedding": _embed(t, dim)} for i, t in enumerate(inputs)]
+    tokens = sum(len(t) for t in inputs) // 4
+    return {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
@@ -0,0 +1,107 @@
+# Local App Store signing chain and signed StoreKit 2 transactions, for testing
+# /v1/iap/verify offline. Writes root.pem (trust it via IAP_ROOT_CERT_PATHS) and
+# fixtures.json with one JWS per case:
+#   python scripts/dev/make_iap_fixtures.py --out /tmp/iap
+#   IAP_ROOT_CERT_PATHS=/tmp/iap/root.pem IAP_BUNDLE_ID=hollychat.Holly uvicorn app.main:app
+#   curl -s localhost:8000/v1/iap/verify -H 'content-type: application/json' \
+#        -d "{\"user_id\": \"u1\", \"jws\": $(jq .active /tmp/iap/fixtures.json)}"
+import argparse, base64, json, os, time
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.x509.oid import NameOID
+
+LEAF_OID = x509.ObjectIdentifier("1.2.840.113635.100.6.11.1")
+INTERMEDIATE_OID = x509.ObjectIdentifier("1.2.840.113635.100.6.2.1")
+DAY_MS = 24 * 3600 * 1000
+# appAccountToken of the "tagged" fixture; a UUID user id is its own token.
+ACCOUNT_TOKEN = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+def _name(cn):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn), x509.NameAttribute(NameOID.ORGANIZATION_NAME, "HollyProject Dev")])
+
+
+def _cert(subject_key, cn, issuer_key, issuer_cn, ca, marker=None, days=3650):
+    now = datetime.now(timezone.utc)
+    builder = (x509.CertificateBuilder().subject_name(_name(cn)).issuer_name(_name(issuer_cn))
+               .public_key(subject_key.public_key()).serial_number(x509.random_serial_number())
+               .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=days))
+               .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True))
+    if marker is not None:
+        builder = builder.add_extension(x509.UnrecognizedExtension(marker, b"\x05\x00"), critical=False)
+    return builder.sign(issuer_key, hashes.SHA384() if ca else hashes.SHA256())
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _sign(claims, key, x5c):
+    header = {"alg": "ES256", "x5c": [base64.b64encode(c.public_bytes(serialization.Encoding.DER)).decode("ascii") for c in x5c]}
+    signing_input = _b64url(json.dumps(header).encode()) + "." + _b64url(json.dumps(claims).encode())
+    r, s = decode_dss_signature(key.sign(signing_input.encode("ascii"), ec.ECDSA(hashes.SHA256())))
+    return signing_input + "." + _b64url(r.to_bytes(32, "big") + s.to_bytes(32, "big"))
+
+
+def build(out, bundle_id="hollychat.Holly", product_id="weekly.premium"):
+    # Also used by backend/tests/test_storekit.py.
+    os.makedirs(out, exist_ok=True)
+    root_key, int_key, leaf_key = ec.generate_private_key(ec.SECP384R1()), ec.generate_private_key(ec.SECP384R1()), ec.generate_private_key(ec.SECP256R1())
+    root = _cert(root_key, "Dev Root CA", root_key, "Dev Root CA", ca=True)
+    intermediate = _cert(int_key, "Dev WWDR CA", root_key, "Dev Root CA", ca=True, marker=INTERMEDIATE_OID)
+    leaf = _cert(leaf_key, "Dev StoreKit Signing", int_key, "Dev WWDR CA", ca=False, marker=LEAF_OID, days=365)
+    # Valid signature but no App Store marker extension on the leaf.
+    plain_leaf = _cert(leaf_key, "Dev Plain Leaf", int_key, "Dev WWDR CA", ca=False, days=365)
+    # A second CA nobody trusts.
+    rogue_key = ec.generate_private_key(ec.SECP384R1())
+    rogue_root = _cert(rogue_key, "Dev Root CA", rogue_key, "Dev Root CA", ca=True)
+    rogue_int = _cert(int_key, "Dev WWDR CA", rogue_key, "Dev Root CA", ca=True, marker=INTERMEDIATE_OID)
+
+    with open(os.path.join(out, "root.pem"), "wb") as fh:
+        fh.write(root.public_bytes(serialization.Encoding.PEM))
+
+    now_ms = int(time.time() * 1000)
+    chain = [leaf, intermediate, root]
+
+    def claims(tx, original="2000000000000001", expires=now_ms + 7 * DAY_MS, **extra):
+        return {"transactionId": tx, "originalTransactionId": original, "bundleId": bundle_id, "productId": product_id,
+                "type": "Auto-Renewable Subscription", "purchaseDate": now_ms - DAY_MS, "originalPurchaseDate": now_ms - DAY_MS,
+                "expiresDate": expires, "environment": "Sandbox", "signedDate": now_ms, **extra}
+
+    active = _sign(claims("2000000000000001"), leaf_key, chain)
+    header, payload, signature = active.split(".")
+    forged_claims = claims("2000000000000001", expires=now_ms + 365 * DAY_MS)
+    fixtures = {
+        "active": active,
+        # Same original transaction, later renewal: a new token, verified in full.
+        "renewed": _sign(claims("2000000000000002", expires=now_ms + 14 * DAY_MS), leaf_key, chain),
+        "expired": _sign(claims("2000000000000003", original="2000000000000003", expires=now_ms - DAY_MS), leaf_key, chain),
+        "revoked": _sign(claims("2000000000000004", original="2000000000000004", revocationDate=now_ms), leaf_key, chain),
+        "other_bundle": _sign({**claims("2000000000000005", original="2000000000000005"), "bundleId": "com.example.other"}, leaf_key, chain),
+        # Payload swapped after signing.
+        "tampered": f"{header}.{_b64url(json.dumps(forged_claims).encode())}.{signature}",
+        "untrusted_root": _sign(claims("2000000000000006", original="2000000000000006"), leaf_key, [leaf, rogue_int, rogue_root]),
+        "no_marker": _sign(claims("2000000000000007", original="2000000000000007"), leaf_key, [plain_leaf, intermediate, root]),
+        "tagged": _sign(claims("2000000000000008", original="2000000000000008", appAccountToken=ACCOUNT_TOKEN), leaf_key, chain),
+    }
+    with open(os.path.join(out, "fixtures.json"), "w") as fh:
+        json.dump(fixtures, fh, indent=2)
+    return fixtures
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default="scripts/dev/iap_fixtures")
+    ap.add_argument("--bundle-id", default="hollychat.Holly")
+    ap.add_argument("--product-id", default="weekly.premium")
+    args = ap.parse_args()
+    fixtures = build(args.out, args.bundle_id, args.product_id)
+    print(f"wrote {args.out}/root.pem and {len(fixtures)} fixtures to {args.out}/fixtures.json")
+
+
+if __name__ == "__main__":
+    main()